@@ -1,19 +1,78 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, g
 import pandas as pd
+import numpy as np
 import os
 import tempfile
 import traceback
 import json
+import time
+import zlib
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from your_cleaning_script import NoonCleaner, AmazonCleaner, RevibeCleaner, TalabatCleaner, CareemCleaner
+from your_cleaning_script import CLEANERS, READ_ENGINES, EXPORT_FORMATS, CLEANER_VERSION, clean_file, combine_cleaned, write_frame, product_version
+from job_queue import JobQueue, QueueFull
+from result_store import ResultStore, ResultCache
+from product_catalog import PRODUCT_COLUMNS, get_product_catalog
+from product_store import get_product_store
+from comment_store import CommentNotFound, get_comment_store
+import metrics
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
 app.config['PRODUCT_CSV'] = 'product.csv'
+# SQLite product store used instead of PRODUCT_CSV when set (e.g. 'product.db'), seeded from PRODUCT_CSV on creation
+app.config['PRODUCT_DB'] = None
+# Rows read per chunk by the streaming bulk product import
+app.config['BULK_CHUNK_ROWS'] = 10000
 app.config['COMMENTS_JSON'] = 'comments.json'
+# Comment changes journaled beside COMMENTS_JSON before they are folded into it
+app.config['COMMENTS_COMPACT_EVERY'] = 200
+# Top-level comments / replies per page of /api/comments and /api/comments/<id>/replies
+app.config['COMMENTS_PAGE_SIZE'] = 10
+app.config['COMMENTS_MAX_LIMIT'] = 100
+# Keep cleaned data as categoricals / arrow strings (can be set per request with 'compact')
+app.config['COMPACT_DTYPES'] = False
+# CSV reader: 'c' (pandas) or 'pyarrow' (multithreaded, falls back to 'c'); per request with 'engine'
+app.config['READ_ENGINE'] = 'c'
+# Processes cleaning the files of a batch upload (one per available core)
+app.config['BATCH_WORKERS'] = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+# Run /api/clean as a background job and return a job id (per request with 'async')
+app.config['ASYNC_CLEAN'] = False
+# Background job worker processes and how many queued + running jobs are accepted
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_QUEUE_DEPTH'] = 20
+# Cleaned sessions: spill directory shared by all workers, per-worker memory LRU, disk limit, idle TTL
+app.config['RESULT_STORE_DIR'] = os.path.join(tempfile.gettempdir(), 'cleaned_results')
+app.config['RESULT_STORE_MAX_SESSIONS'] = 20
+app.config['RESULT_STORE_MAX_BYTES'] = 512 * 1024 * 1024  # 512MB
+app.config['RESULT_STORE_DISK_BYTES'] = 2 * 1024 * 1024 * 1024  # 2GB
+app.config['RESULT_STORE_TTL'] = 2 * 60 * 60  # seconds
+# Reuse the session of an identical earlier upload (per request with 'cache'); entries kept and their lifetime
+app.config['RESULT_CACHE'] = True
+app.config['RESULT_CACHE_MAX_ENTRIES'] = 500
+app.config['RESULT_CACHE_TTL'] = 24 * 60 * 60  # seconds
+# Rows in the first page of /api/clean and per window of /api/sessions/<id>/rows by default
+app.config['ROWS_PAGE_SIZE'] = 100
+app.config['ROWS_MAX_LIMIT'] = 1000
+# Sorted row orders kept for windowed reads (one per session + column + direction)
+app.config['SORT_CACHE_SIZE'] = 16
+# Downloads stream about this many rows per chunk, gzip-encoded for clients that accept it
+app.config['DOWNLOAD_CHUNK_ROWS'] = 20000
+app.config['DOWNLOAD_GZIP'] = True
+# Least confidence of an approximate SKU match during enrichment, e.g. 0.8 (per request with 'sku_match');
+# None fills only exact SKUs, as the cleaners always did
+app.config['SKU_MATCH_MIN_CONFIDENCE'] = None
+# Approximately matched SKUs listed in a /api/clean response (the counts cover all of them)
+app.config['SKU_MATCH_REPORT_LIMIT'] = 100
+# Time cleaning stages and requests and serve them at /metrics (off: nothing is measured)
+app.config['METRICS_ENABLED'] = True
 
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 
@@ -21,42 +80,232 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_cleaner_class(marketplace):
-    cleaners = {
-        'Noon': NoonCleaner,
-        'Amazon': AmazonCleaner,
-        'Revibe': RevibeCleaner,
-        'Talabat': TalabatCleaner,
-        'Careem': CareemCleaner
+    return CLEANERS.get(marketplace)
+
+def form_flag(name, default):
+    return request.form.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+def get_clean_options():
+    """compact / engine / sku_match for a cleaning request (form fields, else config), ValueError when invalid"""
+    compact = form_flag('compact', app.config['COMPACT_DTYPES'])
+    engine = request.form.get('engine', app.config['READ_ENGINE'])
+    if engine not in READ_ENGINES:
+        raise ValueError(f'Invalid read engine. Allowed: {", ".join(READ_ENGINES)}')
+    sku_match = request.form.get('sku_match')
+    if sku_match is None:
+        sku_match = app.config['SKU_MATCH_MIN_CONFIDENCE']
+    elif sku_match.strip().lower() in ('', 'off', 'none'):
+        sku_match = None
+    else:
+        try:
+            sku_match = float(sku_match)
+            valid = 0 < sku_match <= 1
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError("sku_match must be a number between 0 and 1, or 'off'")
+    return compact, engine, sku_match
+
+_clean_pool = None
+
+def get_clean_pool():
+    """Process pool for batch cleaning, started on first use"""
+    global _clean_pool
+    if _clean_pool is None:
+        _clean_pool = ProcessPoolExecutor(max_workers=app.config['BATCH_WORKERS'])
+    return _clean_pool
+
+def reset_clean_pool():
+    """Drop a broken pool so the next batch starts a new one"""
+    global _clean_pool
+    if _clean_pool is not None:
+        _clean_pool.shutdown(wait=False, cancel_futures=True)
+        _clean_pool = None
+
+_job_queue = None
+
+def product_source():
+    """Product master path: the SQLite store when PRODUCT_DB is set, else product.csv"""
+    if not app.config['PRODUCT_DB']:
+        return app.config['PRODUCT_CSV']
+    get_product_store(app.config['PRODUCT_DB'], seed_csv=app.config['PRODUCT_CSV'])
+    return app.config['PRODUCT_DB']
+
+def get_job_queue():
+    """Background cleaning queue, started on first use"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(workers=app.config['JOB_WORKERS'], max_pending=app.config['JOB_QUEUE_DEPTH'],
+                              on_done=store_job_result)
+    return _job_queue
+
+def store_job_result(job, data, memory_report, match_report):
+    """Hand a finished job's frame to the download flow"""
+    session_id = store_cleaned_data(data, job['marketplace'])
+    sku_matches = match_summary(match_report)
+    cache_key = job['context'].get('cache_key')
+    if cache_key:
+        get_result_cache().put(cache_key, session_id, memory_report=memory_report, sku_matches=sku_matches)
+    return {
+        'session_id': session_id,
+        'page_size': app.config['ROWS_PAGE_SIZE'],
+        'columns': data.columns.tolist(),
+        'rows_count': len(data),
+        'memory_report': memory_report,
+        'sku_matches': sku_matches,
+        'filename': f"Cleaned_{job['marketplace']}_Data.csv",
+        'cache_hit': False
     }
-    return cleaners.get(marketplace)
 
-def load_comments():
-    """Load comments from JSON file"""
-    try:
-        if os.path.exists(app.config['COMMENTS_JSON']):
-            with open(app.config['COMMENTS_JSON'], 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except:
-        pass
-    return {"comments": []}
-
-def save_comments(data):
-    """Save comments to JSON file"""
-    try:
-        with open(app.config['COMMENTS_JSON'], 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        return True
-    except:
-        return False
+_result_store = None
+
+def get_result_store():
+    """Store for cleaned sessions, created on first use"""
+    global _result_store
+    if _result_store is None:
+        _result_store = ResultStore(
+            app.config['RESULT_STORE_DIR'],
+            max_sessions=app.config['RESULT_STORE_MAX_SESSIONS'],
+            max_bytes=app.config['RESULT_STORE_MAX_BYTES'],
+            disk_bytes=app.config['RESULT_STORE_DISK_BYTES'],
+            ttl=app.config['RESULT_STORE_TTL']
+        )
+    return _result_store
+
+_result_cache = None
+
+def get_result_cache():
+    """Upload hash -> session cache on top of the result store"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(get_result_store(), max_entries=app.config['RESULT_CACHE_MAX_ENTRIES'],
+                                    ttl=app.config['RESULT_CACHE_TTL'])
+    return _result_cache
+
+def result_cache_key(path, marketplace, compact, sku_match=None):
+    """Cache key of an upload: content hash, marketplace, options, cleaner and product master versions"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return ResultCache.make_key(digest.hexdigest(), marketplace, compact, sku_match, CLEANER_VERSION,
+                                product_version(product_source()))
+
+def match_summary(report):
+    """SKU match counts and the first approximate matches of a clean, None without enrichment"""
+    if report is None:
+        return None
+    limit = app.config['SKU_MATCH_REPORT_LIMIT']
+    return dict(report, matches=report['matches'][:limit], truncated=len(report['matches']) > limit)
+
+def clean_response(session_id, data, marketplace, memory_report, cache_hit, sku_matches=None):
+    """Body of a successful /api/clean - metadata and the first page"""
+    page_size = app.config['ROWS_PAGE_SIZE']
+    return {
+        'success': True,
+        'preview': frame_records(data.iloc[:page_size]),  # First page
+        'page_size': page_size,
+        'columns': data.columns.tolist(),
+        'rows_count': len(data),
+        'session_id': session_id,
+        'memory_report': memory_report,
+        'sku_matches': sku_matches,
+        'filename': f"Cleaned_{marketplace}_Data.csv",
+        'cache_hit': cache_hit
+    }
+
+def store_cleaned_data(data, marketplace):
+    """Keep a cleaned frame for download and windowed reads -> session_id"""
+    return get_result_store().put(data, {
+        'columns': data.columns.tolist(),
+        'marketplace': marketplace,
+        'timestamp': datetime.now().isoformat()
+    })
+
+def frame_records(data):
+    """JSON-ready rows of a frame (NaT, which jsonify rejects, as '')"""
+    return [{key: ('' if value is pd.NaT else value) for key, value in row.items()}
+            for row in data.to_dict('records')]
+
+def csv_chunks(data, chunk_rows):
+    """
+    data.to_csv(index=False) in pieces. to_csv formats rows in blocks of
+    100000 // columns (datetimes get one format per block), so chunks are cut
+    on those blocks to give exactly the same text as one call.
+    """
+    block = (100000 // (len(data.columns) or 1)) or 1
+    chunk_rows = max(1, chunk_rows // block) * block
+    for start in range(0, max(len(data), 1), chunk_rows):
+        yield data.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+_sort_orders = OrderedDict()
+
+def mixed_sort_order(values, descending):
+    """
+    Row positions of a text column: values that read as numbers by value
+    ('9' before '10'), then the rest as text, blanks last either way
+    """
+    values = values.astype(object)
+    numbers = pd.to_numeric(values, errors='coerce')
+    is_number = numbers.notna().to_numpy()
+    blank = (values.isna() | (values == '')).to_numpy() & ~is_number
+    ascending = not descending
+    number_order = numbers[is_number].sort_values(ascending=ascending, kind='stable').index.to_numpy()
+    text_order = values[~is_number & ~blank].astype(str).sort_values(ascending=ascending, kind='stable').index.to_numpy()
+    groups = [number_order, text_order] if ascending else [text_order, number_order]
+    return np.concatenate(groups + [np.flatnonzero(blank)])
+
+def get_sort_order(session_id, data, column, descending):
+    """Row positions of a session sorted on one column, cached for the next windows"""
+    key = (session_id, column, descending)
+    if key in _sort_orders:
+        _sort_orders.move_to_end(key)
+        return _sort_orders[key]
+    values = data[column].reset_index(drop=True)
+    if values.dtype == object or isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        # Read as text, so QTY as '2' and 2 or '' next to numbers sort by number first
+        order = mixed_sort_order(values, descending)
+    else:
+        order = values.sort_values(ascending=not descending, kind='stable', na_position='last').index.to_numpy()
+    _sort_orders[key] = order
+    while len(_sort_orders) > app.config['SORT_CACHE_SIZE']:
+        _sort_orders.popitem(last=False)
+    return order
+
+def get_comments_store():
+    """Comment store shared by this worker's requests"""
+    return get_comment_store(app.config['COMMENTS_JSON'], compact_every=app.config['COMMENTS_COMPACT_EVERY'])
+
+@app.before_request
+def start_request_timer():
+    metrics.enable(app.config['METRICS_ENABLED'])
+    if app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Request latency by route pattern (a streamed download counts until its first byte)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
 
 # ============ ROUTES ============
 
 @app.route('/')
 def home():
-    comments_data = load_comments()
-    # Sort comments by timestamp (newest first)
-    comments_data["comments"].sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    return render_template('index.html', comments=comments_data["comments"])
+    # Comments are paged in by home.js from /api/comments
+    return render_template('index.html')
 
 @app.route('/cleaning')
 def cleaning():
@@ -64,28 +313,17 @@ def cleaning():
 
 @app.route('/add-data')
 def add_data():
-    # Read product data for filters
+    # Product data for filters (in memory, re-read only when product.csv changes)
     try:
-        if os.path.exists(app.config['PRODUCT_CSV']):
-            df = pd.read_csv(app.config['PRODUCT_CSV'])
-            product_count = len(df)
-            
-            # Get unique values for filters
-            brands = sorted(df['Brand'].dropna().unique().tolist()) if 'Brand' in df.columns else []
-            categories = sorted(df['Category'].dropna().unique().tolist()) if 'Category' in df.columns else []
-            sub_categories = sorted(df['Sub-Category'].dropna().unique().tolist()) if 'Sub-Category' in df.columns else []
-            skus = sorted(df['SKU'].dropna().unique().tolist()) if 'SKU' in df.columns else []
-            
-        else:
-            product_count = 0
-            brands = categories = sub_categories = skus = []
-            
+        catalog = get_product_catalog(product_source())
+        filters = catalog.filters()
+        
         return render_template('add_data.html', 
-                             product_count=product_count,
-                             brands=brands,
-                             categories=categories,
-                             sub_categories=sub_categories,
-                             skus=skus)
+                             product_count=len(catalog.df),
+                             brands=filters['brands'],
+                             categories=filters['categories'],
+                             sub_categories=filters['sub_categories'],
+                             skus=filters['skus'])
                              
     except Exception as e:
         print(f"Error in add-data route: {e}")
@@ -98,24 +336,42 @@ def add_data():
 
 # ============ API ENDPOINTS ============
 
-# Store cleaned data in memory
-cleaned_data_store = {}
-
 # ================================================ Comments API ===========================================
 
 # Comments API with replies
 @app.route('/api/comments', methods=['GET'])
 def get_comments():
-    """Get all comments with replies"""
+    """A page of top-level comments, newest first: ?limit=10&cursor=<next_cursor>"""
+    return comments_page()
+
+@app.route('/api/comments/<comment_id>/replies', methods=['GET'])
+def get_replies(comment_id):
+    """A page of the direct replies to a comment, newest first: ?limit=10&cursor=<next_cursor>"""
+    return comments_page(comment_id)
+
+def comments_page(parent_id=None):
     try:
-        comments_data = load_comments()
+        try:
+            limit = int(request.args.get('limit', app.config['COMMENTS_PAGE_SIZE']))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        if not 1 <= limit <= app.config['COMMENTS_MAX_LIMIT']:
+            return jsonify({'error': f"limit must be between 1 and {app.config['COMMENTS_MAX_LIMIT']}"}), 400
         
-        # Sort comments by timestamp (newest first)
-        comments_data["comments"].sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        store = get_comments_store()
+        try:
+            # Each comment has reply_count; its replies come from /api/comments/<id>/replies
+            comments, next_cursor = store.page(limit, request.args.get('cursor'), parent_id)
+        except CommentNotFound:
+            return jsonify({'error': 'Comment not found'}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'comments': comments_data.get("comments", [])
+            'comments': comments,
+            'next_cursor': next_cursor,
+            'total': store.count()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -132,51 +388,20 @@ def add_comment():
         if not name or not comment:
             return jsonify({'error': 'Name and comment are required'}), 400
         
-        comments_data = load_comments()
-        
-        # Generate unique ID
-        import uuid
-        comment_id = str(uuid.uuid4())[:8]
-        
-        new_comment = {
-            'id': comment_id,
-            'parent_id': parent_id,
-            'name': name,
-            'comment': comment,
-            'timestamp': datetime.now().isoformat(),
-            'date': datetime.now().strftime('%d %b %Y'),
-            'time': datetime.now().strftime('%I:%M %p'),
-            'replies': []  # Initialize empty replies array
-        }
-        
-        if not parent_id:
-            # Top-level comment
-            comments_data["comments"].insert(0, new_comment)
-        else:
-            # Find parent comment and add reply
-            def find_and_add_reply(comments, parent_id, reply):
-                for comment in comments:
-                    if comment['id'] == parent_id:
-                        if 'replies' not in comment:
-                            comment['replies'] = []
-                        comment['replies'].insert(0, reply)
-                        return True
-                    elif 'replies' in comment and comment['replies']:
-                        if find_and_add_reply(comment['replies'], parent_id, reply):
-                            return True
-                return False
-            
-            if not find_and_add_reply(comments_data["comments"], parent_id, new_comment):
-                return jsonify({'error': 'Parent comment not found'}), 404
-        
-        if save_comments(comments_data):
-            return jsonify({
-                'success': True,
-                'message': 'Comment added successfully',
-                'comment': new_comment
-            })
-        else:
+        # Top-level comment, or a reply when parent_id is set (found through the id index)
+        try:
+            new_comment = get_comments_store().add(name, comment, parent_id)
+        except CommentNotFound:
+            return jsonify({'error': 'Parent comment not found'}), 404
+        except OSError as e:
+            print(f"Error saving comment: {e}")
             return jsonify({'error': 'Failed to save comment'}), 500
+        
+        return jsonify({
+            'success': True,
+            'message': 'Comment added successfully',
+            'comment': new_comment
+        })
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -185,33 +410,16 @@ def add_comment():
 def delete_comment(comment_id):
     """Delete a comment or reply"""
     try:
-        comments_data = load_comments()
-        
-        def delete_comment_recursive(comments, comment_id):
-            for i, comment in enumerate(comments):
-                if comment['id'] == comment_id:
-                    # Check if it has replies
-                    if 'replies' in comment and comment['replies']:
-                        # Mark as deleted instead of removing
-                        comment['deleted'] = True
-                        comment['name'] = '[Deleted]'
-                        comment['comment'] = 'This comment has been deleted'
-                    else:
-                        # Remove if no replies
-                        del comments[i]
-                    return True
-                elif 'replies' in comment and comment['replies']:
-                    if delete_comment_recursive(comment['replies'], comment_id):
-                        return True
-            return False
-        
-        if delete_comment_recursive(comments_data["comments"], comment_id):
-            if save_comments(comments_data):
-                return jsonify({'success': True, 'message': 'Comment deleted successfully'})
-            else:
-                return jsonify({'error': 'Failed to save changes'}), 500
-        else:
+        # Removed, or kept as a '[Deleted]' placeholder when it has replies
+        try:
+            get_comments_store().delete(comment_id)
+        except CommentNotFound:
             return jsonify({'error': 'Comment not found'}), 404
+        except OSError as e:
+            print(f"Error deleting comment: {e}")
+            return jsonify({'error': 'Failed to save changes'}), 500
+        
+        return jsonify({'success': True, 'message': 'Comment deleted successfully'})
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -235,6 +443,11 @@ def clean_data():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Allowed: csv, xlsx, xls'}), 400
         
+        try:
+            compact, engine, sku_match = get_clean_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Save uploaded file temporarily
         file_ext = file.filename.rsplit('.', 1)[1].lower()
         temp_input = tempfile.NamedTemporaryFile(delete=False, suffix='.' + file_ext)
@@ -246,39 +459,56 @@ def clean_data():
         if not cleaner_class:
             return jsonify({'error': f'Cleaner for {marketplace} not found'}), 400
         
+        # Same file, marketplace, cleaner code and product.csv as an earlier upload - reuse its session
+        cache_key = None
+        if form_flag('cache', app.config['RESULT_CACHE']):
+            cache_key = result_cache_key(temp_input.name, marketplace, compact, sku_match)
+            cached = get_result_cache().get(cache_key)
+            if cached is not None:
+                os.unlink(temp_input.name)
+                entry, (data, meta) = cached
+                return jsonify(clean_response(entry['session_id'], data, marketplace, entry.get('memory_report'), True,
+                                              entry.get('sku_matches')))
+        
+        if form_flag('async', app.config['ASYNC_CLEAN']):
+            # Queue it and answer now - poll /api/jobs/<job_id> for progress
+            try:
+                job_id = get_job_queue().submit(cleaner_class, temp_input.name, marketplace, file.filename,
+                                                compact=compact, engine=engine, master_path=product_source(),
+                                                sku_match=sku_match, context={'cache_key': cache_key})
+            except QueueFull as e:
+                os.unlink(temp_input.name)
+                return jsonify({'error': f'Cleaning queue is full ({e}), try again later'}), 503
+            except Exception:
+                # Not queued, so no job will delete the upload
+                os.unlink(temp_input.name)
+                raise
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/api/jobs/{job_id}',
+                'cache_hit': False
+            }), 202
+        
         try:
             # Process the file
-            cleaner = cleaner_class(temp_input.name)
+            cleaner = cleaner_class(temp_input.name, compact=compact, engine=engine, master_path=product_source(),
+                                    sku_match=sku_match)
             cleaner.clean()
             
-            # Get all data
-            all_data = cleaner.data.to_dict('records')
-            columns = cleaner.data.columns.tolist()
-            
             # Clean up temp file
             os.unlink(temp_input.name)
             
-            # Generate unique ID for this cleaning session
-            import uuid
-            session_id = str(uuid.uuid4())
+            # Store under a new session - the rest is read in windows from /api/sessions/<id>/rows
+            session_id = store_cleaned_data(cleaner.data, marketplace)
+            sku_matches = match_summary(cleaner.match_report)
+            if cache_key:
+                get_result_cache().put(cache_key, session_id, memory_report=cleaner.memory_report,
+                                       sku_matches=sku_matches)
             
-            # Store in memory
-            cleaned_data_store[session_id] = {
-                'data': all_data,
-                'columns': columns,
-                'marketplace': marketplace,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            return jsonify({
-                'success': True,
-                'preview': all_data[:50],  # First 50 rows for preview
-                'all_data': all_data,      # All rows for download
-                'columns': columns,
-                'rows_count': len(all_data),
-                'session_id': session_id,
-                'filename': f"Cleaned_{marketplace}_Data.csv"
-            })
+            return jsonify(clean_response(session_id, cleaner.data, marketplace, cleaner.memory_report, False,
+                                          sku_matches))
             
         except Exception as e:
             # Clean up temp file on error
@@ -291,61 +521,226 @@ def clean_data():
         print(f"Error: {e}\nTrace: {error_trace}")
         return jsonify({'error': str(e), 'trace': error_trace}), 500
 
-@app.route('/api/download/<session_id>', methods=['GET'])
-def download_cleaned(session_id):
+@app.route('/api/clean/batch', methods=['POST'])
+def clean_batch():
+    """
+    Clean many files at once on the process pool. Form fields: 'files' (many),
+    'marketplaces' (one per file) or a single 'marketplace' for all of them.
+    """
+    temp_paths = []
     try:
-        if session_id not in cleaned_data_store:
+        files = [file for file in request.files.getlist('files') if file.filename]
+        if not files:
+            return jsonify({'error': 'No files uploaded'}), 400
+        
+        marketplaces = request.form.getlist('marketplaces') or [request.form.get('marketplace')] * len(files)
+        if len(marketplaces) != len(files):
+            return jsonify({'error': 'Give one marketplace per file'}), 400
+        
+        try:
+            compact, engine, sku_match = get_clean_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        for file, marketplace in zip(files, marketplaces):
+            if not marketplace or not get_cleaner_class(marketplace):
+                return jsonify({'error': f'No cleaner for {file.filename} (marketplace: {marketplace})'}), 400
+            if not allowed_file(file.filename):
+                return jsonify({'error': f'Invalid file type: {file.filename}. Allowed: csv, xlsx, xls'}), 400
+        
+        # Save uploads for the workers
+        for file in files:
+            file_ext = file.filename.rsplit('.', 1)[1].lower()
+            temp_input = tempfile.NamedTemporaryFile(delete=False, suffix='.' + file_ext)
+            file.save(temp_input.name)
+            temp_input.close()
+            temp_paths.append(temp_input.name)
+        
+        # Files are already cleaned in parallel, so sheets are read in each worker
+        start = time.perf_counter()
+        pool = get_clean_pool()
+        futures = [pool.submit(metrics.collected, metrics.enabled(), clean_file, get_cleaner_class(marketplace),
+                               path, compact, engine, sheet_workers=1, master_path=product_source(),
+                               sku_match=sku_match)
+                   for marketplace, path in zip(marketplaces, temp_paths)]
+        
+        results = []
+        frames = []
+        for file, marketplace, future in zip(files, marketplaces, futures):
+            result = {'filename': file.filename, 'marketplace': marketplace}
+            try:
+                (data, memory_report, seconds, match_report), records = future.result()
+                metrics.replay(records)
+                session_id = store_cleaned_data(data, marketplace)
+                result.update({
+                    'success': True,
+                    'session_id': session_id,
+                    'preview': frame_records(data.iloc[:50]),
+                    'columns': data.columns.tolist(),
+                    'rows_count': len(data),
+                    'seconds': round(seconds, 3),
+                    'memory_report': memory_report,
+                    'sku_matches': match_summary(match_report)
+                })
+                frames.append(data)
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    reset_clean_pool()
+                print(f"Error cleaning {file.filename}: {e}")
+                result.update({'success': False, 'error': str(e)})
+            results.append(result)
+        
+        combined = None
+        if frames:
+            combined_data = combine_cleaned(frames)
+            session_id = store_cleaned_data(combined_data, 'Batch')
+            combined = {
+                'session_id': session_id,
+                'columns': combined_data.columns.tolist(),
+                'rows_count': len(combined_data),
+                'filename': 'Cleaned_Batch_Data.csv'
+            }
+        
+        return jsonify({
+            'success': any(result['success'] for result in results),
+            'files': results,
+            'combined': combined,
+            'total_seconds': round(time.perf_counter() - start, 3)
+        })
+        
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        print(f"Error: {e}\nTrace: {error_trace}")
+        return jsonify({'error': str(e), 'trace': error_trace}), 500
+    finally:
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.unlink(path)
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Recent background cleaning jobs, newest first"""
+    return jsonify({'success': True, 'jobs': get_job_queue().list()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and progress of a background cleaning job (result.session_id feeds /api/download)"""
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, **status})
+
+@app.route('/api/sessions/<session_id>/rows', methods=['GET'])
+def session_rows(session_id):
+    """A window of a cleaned session: ?offset=0&limit=100&sort=<column>&order=asc|desc"""
+    try:
+        stored = get_result_store().get(session_id)
+        if stored is None:
             return jsonify({'error': 'Session expired or invalid'}), 404
+        data, meta = stored
         
-        data = cleaned_data_store[session_id]
-        marketplace = data['marketplace']
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', app.config['ROWS_PAGE_SIZE']))
+        except ValueError:
+            return jsonify({'error': 'offset and limit must be integers'}), 400
+        if offset < 0 or not 1 <= limit <= app.config['ROWS_MAX_LIMIT']:
+            return jsonify({'error': f"offset must be >= 0 and limit between 1 and {app.config['ROWS_MAX_LIMIT']}"}), 400
+        
+        sort = request.args.get('sort')
+        order = request.args.get('order', 'asc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': 'order must be asc or desc'}), 400
+        if sort:
+            if sort not in data.columns:
+                return jsonify({'error': f'Unknown sort column: {sort}'}), 400
+            window = data.iloc[get_sort_order(session_id, data, sort, order == 'desc')[offset:offset + limit]]
+        else:
+            window = data.iloc[offset:offset + limit]
         
-        # Create DataFrame from stored data
-        df = pd.DataFrame(data['data'])
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'offset': offset,
+            'limit': limit,
+            'sort': sort,
+            'order': order,
+            'rows_count': len(data),
+            'columns': data.columns.tolist(),
+            'rows': frame_records(window)
+        })
         
-        # Create CSV in memory
-        from io import StringIO
-        csv_buffer = StringIO()
-        df.to_csv(csv_buffer, index=False)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/download/<session_id>', methods=['GET'])
+def download_cleaned(session_id):
+    try:
+        stored = get_result_store().get(session_id)
+        if stored is None:
+            return jsonify({'error': 'Session expired or invalid'}), 404
         
-        # Create response
-        from io import BytesIO
-        mem = BytesIO()
-        mem.write(csv_buffer.getvalue().encode('utf-8'))
-        mem.seek(0)
+        df, meta = stored
+        marketplace = meta['marketplace']
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"Cleaned_{marketplace}_{timestamp}.csv"
         
-        return send_file(
-            mem,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='text/csv'
-        )
+        # ?format=parquet|feather&compression=... - typed columnar export
+        export = request.args.get('format', 'csv').lower()
+        if export != 'csv':
+            if export not in EXPORT_FORMATS:
+                return jsonify({'error': f'Invalid format. Allowed: {", ".join(EXPORT_FORMATS)}'}), 400
+            from io import BytesIO
+            mem = BytesIO()
+            try:
+                write_frame(df, mem, export, request.args.get('compression'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            mem.seek(0)
+            return send_file(
+                mem,
+                as_attachment=True,
+                download_name=f"Cleaned_{marketplace}_{timestamp}{EXPORT_FORMATS[export]['extensions'][0]}",
+                mimetype='application/vnd.apache.parquet' if export == 'parquet' else 'application/vnd.apache.arrow.file'
+            )
+        
+        # Stream the CSV chunk by chunk instead of building it in memory
+        chunks = csv_chunks(df, app.config['DOWNLOAD_CHUNK_ROWS'])
+        headers = {'Content-Disposition': f'attachment; filename={filename}', 'Vary': 'Accept-Encoding'}
+        if app.config['DOWNLOAD_GZIP'] and request.accept_encodings['gzip']:
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            chunks = (chunk.encode('utf-8') for chunk in chunks)
+        
+        return Response(chunks, mimetype='text/csv', headers=headers)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/store/stats', methods=['GET'])
+def result_store_stats():
+    """Result store and result cache counters (hits, misses, evictions are per worker) and sizes"""
+    stats = get_result_store().stats()
+    stats['cache'] = get_result_cache().stats()
+    return jsonify({'success': True, 'stats': stats})
+
 # Products API with filtering
 @app.route('/api/products', methods=['GET'])
 def get_products():
     try:
-        if not os.path.exists(app.config['PRODUCT_CSV']):
+        catalog = get_product_catalog(product_source())
+        if not catalog.exists:
             return jsonify({
                 'success': True,
                 'products': [],
-                'columns': ['Brand', 'Category', 'Sub-Category', 'Product Titles', 'SKU', 'Partner SKU'],
+                'columns': PRODUCT_COLUMNS,
                 'total': 0,
-                'filters': {
-                    'brands': [],
-                    'categories': [],
-                    'sub_categories': [],
-                    'skus': []
-                }
+                'filters': catalog.filters()
             })
         
-        df = pd.read_csv(app.config['PRODUCT_CSV'])
+        df = catalog.df
         
         # Get filter parameters
         brand_filter = request.args.get('brand', '')
@@ -354,60 +749,42 @@ def get_products():
         sku_filter = request.args.get('sku', '')
         search_query = request.args.get('search', '')
         
-        # Apply filters
-        filtered_df = df.copy()
-        
-        if brand_filter:
-            filtered_df = filtered_df[filtered_df['Brand'].astype(str).str.contains(brand_filter, case=False, na=False)]
-        
-        if category_filter:
-            filtered_df = filtered_df[filtered_df['Category'].astype(str).str.contains(category_filter, case=False, na=False)]
-        
-        if sub_category_filter:
-            filtered_df = filtered_df[filtered_df['Sub-Category'].astype(str).str.contains(sub_category_filter, case=False, na=False)]
-        
-        if sku_filter:
-            filtered_df = filtered_df[filtered_df['SKU'].astype(str).str.contains(sku_filter, case=False, na=False)]
-        
-        if search_query:
-            search_terms = search_query.lower().split()
-            mask = pd.Series([False] * len(filtered_df))
-            for term in search_terms:
-                mask = mask | (
-                    filtered_df['Brand'].astype(str).str.lower().str.contains(term, na=False) |
-                    filtered_df['Category'].astype(str).str.lower().str.contains(term, na=False) |
-                    filtered_df['Sub-Category'].astype(str).str.lower().str.contains(term, na=False) |
-                    filtered_df['Product Titles'].astype(str).str.lower().str.contains(term, na=False) |
-                    filtered_df['SKU'].astype(str).str.lower().str.contains(term, na=False) |
-                    filtered_df['Partner SKU'].astype(str).str.lower().str.contains(term, na=False)
-                )
-            filtered_df = filtered_df[mask]
-        
-        # Get random 50 products or all if less than 50
-        if len(filtered_df) > 50:
+        # Apply filters (a new frame, the catalog's is never changed; indexed
+        # lookups when the products are in a SQLite store)
+        filtered_df = catalog.filter({
+            'Brand': brand_filter,
+            'Category': category_filter,
+            'Sub-Category': sub_category_filter,
+            'SKU': sku_filter
+        })
+        
+        scores = None
+        if search_query.strip():
+            # Rows matching every term, looked up in the catalog's search index
+            # (the catalog frame is indexed by row position)
+            scores = catalog.search(search_query)
+            filtered_df = filtered_df[filtered_df.index.isin(list(scores))]
+        
+        filtered_total = len(filtered_df)
+        
+        # Best 50 search matches, otherwise random 50 products or all if less than 50
+        if scores is not None:
+            ranked = sorted(filtered_df.index, key=lambda row: (-scores[row], row))
+            filtered_df = filtered_df.loc[ranked[:50]]
+        elif len(filtered_df) > 50:
             filtered_df = filtered_df.sample(n=50, random_state=42)
         
         products = filtered_df.to_dict('records')
         columns = df.columns.tolist()
         
-        # Get unique values for filters from FULL dataset
-        brands = sorted(df['Brand'].dropna().unique().tolist()) if 'Brand' in df.columns else []
-        categories = sorted(df['Category'].dropna().unique().tolist()) if 'Category' in df.columns else []
-        sub_categories = sorted(df['Sub-Category'].dropna().unique().tolist()) if 'Sub-Category' in df.columns else []
-        skus = sorted(df['SKU'].dropna().unique().tolist()) if 'SKU' in df.columns else []
-        
         return jsonify({
             'success': True,
             'products': products,
             'columns': columns,
             'total': len(df),
-            'filtered_total': len(filtered_df),
-            'filters': {
-                'brands': brands,
-                'categories': categories,
-                'sub_categories': sub_categories,
-                'skus': skus
-            }
+            'filtered_total': filtered_total,
+            # Facets of the FULL catalog, maintained by the catalog
+            'filters': catalog.filters()
         })
         
     except Exception as e:
@@ -424,39 +801,17 @@ def add_product():
             if field not in data or not str(data[field]).strip():
                 return jsonify({'error': f'Missing or empty field: {field}'}), 400
         
-        # Read existing data or create new
-        if os.path.exists(app.config['PRODUCT_CSV']):
-            df = pd.read_csv(app.config['PRODUCT_CSV'])
-        else:
-            df = pd.DataFrame(columns=required_fields)
+        catalog = get_product_catalog(product_source())
         
-        # Check for duplicate SKU
-        if data['SKU'] in df['SKU'].astype(str).values:
+        # Check for duplicate SKU (checked again by the add, which another worker may have beaten)
+        if catalog.has_sku(data['SKU']) or not catalog.add(pd.DataFrame([data]), unique=True):
             return jsonify({'error': f"SKU '{data['SKU']}' already exists"}), 400
         
-        # Add new row
-        new_row = pd.DataFrame([data])
-        df = pd.concat([df, new_row], ignore_index=True)
-        
-        # Save back to CSV
-        df.to_csv(app.config['PRODUCT_CSV'], index=False)
-        
-        # Get updated filter values
-        brands = sorted(df['Brand'].dropna().unique().tolist()) if 'Brand' in df.columns else []
-        categories = sorted(df['Category'].dropna().unique().tolist()) if 'Category' in df.columns else []
-        sub_categories = sorted(df['Sub-Category'].dropna().unique().tolist()) if 'Sub-Category' in df.columns else []
-        skus = sorted(df['SKU'].dropna().unique().tolist()) if 'SKU' in df.columns else []
-        
         return jsonify({
             'success': True,
             'message': 'Product added successfully',
-            'total': len(df),
-            'filters': {
-                'brands': brands,
-                'categories': categories,
-                'sub_categories': sub_categories,
-                'skus': skus
-            }
+            'total': len(catalog.df),
+            'filters': catalog.filters()
         })
         
     except Exception as e:
@@ -475,57 +830,32 @@ def bulk_add_products():
         if not file.filename.lower().endswith('.csv'):
             return jsonify({'error': 'Only CSV files allowed for bulk upload'}), 400
         
-        # Read uploaded CSV
-        bulk_df = pd.read_csv(file)
-        
-        # Check required columns
-        required_columns = ['Brand', 'Category', 'Sub-Category', 'Product Titles', 'SKU', 'Partner SKU']
-        missing_columns = [col for col in required_columns if col not in bulk_df.columns]
-        
-        if missing_columns:
-            return jsonify({'error': f'Missing columns: {", ".join(missing_columns)}'}), 400
-        
-        # Read existing data or create new
-        if os.path.exists(app.config['PRODUCT_CSV']):
-            existing_df = pd.read_csv(app.config['PRODUCT_CSV'])
-        else:
-            existing_df = pd.DataFrame(columns=required_columns)
-        
-        # Find new SKUs
-        existing_skus = set(existing_df['SKU'].astype(str).str.strip())
-        new_skus = set(bulk_df['SKU'].astype(str).str.strip())
-        
-        # Filter out duplicates
-        unique_skus = new_skus - existing_skus
-        new_products_df = bulk_df[bulk_df['SKU'].astype(str).str.strip().isin(unique_skus)]
+        # Read uploaded CSV in chunks
+        with pd.read_csv(file, chunksize=app.config['BULK_CHUNK_ROWS']) as reader:
+            first_chunk = reader.get_chunk()
+            
+            # Check required columns
+            required_columns = ['Brand', 'Category', 'Sub-Category', 'Product Titles', 'SKU', 'Partner SKU']
+            missing_columns = [col for col in required_columns if col not in first_chunk.columns]
+            
+            if missing_columns:
+                return jsonify({'error': f'Missing columns: {", ".join(missing_columns)}'}), 400
+            
+            catalog = get_product_catalog(product_source())
+            
+            # Skip SKUs already in the catalog or repeated in the upload, append the rest chunk by chunk
+            added, skipped = catalog.import_chunks(itertools.chain([first_chunk], reader))
         
-        if len(new_products_df) == 0:
+        if added == 0:
             return jsonify({'error': 'All SKUs already exist in database'}), 400
         
-        # Merge data
-        combined_df = pd.concat([existing_df, new_products_df], ignore_index=True)
-        
-        # Save back to CSV
-        combined_df.to_csv(app.config['PRODUCT_CSV'], index=False)
-        
-        # Get updated filter values
-        brands = sorted(combined_df['Brand'].dropna().unique().tolist()) if 'Brand' in combined_df.columns else []
-        categories = sorted(combined_df['Category'].dropna().unique().tolist()) if 'Category' in combined_df.columns else []
-        sub_categories = sorted(combined_df['Sub-Category'].dropna().unique().tolist()) if 'Sub-Category' in combined_df.columns else []
-        skus = sorted(combined_df['SKU'].dropna().unique().tolist()) if 'SKU' in combined_df.columns else []
-        
         return jsonify({
             'success': True,
-            'message': f'Added {len(new_products_df)} new products',
-            'added': len(new_products_df),
-            'skipped': len(bulk_df) - len(new_products_df),
-            'total': len(combined_df),
-            'filters': {
-                'brands': brands,
-                'categories': categories,
-                'sub_categories': sub_categories,
-                'skus': skus
-            }
+            'message': f'Added {added} new products',
+            'added': added,
+            'skipped': skipped,
+            'total': len(catalog.df),
+            'filters': catalog.filters()
         })
         
     except Exception as e:
@@ -631,6 +961,13 @@ def get_sample_data(marketplace):
         print(f"Error generating sample data: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_text():
+    """Cleaning stage and request metrics in the Prometheus text format"""
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     # Ensure product.csv exists
     if not os.path.exists('product.csv'):
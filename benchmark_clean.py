@@ -0,0 +1,339 @@
+"""
+Benchmark the Noon, Amazon and Revibe cleaners on large synthetic exports.
+
+    python benchmark_clean.py --sizes 10000,100000,1000000
+    python benchmark_clean.py --sizes 100000 --compare benchmark_results/clean-20240101-120000.json
+
+Inputs are generated from a seed (Noon CSV, Amazon CSV, Amazon multi-sheet
+XLSX with one sheet per partner, Revibe CSV) and kept in --data-dir, so later
+runs clean the same files. A share of the SKUs (--overlap) comes from the
+product master, the rest are unknown, so enrichment does real work.
+
+Every run happens in a fresh process and goes through clean_file, timing
+the stages: master (loading the product master), read (read_data) and
+transform, then write (saving the cleaned frame in --format to a temporary
+file). A run's time covers all four. Peak memory is the resident high-water
+mark of each stage (of the run so far where it cannot be reset), plus the
+Python heap peak per stage with --tracemalloc.
+Results are written as JSON; --compare prints the change against an
+earlier results file and exits with status 1 on a regression.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmark_read import make_amazon, make_noon, order_dates
+from product_store import is_product_store, get_product_store
+from your_cleaning_script import (NoonCleaner, AmazonCleaner, RevibeCleaner, READ_ENGINES, EXPORT_FORMATS, clean_file,
+                                  write_frame)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Case name -> (marketplace, input format, cleaner)
+CASES = {
+    'noon': ('Noon', 'csv', NoonCleaner),
+    'amazon': ('Amazon', 'csv', AmazonCleaner),
+    'amazon-xlsx': ('Amazon', 'xlsx', AmazonCleaner),
+    'revibe': ('Revibe', 'csv', RevibeCleaner)
+}
+
+# Sheets of the multi-sheet Amazon workbook (sheet name = Partner ID)
+AMAZON_SHEETS = ['Wishcare', '100 MPH', '100_Miles']
+
+# Timed stages, in the order they run (clean_file, then the write)
+STAGES = ['master', 'read', 'transform', 'write']
+
+def make_revibe(rows, rng, master, overlap):
+    """Synthetic Revibe export - mixed day-first date formats, as the real files have"""
+    dates = order_dates(rows, rng)
+    formats = ['%d/%m/%Y %H:%M', '%Y-%m-%d', '%b %d, %Y', '%d-%m-%Y %H:%M:%S']
+    date_text = np.empty(rows, dtype=object)
+    kind = rng.integers(0, len(formats), rows)
+    for i, date_format in enumerate(formats):
+        date_text[kind == i] = dates[kind == i].strftime(date_format)
+    data = {
+        'Last Update Date': date_text,
+        'id': np.char.add('R', np.arange(rows).astype(str)),
+        'SKU (Old: Order Status)': np.char.add('RV', rng.integers(10**5, 10**5 + 2000, rows).astype(str)),
+        'Shipment Status': rng.choice(['Shipped', 'At quality check', 'Refused delivery', 'Returned'], rows),
+        'Supplier': rng.choice(['Sup1', 'Sup2', 'Sup3'], rows),
+        'Country': rng.choice(['United Arab Emirates', 'Saudi'], rows),
+        'Category': rng.choice(['Phones', 'Tablets', 'Laptops'], rows),
+        'Condition': rng.choice(['Fair', 'Good', 'Excellent'], rows),
+        'Model': rng.choice(['iPhone 12', 'iPhone 13', 'iPhone 14 Pro', 'iPad Air'], rows),
+        'Variation: Color, Storage, Condition': rng.choice(['Black 64GB', 'Blue 128GB', 'White 256GB'], rows),
+        'Actual Cost': np.round(rng.uniform(100, 4000, rows), 2).astype(str)
+    }
+    return pd.DataFrame(data)
+
+MAKERS = {'Noon': make_noon, 'Amazon': make_amazon, 'Revibe': make_revibe}
+
+def write_xlsx(df, path, sheets):
+    """Split df across sheets of a workbook, streamed with openpyxl's write-only mode"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet, part in zip(sheets, np.array_split(np.arange(len(df)), len(sheets))):
+        worksheet = workbook.create_sheet(sheet)
+        worksheet.append(list(df.columns))
+        for row in df.iloc[part].itertuples(index=False):
+            worksheet.append(row)
+    workbook.save(path)
+
+def dataset_path(data_dir, case, rows, seed, overlap):
+    marketplace, file_format, _ = CASES[case]
+    return os.path.join(data_dir, f'{marketplace.lower()}-{rows}-s{seed}-o{overlap:g}.{file_format}')
+
+def ensure_dataset(data_dir, case, rows, seed, overlap, master):
+    """Path of the input for a case, generated on first use"""
+    path = dataset_path(data_dir, case, rows, seed, overlap)
+    if os.path.exists(path):
+        return path
+    marketplace, file_format, _ = CASES[case]
+    start = time.perf_counter()
+    # Seeded per marketplace and size, so the CSV and XLSX hold the same rows
+    rng = np.random.default_rng([seed, rows, list(MAKERS).index(marketplace)])
+    df = MAKERS[marketplace](rows, rng, master, overlap)
+    temp_path = path + '.tmp'
+    if file_format == 'xlsx':
+        write_xlsx(df, temp_path, AMAZON_SHEETS)
+    else:
+        df.to_csv(temp_path, index=False)
+    os.replace(temp_path, path)
+    print(f"Generated {path} ({os.path.getsize(path) / 2**20:.1f} MB) in {time.perf_counter() - start:.1f}s")
+    return path
+
+def reset_peak_rss():
+    """Restart the resident memory high-water mark -> True when supported (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb(who=None):
+    """
+    High-water mark of resident memory in MB. VmHWM where /proc has it;
+    ru_maxrss otherwise, which keeps the parent's peak across fork and exec
+    and is KB on Linux, bytes on macOS.
+    """
+    if who is None:
+        try:
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return round(int(line.split()[1]) / 2**10, 1)
+        except OSError:
+            pass
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return round(usage / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+def measure(trace, func, *args, **kwargs):
+    """Run func -> (its result, the stage record: time and peak memory)"""
+    if trace:
+        tracemalloc.reset_peak()
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    stage = {'seconds': round(time.perf_counter() - start, 4), 'peak_rss_mb': peak_rss_mb()}
+    if trace:
+        stage['heap_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    return result, stage
+
+def timed_cleaner(cleaner_class, stages, trace):
+    """Subclass of cleaner_class that records the time and memory of each stage into stages"""
+    def timed(name, method):
+        def run(self, *args, **kwargs):
+            result, stage = measure(trace, method, self, *args, **kwargs)
+            if self.data is not None:
+                stage['rows'] = len(self.data)
+            stages[name] = stage
+            return result
+        return run
+
+    return type(cleaner_class.__name__, (cleaner_class,), {
+        'load_master_data': timed('master', cleaner_class.load_master_data),
+        'read_data': timed('read', cleaner_class.read_data),
+        'transform': timed('transform', cleaner_class.transform)
+    })
+
+def run_case(case, path, engine, compact, master_path, trace, write_format):
+    """Runs in a fresh process: one clean_file of the input and a write of its output -> result dict"""
+    _, _, cleaner_class = CASES[case]
+    stages = {}
+    result = {'rss_before_mb': peak_rss_mb()}
+    if trace:
+        tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            data, _, seconds, _ = clean_file(timed_cleaner(cleaner_class, stages, trace), path, compact=compact,
+                                          engine=engine, master_path=master_path)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'cleaned' + EXPORT_FORMATS[write_format]['extensions'][0])
+            _, stages['write'] = measure(trace, write_frame, data, output, write_format)
+            stages['write'].update(rows=len(data), output_mb=round(os.path.getsize(output) / 2**20, 2))
+        result.update(seconds=round(seconds + stages['write']['seconds'], 4), rows_out=len(data))
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['stages'] = stages
+    result['peak_rss_mb'] = max([peak_rss_mb() or 0] + [stage['peak_rss_mb'] or 0 for stage in stages.values()])
+    if resource is not None:
+        # Sheet reader processes of a multi-sheet workbook
+        result['children_peak_rss_mb'] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return result
+
+def run_isolated(*args):
+    """run_case in a new interpreter, so peak memory belongs to this run alone"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_case, *args).result()
+
+def summarize(case, rows, path, runs):
+    """Best run (lowest total time) of a case, with the spread of all runs"""
+    marketplace, file_format, _ = CASES[case]
+    entry = {'case': case, 'marketplace': marketplace, 'format': file_format, 'rows': rows,
+             'input_mb': round(os.path.getsize(path) / 2**20, 2), 'runs': runs}
+    good = [run for run in runs if 'error' not in run]
+    if not good:
+        entry['error'] = runs[-1]['error']
+        return entry
+    best = min(good, key=lambda run: run['seconds'])
+    entry.update(seconds=best['seconds'], rows_out=best['rows_out'],
+                 rows_per_second=round(rows / best['seconds']),
+                 stages={name: best['stages'][name]['seconds'] for name in STAGES if name in best['stages']},
+                 peak_rss_mb=max(run['peak_rss_mb'] or 0 for run in good))
+    return entry
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    try:
+        import pyarrow
+        pyarrow_version = pyarrow.__version__
+    except ImportError:
+        pyarrow_version = None
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': pyarrow_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': git_commit()
+    }
+
+def compare(results, meta, previous, threshold):
+    """Print time and memory against an earlier run -> number of regressions"""
+    before = {(entry['case'], entry['rows']): entry for entry in previous['results']}
+    regressions = 0
+    print(f"\nAgainst {previous['meta'].get('commit') or 'previous run'} ({previous['meta'].get('created')}):")
+    for key in ['engine', 'compact', 'format', 'tracemalloc', 'overlap', 'seed']:
+        if previous['meta'].get(key) != meta.get(key):
+            print(f"  Warning: {key} was {previous['meta'].get(key)!r}, now {meta.get(key)!r}")
+    for entry in results:
+        old = before.get((entry['case'], entry['rows']))
+        if old is None or 'error' in entry or 'error' in old:
+            continue
+        changes = []
+        for key, label in [('seconds', 'time'), ('peak_rss_mb', 'peak memory')]:
+            if not old.get(key) or not entry.get(key):
+                continue
+            ratio = entry[key] / old[key]
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            changes.append(f"{label} {old[key]:.2f} -> {entry[key]:.2f} (x{ratio:.2f}){flag}")
+        print(f"  {entry['case']:12s} {entry['rows']:>9d}  " + ', '.join(changes))
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sizes', default='10000,100000,1000000', help='comma-separated row counts')
+    arg_parser.add_argument('--cases', default=','.join(CASES), help=f'comma-separated, from {list(CASES)}')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='runs per case; the fastest is reported')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--overlap', type=float, default=0.8, help='share of rows with a SKU from the master')
+    arg_parser.add_argument('--engine', choices=READ_ENGINES, default='c')
+    arg_parser.add_argument('--compact', action='store_true')
+    arg_parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv', help='format of the timed write')
+    arg_parser.add_argument('--master', default='product.csv', help='product master (CSV or SQLite store)')
+    arg_parser.add_argument('--tracemalloc', action='store_true', help='also record the Python heap peak per stage (much slower, times are not comparable)')
+    arg_parser.add_argument('--data-dir', default='benchmark_data')
+    arg_parser.add_argument('--output', help='results file (default benchmark_results/clean-<time>.json)')
+    arg_parser.add_argument('--compare', help='earlier results file to compare against')
+    arg_parser.add_argument('--threshold', type=float, default=0.2, help='slowdown or growth counted as a regression')
+    args = arg_parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    cases = args.cases.split(',')
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        arg_parser.error(f"unknown cases {unknown}, use {list(CASES)}")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    if is_product_store(args.master):
+        master = get_product_store(args.master).read_frame()
+    else:
+        master = pd.read_csv(args.master, dtype=str)
+    master = master.dropna(subset=['SKU'])
+
+    created = datetime.now()
+    results = []
+    for rows in sizes:
+        for case in cases:
+            path = ensure_dataset(args.data_dir, case, rows, args.seed, args.overlap, master)
+            runs = [run_isolated(case, path, args.engine, args.compact, args.master, args.tracemalloc, args.format)
+                    for _ in range(args.repeat)]
+            entry = summarize(case, rows, path, runs)
+            results.append(entry)
+            if 'error' in entry:
+                print(f"{case:12s} {rows:>9d} rows  failed: {entry['error']}")
+                continue
+            stages = '  '.join(f"{name} {seconds:.2f}s" for name, seconds in entry['stages'].items())
+            print(f"{case:12s} {rows:>9d} rows  {entry['seconds']:7.2f}s  {entry['rows_per_second']:>9d} rows/s  "
+                  f"peak {entry['peak_rss_mb']:.0f} MB  ({stages})")
+
+    meta = dict(environment(), created=created.isoformat(timespec='seconds'), seed=args.seed,
+                overlap=args.overlap, engine=args.engine, compact=args.compact, format=args.format, repeat=args.repeat,
+                tracemalloc=args.tracemalloc,
+                master=args.master, master_rows=len(master))
+    output = args.output or os.path.join('benchmark_results', f"clean-{created.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, meta, json.load(f), args.threshold)
+        if regressions:
+            print(f"{regressions} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
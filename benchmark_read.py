@@ -0,0 +1,122 @@
+"""
+Compare the CSV read engines on large synthetic Noon and Amazon exports.
+
+    python benchmark_read.py --rows 500000 --repeat 3
+
+'full' is the old read (pd.read_csv(dtype=str), every column), 'c' and
+'pyarrow' are BaseCleaner.read_data with that engine and column projection.
+The export generators are shared with benchmark_clean.py.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from your_cleaning_script import NoonCleaner, AmazonCleaner, READ_ENGINES
+
+# Columns in the real exports that the cleaners never use
+FILLER_COLUMNS = 20
+
+def pick_skus(rows, rng, master=None, overlap=0):
+    """
+    (SKU, Partner SKU) arrays: `overlap` of the rows take a product from the
+    master (a product.csv frame), popular products more often, the rest an
+    unknown SKU
+    """
+    sku = np.char.add('X', rng.integers(10**7, 10**7 + max(rows // 20, 1), rows).astype(str)).astype(object)
+    partner_sku = np.char.add('U', rng.integers(10**5, 10**6, rows).astype(str)).astype(object)
+    if master is not None and len(master):
+        known = rng.random(rows) < overlap
+        # Zipf-like popularity over the catalog
+        weights = 1.0 / np.arange(1, len(master) + 1)
+        products = rng.choice(len(master), known.sum(), p=weights / weights.sum())
+        sku[known] = master['SKU'].to_numpy()[products]
+        partner_sku[known] = master['Partner SKU'].to_numpy()[products]
+    return sku, partner_sku
+
+def order_dates(rows, rng, start='2024-01-01'):
+    return pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, rows), unit='min')
+
+def make_noon(rows, rng, master=None, overlap=0):
+    """Synthetic Noon export"""
+    sku, partner_sku = pick_skus(rows, rng, master, overlap)
+    data = {
+        'order_timestamp': order_dates(rows, rng).strftime('%Y-%m-%d %H:%M:%S'),
+        'item_nr': np.char.add('NR', rng.integers(10**8, 10**9, rows).astype(str)),
+        'sku': sku,
+        'status': rng.choice(['Shipped', 'Delivered', 'CIR', 'Cancelled', 'Processing', 'Undelivered'], rows,
+                             p=[0.4, 0.3, 0.1, 0.1, 0.05, 0.05]),
+        'id_partner': rng.choice(['46272', '181587', '47461', '74949', '99999'], rows),
+        'country_code': rng.choice(['AE', 'SA', 'EG'], rows, p=[0.5, 0.4, 0.1]),
+        'partner_sku': partner_sku,
+        'fulfillment_model': rng.choice(['Fulfilled by Noon (FBN)', 'Fulfilled by Partner (FBP)'], rows),
+        'offer_price': np.round(rng.uniform(10, 5000, rows), 2).astype(str)
+    }
+    return add_filler(data, rows, rng)
+
+def make_amazon(rows, rng, master=None, overlap=0):
+    """Synthetic Amazon order report"""
+    sku, _ = pick_skus(rows, rng, master, overlap)
+    dates = order_dates(rows, rng).tz_localize('UTC')
+    data = {
+        'amazon-order-id': np.char.add('402-', rng.integers(10**6, 10**7, rows).astype(str)),
+        'purchase-date': dates.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'sales-channel': rng.choice(['Amazon.ae', 'Amazon.sa', 'Non-Amazon'], rows, p=[0.6, 0.38, 0.02]),
+        'item-status': rng.choice(['Shipped', 'Pending', 'Cancelled', 'Unshipped'], rows, p=[0.7, 0.1, 0.1, 0.1]),
+        'fulfillment-channel': rng.choice(['Amazon', 'Merchant'], rows),
+        'product-name': np.char.add('Product ', rng.integers(0, 5000, rows).astype(str)),
+        'sku': sku,
+        'asin': np.char.add('B0', rng.integers(10**7, 10**8, rows).astype(str)),
+        'quantity': rng.choice(['1', '2', '3'], rows, p=[0.8, 0.15, 0.05]),
+        'item-price': np.round(rng.uniform(10, 5000, rows), 2).astype(str),
+        'ship-country': rng.choice(['AE', 'SA', 'BH', 'KW', 'OM'], rows, p=[0.5, 0.35, 0.05, 0.05, 0.05])
+    }
+    return add_filler(data, rows, rng)
+
+def add_filler(data, rows, rng):
+    for i in range(FILLER_COLUMNS):
+        data[f'extra_{i}'] = np.char.add('x', rng.integers(0, 1000, rows).astype(str))
+    return pd.DataFrame(data)
+
+def time_read(read, repeat):
+    """Best of `repeat` runs in seconds"""
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            read()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--rows', type=int, default=500000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, make, cleaner_class in [('Noon', make_noon, NoonCleaner), ('Amazon', make_amazon, AmazonCleaner)]:
+            path = os.path.join(work_dir, f'{name.lower()}.csv')
+            make(args.rows, rng).to_csv(path, index=False)
+            size = os.path.getsize(path) / 2**20
+            print(f"{name}: {args.rows} rows, {size:.1f} MB")
+
+            full = time_read(lambda: pd.read_csv(path, dtype=str), args.repeat)
+            print(f"  {'full':16s} {full:7.2f}s")
+            for engine in READ_ENGINES:
+                for compact in (False, True):
+                    cleaner = cleaner_class(path, compact=compact, engine=engine)
+                    elapsed = time_read(cleaner.read_data, args.repeat)
+                    label = engine + (' compact' if compact else '')
+                    print(f"  {label:16s} {elapsed:7.2f}s  x{full / elapsed:.1f}")
+
+if __name__ == '__main__':
+    main()
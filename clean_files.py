@@ -0,0 +1,182 @@
+"""
+Clean marketplace exports from the command line, several files at a time.
+
+    python clean_files.py exports/ --output-dir cleaned
+    python clean_files.py "exports/**/*.csv" Amazon=amazon/*.xlsx --workers 4 --format parquet --combine
+
+Each input is a file, a directory (its .csv / .xlsx / .xls files) or a glob,
+optionally prefixed with the marketplace ('Noon=exports/noon'). Files without
+one take --marketplace, else the marketplace is detected from the columns or
+the file name. Files are cleaned on --workers processes and written to
+--output-dir as Cleaned_<name> in the chosen format; --combine also writes
+all of them as one file. Flask is never imported.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from your_cleaning_script import CLEANERS, EXPORT_FORMATS, READ_ENGINES, clean_file, combine_cleaned, \
+    detect_marketplace, write_frame
+
+INPUT_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+def expand_inputs(inputs, default_marketplace=None):
+    """[(path, marketplace or None)] for the inputs, each file once, in order"""
+    files = {}
+    for spec in inputs:
+        marketplace, pattern = default_marketplace, spec
+        name, sep, rest = spec.partition('=')
+        if sep and name in CLEANERS:
+            marketplace, pattern = name, rest
+        if os.path.isdir(pattern):
+            paths = sorted(os.path.join(pattern, entry) for entry in os.listdir(pattern))
+        elif os.path.exists(pattern):
+            paths = [pattern]
+        else:
+            paths = sorted(glob.glob(pattern, recursive=True))
+            if not paths:
+                print(f"Warning: Nothing matches {pattern}")
+        for path in paths:
+            if os.path.isfile(path) and path.lower().endswith(INPUT_EXTENSIONS):
+                files.setdefault(os.path.normpath(path), marketplace)
+    return list(files.items())
+
+def output_paths(paths, output_dir, format):
+    """Cleaned_<name>.<ext> per input, numbered when two inputs share a name"""
+    extension = EXPORT_FORMATS[format]['extensions'][0]
+    used = set()
+    outputs = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, count = f'Cleaned_{stem}', 1
+        while name in used:
+            count += 1
+            name = f'Cleaned_{stem}_{count}'
+        used.add(name)
+        outputs.append(os.path.join(output_dir, name + extension))
+    return outputs
+
+def clean_one(marketplace, path, output, compact, engine, sheet_workers, master_path, sku_match, format,
+              compression, keep, verbose):
+    """Clean and write one file (runs in a worker process) -> result dict"""
+    log = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if verbose else log):
+        data, _, seconds, _ = clean_file(CLEANERS[marketplace], path, compact, engine, sheet_workers,
+                                         master_path=master_path, sku_match=sku_match)
+        start = time.perf_counter()
+        write_frame(data, output, format, compression)
+    return {
+        'rows': len(data),
+        'seconds': seconds,
+        'write_seconds': time.perf_counter() - start,
+        'data': data if keep else None
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('inputs', nargs='+', help="files, directories or globs, optionally 'Marketplace=...'")
+    arg_parser.add_argument('--marketplace', choices=list(CLEANERS), help='marketplace of inputs without a prefix (default: detect)')
+    arg_parser.add_argument('--output-dir', default='cleaned')
+    arg_parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+    arg_parser.add_argument('--compression', help='compression for parquet / feather (default: the format\'s first)')
+    arg_parser.add_argument('--combine', action='store_true', help='also write every cleaned file as one')
+    default_workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    arg_parser.add_argument('--workers', type=int, default=default_workers, help='processes cleaning files')
+    arg_parser.add_argument('--compact', action='store_true', help='categorical / arrow string dtypes')
+    arg_parser.add_argument('--engine', choices=READ_ENGINES, default='c', help='CSV reader')
+    arg_parser.add_argument('--master', default='product.csv', help='product master (CSV or SQLite store)')
+    arg_parser.add_argument('--sku-match', type=float, metavar='CONFIDENCE',
+                            help='also fill SKUs matched approximately this surely, e.g. 0.8 (default: exact SKUs only)')
+    arg_parser.add_argument('--verbose', action='store_true', help="show the cleaners' own output")
+    args = arg_parser.parse_args()
+    if args.sku_match is not None and not 0 < args.sku_match <= 1:
+        arg_parser.error('--sku-match must be between 0 and 1')
+
+    files = expand_inputs(args.inputs, args.marketplace)
+    if not files:
+        arg_parser.error('no .csv, .xlsx or .xls files found')
+
+    jobs = []
+    for path, marketplace in files:
+        marketplace = marketplace or detect_marketplace(path)
+        if marketplace is None:
+            print(f"Skipping {path}: marketplace not recognised, give it with --marketplace or Marketplace={path}")
+            continue
+        jobs.append((path, marketplace))
+    if not jobs:
+        sys.exit(1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    outputs = output_paths([path for path, _ in jobs], args.output_dir, args.format)
+    workers = max(1, min(args.workers, len(jobs)))
+    # Files are already cleaned in parallel, so sheets are read in each worker
+    sheet_workers = 1 if workers > 1 else None
+    print(f"Cleaning {len(jobs)} file(s) on {workers} process(es)")
+
+    start = time.perf_counter()
+    results = {}
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            for i, (path, marketplace) in enumerate(jobs):
+                try:
+                    results[i] = clean_one(marketplace, path, outputs[i], args.compact, args.engine, sheet_workers,
+                                           args.master, args.sku_match, args.format, args.compression, args.combine,
+                                           args.verbose)
+                except Exception as e:
+                    results[i] = {'error': str(e)}
+                report(jobs[i], outputs[i], results[i])
+        else:
+            pending = {executor.submit(clean_one, marketplace, path, outputs[i], args.compact, args.engine,
+                                       sheet_workers, args.master, args.sku_match, args.format, args.compression,
+                                       args.combine, args.verbose): i
+                       for i, (path, marketplace) in enumerate(jobs)}
+            for future in as_completed(pending):
+                i = pending[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = {'error': str(e)}
+                report(jobs[i], outputs[i], results[i])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    combined_path = None
+    frames = [results[i]['data'] for i in range(len(jobs)) if 'error' not in results[i]]
+    if args.combine and frames:
+        combined_path = os.path.join(args.output_dir, 'Cleaned_Batch_Data' + EXPORT_FORMATS[args.format]['extensions'][0])
+        write_frame(combine_cleaned(frames), combined_path, args.format, args.compression)
+    summarize(jobs, results, time.perf_counter() - start, workers, combined_path)
+    if len(frames) < len(jobs) or len(jobs) < len(files):
+        sys.exit(1)
+
+def report(job, output, result):
+    path, marketplace = job
+    if 'error' in result:
+        print(f"  FAILED {path} ({marketplace}): {result['error']}")
+        return
+    size = os.path.getsize(path) / 2**20
+    print(f"  {path} ({marketplace}) -> {output}: {result['rows']} rows, {size:.1f} MB in {result['seconds']:.2f}s "
+          f"+ {result['write_seconds']:.2f}s write")
+
+def summarize(jobs, results, wall, workers, combined_path):
+    """Throughput of the whole run"""
+    done = [i for i in range(len(jobs)) if 'error' not in results[i]]
+    rows = sum(results[i]['rows'] for i in done)
+    size = sum(os.path.getsize(jobs[i][0]) for i in done) / 2**20
+    busy = sum(results[i]['seconds'] + results[i]['write_seconds'] for i in done)
+    print(f"\n{len(done)} of {len(jobs)} file(s) cleaned, {rows} rows from {size:.1f} MB in {wall:.2f}s")
+    if done and wall > 0:
+        print(f"Throughput: {rows / wall:,.0f} rows/s, {size / wall:.1f} MB/s "
+              f"(x{busy / wall:.1f} over one process, {workers} worker(s))")
+    if combined_path:
+        print(f"Combined output: {combined_path}")
+
+if __name__ == '__main__':
+    main()
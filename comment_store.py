@@ -0,0 +1,311 @@
+"""
+Comments and replies kept in memory, with an index from comment id to node.
+
+comments.json stays the snapshot, in its old format. Each change is one
+JSON line appended to a journal beside it, and the journal is folded back
+into the snapshot once it holds compact_every entries. Every worker replays
+only the journal lines it has not seen yet. A lock file makes appends and
+compactions from several gunicorn workers take turns, so adding, replying
+and deleting never rewrite or rescan the thread.
+
+Comments are read a page at a time: top-level comments, or the direct
+replies of one comment, newest first from a cursor. A page is cut from the
+in-memory index, not from the files: comments.json is a single JSON
+document that cannot be read in part, so each worker parses it once, holds
+every thread (one copy per worker process) and afterwards reads only the
+journal lines it has not applied.
+"""
+import base64
+import bisect
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class CommentNotFound(Exception):
+    pass
+
+class Thread:
+    """
+    The comments at one level (top level, or the replies to one comment).
+    keys holds (timestamp, id) oldest first and keeps the keys of deleted
+    comments until the next reload, so an add is an append, a delete is a
+    dict pop and a cursor stays valid while comments come and go.
+    """
+    def __init__(self):
+        self.keys = []
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, node):
+        key = (node.get('timestamp', ''), node['id'])
+        if self.keys and key < self.keys[-1]:
+            bisect.insort(self.keys, key)
+        else:
+            self.keys.append(key)
+        self.nodes[node['id']] = node
+
+    def remove(self, comment_id):
+        self.nodes.pop(comment_id, None)
+
+    def newest(self, limit=None, cursor=None):
+        """Up to limit nodes older than the cursor key, newest first -> (nodes, key to continue from or None)"""
+        pos = len(self.keys) if cursor is None else bisect.bisect_left(self.keys, cursor)
+        page = []
+        last_key = None
+        while pos > 0:
+            pos -= 1
+            node = self.nodes.get(self.keys[pos][1])
+            if node is None:
+                continue
+            if limit is not None and len(page) == limit:
+                # One more exists, continue after the last one returned
+                return page, last_key
+            page.append(node)
+            last_key = self.keys[pos]
+        return page, None
+
+    def prune(self):
+        """Drop the keys of deleted comments"""
+        self.keys = [key for key in self.keys if key[1] in self.nodes]
+
+class CommentStore:
+    """
+    path           snapshot file (comments.json); the journal is path + '.journal'
+    compact_every  journal entries written before they are folded into the snapshot
+    """
+    def __init__(self, path, compact_every=200):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.lock_path = path + '.lock'
+        self.compact_every = compact_every
+        self.lock = threading.RLock()
+        # id -> node; a node is the comment without 'replies' plus 'children' (a Thread)
+        self.nodes = {}
+        self.roots = Thread()
+        self.snapshot_version = None
+        self.journal_offset = 0
+        self.journal_entries = 0
+        self.loaded = False
+
+    # ---- reading ----
+
+    def page(self, limit, cursor=None, parent_id=None):
+        """
+        Top-level comments, or the direct replies of parent_id, newest first
+        -> (comments, next cursor or None). Each comment carries reply_count
+        instead of its replies. Raises CommentNotFound for an unknown parent
+        and ValueError for a bad cursor.
+        """
+        key = self.decode_cursor(cursor) if cursor else None
+        with self.lock, self.file_lock(shared=True):
+            self.catch_up()
+            if parent_id:
+                if parent_id not in self.nodes:
+                    raise CommentNotFound(f"Comment '{parent_id}' not found")
+                thread = self.nodes[parent_id]['children']
+            else:
+                thread = self.roots
+            nodes, next_key = thread.newest(limit, key)
+            comments = [self.summary(node) for node in nodes]
+        return comments, self.encode_cursor(next_key) if next_key else None
+
+    def count(self):
+        """Comments and replies in total"""
+        with self.lock, self.file_lock(shared=True):
+            self.catch_up()
+            return len(self.nodes)
+
+    @staticmethod
+    def summary(node):
+        comment = {key: value for key, value in node.items() if key != 'children'}
+        comment['reply_count'] = len(node['children'])
+        return comment
+
+    def to_comment(self, node):
+        """Comment with all its replies, as saved in the snapshot"""
+        comment = {key: value for key, value in node.items() if key != 'children'}
+        comment['replies'] = [self.to_comment(child) for child in node['children'].newest()[0]]
+        return comment
+
+    @staticmethod
+    def encode_cursor(key):
+        return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            timestamp, comment_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, TypeError, UnicodeError):
+            raise ValueError('Invalid cursor')
+        return (str(timestamp), str(comment_id))
+
+    # ---- writing ----
+
+    def add(self, name, text, parent_id=None):
+        """Add a comment, or a reply when parent_id is set -> the new comment"""
+        with self.lock, self.file_lock():
+            self.catch_up()
+            if parent_id and parent_id not in self.nodes:
+                raise CommentNotFound(f"Parent comment '{parent_id}' not found")
+            # Stamped under the lock so journal order is timestamp order
+            now = datetime.now()
+            comment = {
+                'id': str(uuid.uuid4())[:8],
+                'parent_id': parent_id,
+                'name': name,
+                'comment': text,
+                'timestamp': now.isoformat(),
+                'date': now.strftime('%d %b %Y'),
+                'time': now.strftime('%I:%M %p')
+            }
+            self.write({'op': 'add', 'comment': comment})
+        return dict(comment, replies=[])
+
+    def delete(self, comment_id):
+        """Delete a comment - a comment with replies stays as a '[Deleted]' placeholder"""
+        with self.lock, self.file_lock():
+            self.catch_up()
+            if comment_id not in self.nodes:
+                raise CommentNotFound(f"Comment '{comment_id}' not found")
+            self.write({'op': 'delete', 'id': comment_id})
+
+    def write(self, entry):
+        """Journal an entry and apply it (caller holds both locks)"""
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.journal_path, 'ab') as f:
+            f.write(line)
+        self.journal_offset += len(line)
+        self.journal_entries += 1
+        self.apply(entry)
+        if self.journal_entries >= self.compact_every:
+            self.compact()
+
+    def apply(self, entry):
+        if entry['op'] == 'add':
+            comment = entry['comment']
+            if comment['id'] in self.nodes:
+                return
+            self.insert(dict(comment), self.parent_thread(comment))
+        elif entry['op'] == 'delete':
+            node = self.nodes.get(entry['id'])
+            if node is None:
+                return
+            if node['children']:
+                # Keep it so the replies stay in place
+                node['deleted'] = True
+                node['name'] = '[Deleted]'
+                node['comment'] = 'This comment has been deleted'
+            else:
+                self.parent_thread(node).remove(node['id'])
+                del self.nodes[node['id']]
+
+    def parent_thread(self, comment):
+        parent = self.nodes.get(comment.get('parent_id')) if comment.get('parent_id') else None
+        return parent['children'] if parent else self.roots
+
+    def insert(self, node, thread):
+        node.pop('replies', None)
+        node['children'] = Thread()
+        thread.add(node)
+        self.nodes[node['id']] = node
+        return node
+
+    # ---- files ----
+
+    @contextmanager
+    def file_lock(self, shared=False):
+        """Lock shared with the other worker processes (a no-op without fcntl)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def version(path):
+        try:
+            stat = os.stat(path)
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def catch_up(self):
+        """Load the snapshot if it changed (first use, or another worker compacted), then replay new journal lines"""
+        snapshot_version = self.version(self.path)
+        if not self.loaded or snapshot_version != self.snapshot_version:
+            self.load_snapshot()
+            self.snapshot_version = snapshot_version
+            self.journal_offset = 0
+            self.journal_entries = 0
+            self.loaded = True
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self.journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line still being written has no newline yet
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self.apply(json.loads(line))
+                self.journal_entries += 1
+        self.journal_offset += end
+
+    def load_snapshot(self):
+        self.nodes = {}
+        self.roots = Thread()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                comments = json.load(f).get('comments', [])
+        except (FileNotFoundError, ValueError):
+            comments = []
+
+        def add_all(comments, thread):
+            # Saved newest first; threads keep them oldest first
+            for comment in reversed(comments):
+                replies = comment.get('replies') or []
+                node = self.insert(comment, thread)
+                add_all(replies, node['children'])
+
+        add_all(comments, self.roots)
+
+    def compact(self):
+        """Fold the journal into a new snapshot (caller holds both locks)"""
+        snapshot = {'comments': [self.to_comment(node) for node in self.roots.newest()[0]]}
+        temp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self.roots.prune()
+        for node in self.nodes.values():
+            node['children'].prune()
+        # Readers that see the new snapshot start the journal from zero
+        open(self.journal_path, 'wb').close()
+        self.snapshot_version = self.version(self.path)
+        self.journal_offset = 0
+        self.journal_entries = 0
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_comment_store(path='comments.json', compact_every=200):
+    """Shared CommentStore for the path"""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = CommentStore(path, compact_every=compact_every)
+        return _stores[path]
@@ -0,0 +1,175 @@
+"""
+Background cleaning jobs - a bounded queue in front of worker processes.
+
+Jobs keep running after the request that submitted them returns. Workers
+report their stage through a multiprocessing queue that a listener thread
+copies into the job table, so status polling never touches the workers.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from your_cleaning_script import clean_file
+
+# Set in each worker process by _init_worker
+_progress_queue = None
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+def _run_job(job_id, cleaner_class, file_path, compact, engine, master_path, sku_match, collect_metrics):
+    """Runs in a worker process -> (data, memory_report, seconds, match_report, metrics observed)"""
+    def report(stage, progress):
+        _progress_queue.put((job_id, stage, progress))
+
+    report('reading', 0.1)
+    # Jobs already run on a pool, so sheets are read in this worker rather than on a nested pool
+    (data, memory_report, seconds, match_report), records = metrics.collected(collect_metrics, clean_file, cleaner_class, file_path,
+                                                                compact, engine, sheet_workers=1, progress=report,
+                                                                master_path=master_path, sku_match=sku_match)
+    report('storing', 0.9)
+    return data, memory_report, seconds, match_report, records
+
+class QueueFull(Exception):
+    pass
+
+class JobQueue:
+    """
+    workers       worker processes cleaning files
+    max_pending   queued + running jobs accepted before submit raises QueueFull
+    on_done       on_done(job, data, memory_report, match_report) -> dict merged into the
+                  finished job (e.g. the download session)
+    keep_finished finished jobs kept for status polling
+    """
+    def __init__(self, workers=2, max_pending=20, on_done=None, keep_finished=200):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.on_done = on_done
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.progress_queue = None
+
+    def start(self):
+        if self.executor is not None:
+            return
+        self.progress_queue = multiprocessing.Queue()
+        self.executor = self.new_executor()
+        threading.Thread(target=self.listen, daemon=True).start()
+
+    def new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.progress_queue,))
+
+    def submit_job(self, *args):
+        """Hand a job to the pool, starting a new pool once when a dead worker broke the old one"""
+        try:
+            return self.executor.submit(_run_job, *args)
+        except BrokenProcessPool:
+            # The jobs that were on the broken pool have failed already (see finish)
+            print("Cleaning job pool broken, starting a new one")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.new_executor()
+            return self.executor.submit(_run_job, *args)
+
+    def submit(self, cleaner_class, file_path, marketplace, filename, compact=False, engine='c',
+               master_path='product.csv', sku_match=None, context=None):
+        """
+        Queue a file for cleaning and return its job id. Once queued, the job
+        deletes file_path when it ends; when submit raises, the caller still
+        owns it. context is kept for on_done and never shown.
+        """
+        self.start()
+        with self.lock:
+            pending = sum(1 for job in self.jobs.values() if job['status'] in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} cleaning jobs are already waiting")
+            self.prune()
+            job_id = uuid.uuid4().hex[:12]
+            future = self.submit_job(job_id, cleaner_class, file_path, compact, engine, master_path, sku_match,
+                                     metrics.enabled())
+            # Only a job the pool took is listed, so a failed submit never counts as pending
+            self.jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'stage': 'queued',
+                'progress': 0.0,
+                'marketplace': marketplace,
+                'filename': filename,
+                'file_path': file_path,
+                'context': context or {},
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+        # Outside the lock - a future that is already done runs finish right here
+        future.add_done_callback(lambda future: self.finish(job_id, future))
+        return job_id
+
+    def listen(self):
+        """Copy worker progress into the job table"""
+        while True:
+            try:
+                job_id, stage, progress = self.progress_queue.get()
+            except (EOFError, OSError):
+                return
+            with self.lock:
+                job = self.jobs.get(job_id)
+                # A late message must not reopen a finished job
+                if job is None or job['status'] not in ('queued', 'running'):
+                    continue
+                if job['status'] == 'queued':
+                    job['status'] = 'running'
+                    job['started_at'] = time.time()
+                job['stage'] = stage
+                job['progress'] = progress
+
+    def finish(self, job_id, future):
+        job = self.jobs[job_id]
+        try:
+            data, memory_report, seconds, match_report, records = future.result()
+            metrics.replay(records)
+            result = self.on_done(job, data, memory_report, match_report) if self.on_done else {}
+            result['seconds'] = round(seconds, 3)
+            update = {'status': 'done', 'stage': 'done', 'progress': 1.0, 'result': result}
+        except Exception as e:
+            print(f"Error in cleaning job {job_id}: {e}")
+            traceback.print_exc()
+            update = {'status': 'failed', 'stage': 'failed', 'error': str(e)}
+        finally:
+            if os.path.exists(job['file_path']):
+                os.unlink(job['file_path'])
+        with self.lock:
+            job.update(update)
+            job['finished_at'] = time.time()
+            if job['started_at'] is None:
+                job['started_at'] = job['finished_at']
+
+    def status(self, job_id):
+        """Public view of a job, or None"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {key: value for key, value in job.items() if key not in ('file_path', 'context')}
+
+    def list(self):
+        with self.lock:
+            job_ids = list(self.jobs)
+        return [self.status(job_id) for job_id in reversed(job_ids)]
+
+    def prune(self):
+        """Drop the oldest finished jobs past keep_finished (caller holds the lock)"""
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
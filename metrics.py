@@ -0,0 +1,218 @@
+"""
+Metrics kept in memory and served in the Prometheus text format at /metrics.
+
+Cleaners time every stage of a clean (see StageTimer) and the app times every
+request by route. Nothing is measured until enable(): stage_timer() hands out
+NULL_TIMER, whose calls do nothing, and the request hooks return at once.
+
+Cleans that run in worker processes (batch uploads, background jobs) go
+through collected(), which sends the worker's observations back with the
+result for the parent to replay(), so /metrics shows them too. Every gunicorn
+worker keeps its own registry, like the rest of the in-process state.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+
+MB = 2**20
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# A stage can free memory, so the buckets go below zero
+MEMORY_BUCKETS = tuple(-size * MB for size in (1024, 256, 64, 16)) + (0,) + \
+    tuple(size * MB for size in (16, 64, 256, 1024, 4096))
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # label values -> total
+        self.series = {}
+
+    def observe(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def lines(self):
+        for labels, total in sorted(self.series.items()):
+            yield f'{self.name}{format_labels(self.labels, labels)} {format_value(total)}'
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [count per bucket..., sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * len(self.buckets) + [0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def lines(self):
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels(self.labels, labels, le=format_value(bound))} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, labels)} {format_value(series[-1])}'
+            yield f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}'
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self.metrics[name].observe(labels, value)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for metric in self.metrics.values():
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(metric.lines())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+REGISTRY.register(Histogram('cleaner_stage_seconds', 'Wall time of each cleaning stage', ['marketplace', 'stage']))
+REGISTRY.register(Histogram('cleaner_stage_memory_delta_bytes', 'Change in resident memory over each cleaning stage',
+                            ['marketplace', 'stage'], buckets=MEMORY_BUCKETS))
+REGISTRY.register(Counter('cleaner_stage_rows_in_total', 'Rows going into each cleaning stage', ['marketplace', 'stage']))
+REGISTRY.register(Counter('cleaner_stage_rows_out_total', 'Rows coming out of each cleaning stage', ['marketplace', 'stage']))
+REGISTRY.register(Histogram('cleaner_clean_seconds', 'Wall time of a whole clean', ['marketplace']))
+REGISTRY.register(Histogram('http_request_duration_seconds', 'Time to answer a request, by route',
+                            ['method', 'route', 'status']))
+
+_enabled = False
+# Observations of a collected() call, sent back to the parent process
+_buffer = None
+
+def enable(on=True):
+    global _enabled
+    _enabled = bool(on)
+
+def enabled():
+    return _enabled
+
+def observe(name, labels, value):
+    if _buffer is not None:
+        _buffer.append((name, labels, value))
+    else:
+        REGISTRY.observe(name, labels, value)
+
+def render():
+    return REGISTRY.render()
+
+def collected(enabled, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) in a worker process -> (its result, the
+    observations it made). enabled is the parent's enabled().
+    """
+    global _buffer
+    enable(enabled)
+    _buffer = [] if enabled else None
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        records, _buffer = _buffer or [], None
+    return result, records
+
+def replay(records):
+    """Add the observations a collected() call made in a worker"""
+    for name, labels, value in records:
+        REGISTRY.observe(name, tuple(labels), value)
+
+def observe_request(method, route, status, seconds):
+    observe('http_request_duration_seconds', (method, route, str(status)), seconds)
+
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def resident_memory():
+    """Resident memory of this process in bytes, None where /proc is missing"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _page_size
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StageTimer:
+    """
+    Times the stages of one clean. Each mark() records the stage that ran
+    since the previous mark (or restart()): wall time, resident memory delta
+    and rows in / out. finish() records the whole clean.
+    """
+    def __init__(self, marketplace):
+        self.marketplace = marketplace
+        self.started = self.last = time.perf_counter()
+        self.memory = resident_memory()
+
+    def restart(self):
+        self.last = time.perf_counter()
+        self.memory = resident_memory()
+
+    def mark(self, stage, rows_in, rows_out):
+        now = time.perf_counter()
+        memory = resident_memory()
+        labels = (self.marketplace, stage)
+        observe('cleaner_stage_seconds', labels, now - self.last)
+        if memory is not None and self.memory is not None:
+            observe('cleaner_stage_memory_delta_bytes', labels, memory - self.memory)
+        if rows_in is not None:
+            observe('cleaner_stage_rows_in_total', labels, rows_in)
+        observe('cleaner_stage_rows_out_total', labels, rows_out)
+        self.last = now
+        self.memory = memory
+
+    def finish(self):
+        observe('cleaner_clean_seconds', (self.marketplace,), time.perf_counter() - self.started)
+
+class NullTimer:
+    """StageTimer stand-in while metrics are off"""
+    def restart(self):
+        pass
+
+    def mark(self, stage, rows_in, rows_out):
+        pass
+
+    def finish(self):
+        pass
+
+NULL_TIMER = NullTimer()
+
+def stage_timer(marketplace):
+    """A StageTimer for one clean, or NULL_TIMER when metrics are off"""
+    return StageTimer(marketplace) if _enabled else NULL_TIMER
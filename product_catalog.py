@@ -0,0 +1,339 @@
+"""
+product.csv held in memory per process, with its filter facets kept sorted
+and an inverted index for search.
+
+The file is read once and again only when its mtime or size changes (another
+worker wrote it). Products added through the catalog are appended to the
+file and merged into the facets, the SKU index and the search index instead
+of recomputing them over the whole catalog. Appends hold an exclusive lock
+on product.csv.lock and first read what other workers appended, so no
+worker misses their rows or lets their SKUs in twice.
+
+The catalog can also sit on a SQLite product store (a .db path, see
+product_store), where adds are row inserts, other workers' adds are read
+incrementally and filters are indexed lookups.
+"""
+import contextlib
+import heapq
+import threading
+from collections import defaultdict
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock (Windows): appends are only serialized within a process
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from product_store import PRODUCT_COLUMNS, is_product_store, get_product_store
+from your_cleaning_script import product_version
+
+# Facet name in the API -> product.csv column
+FACETS = {
+    'brands': 'Brand',
+    'categories': 'Category',
+    'sub_categories': 'Sub-Category',
+    'skus': 'SKU'
+}
+
+# product.csv column -> its facet
+FACET_NAMES = {column: name for name, column in FACETS.items()}
+
+# How much a match in each column counts when ranking search results
+SEARCH_WEIGHTS = {
+    'SKU': 4,
+    'Partner SKU': 4,
+    'Brand': 3,
+    'Product Titles': 2,
+    'Category': 1,
+    'Sub-Category': 1
+}
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path + '.lock' - other processes wait for it"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+# Match kinds, best first: the whole token, its start, anywhere inside it
+EXACT, PREFIX, SUBSTRING = 3, 2, 1
+
+class ProductSearchIndex:
+    """
+    Inverted index over the search columns. Cell text is lowercased and split
+    on whitespace, and postings map each (column, token) to the rows holding
+    it. A query term (which has no spaces) is in a cell exactly when it is
+    inside one of the cell's tokens, so this finds the same rows as a
+    substring search. The tokens containing a term are found through a
+    trigram index over the vocabulary rather than by scanning the rows.
+    """
+    def __init__(self):
+        self.rows = 0
+        # column -> token -> [row]
+        self.postings = {column: defaultdict(list) for column in SEARCH_WEIGHTS}
+        # token -> columns it appears in
+        self.vocabulary = {}
+        # trigram -> tokens containing it
+        self.trigrams = defaultdict(set)
+
+    def add(self, df):
+        """Index the rows of df, which continue the rows indexed so far"""
+        start = self.rows
+        for column, postings in self.postings.items():
+            if column not in df.columns:
+                continue
+            # Tokenize each distinct cell text once (brands and categories repeat a lot)
+            codes, texts = pd.factorize(df[column].astype(str).str.lower())
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(texts) + 1))
+            for code, text in enumerate(texts):
+                rows = (order[bounds[code]:bounds[code + 1]] + start).tolist()
+                for token in set(text.split()):
+                    postings[token].extend(rows)
+                    columns = self.vocabulary.get(token)
+                    if columns is None:
+                        columns = self.vocabulary[token] = set()
+                        for i in range(len(token) - 2):
+                            self.trigrams[token[i:i + 3]].add(token)
+                    columns.add(column)
+        self.rows = start + len(df)
+
+    def tokens_containing(self, term):
+        if len(term) < 3:
+            return [token for token in self.vocabulary if term in token]
+        grams = sorted((self.trigrams.get(term[i:i + 3], set()) for i in range(len(term) - 2)), key=len)
+        return [token for token in set.intersection(*grams) if term in token]
+
+    def search(self, query):
+        """{row: score} for the rows matching every term of the query"""
+        scores = None
+        for term in query.lower().split():
+            term_scores = {}
+            for token in self.tokens_containing(term):
+                kind = EXACT if token == term else PREFIX if token.startswith(term) else SUBSTRING
+                for column in self.vocabulary[token]:
+                    score = kind * SEARCH_WEIGHTS[column]
+                    for row in self.postings[column][token]:
+                        if term_scores.get(row, 0) < score:
+                            term_scores[row] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {row: scores[row] + score for row, score in term_scores.items() if row in scores}
+            if not scores:
+                break
+        return scores or {}
+
+class ProductCatalog:
+    """path is product.csv or a SQLite product store"""
+    def __init__(self, path):
+        self.path = path
+        self.store = get_product_store(path) if is_product_store(path) else None
+        self.version = None
+        self.df = pd.DataFrame(columns=PRODUCT_COLUMNS)
+        # Store id of each row of df (store catalogs only)
+        self.ids = np.array([], dtype=np.int64)
+        self.facets = {name: [] for name in FACETS}
+        self.facet_sets = {name: set() for name in FACETS}
+        self.search_index = ProductSearchIndex()
+        # Stripped SKUs of every product, for duplicate checks
+        self.skus = set()
+        self.lock = threading.RLock()
+
+    @property
+    def exists(self):
+        return self.version is not None
+
+    def refresh(self):
+        """Reload the products if they changed since the last load"""
+        with self.lock:
+            version = product_version(self.path)
+            if version == self.version:
+                return self
+            if self.store is not None and self.version is not None and self.version[:2] == version[:2]:
+                # Same store generation: only rows were added
+                rows = self.store.read_frame(after_id=self.version[2], last_id=version[2], with_ids=True)
+                self.ids = np.concatenate([self.ids, rows.index.to_numpy()])
+                self.append(rows.reset_index(drop=True))
+                self.version = version
+                return self
+            if version is None:
+                self.df = pd.DataFrame(columns=PRODUCT_COLUMNS)
+            elif self.store is not None:
+                rows = self.store.read_frame(last_id=version[2], with_ids=True)
+                self.ids = rows.index.to_numpy()
+                self.df = rows.reset_index(drop=True)
+            else:
+                self.df = pd.read_csv(self.path)
+            for name, column in FACETS.items():
+                values = self.df[column].dropna().unique().tolist() if column in self.df.columns else []
+                self.facets[name] = sorted(values)
+                self.facet_sets[name] = set(values)
+            self.search_index = ProductSearchIndex()
+            self.search_index.add(self.df)
+            self.skus = set(self.df['SKU'].astype(str).str.strip()) if 'SKU' in self.df.columns else set()
+            self.version = version
+        return self
+
+    def add(self, rows, unique=False):
+        """
+        Add rows (a DataFrame) -> number added. unique=True skips SKUs that
+        are already in the catalog. Rows are appended to product.csv or
+        inserted into the store.
+        """
+        with self.lock:
+            if self.store is not None:
+                added = self.store.add(rows, unique=unique)
+                # Reads our rows and any another worker inserted
+                self.refresh()
+                return added
+            rows = self.write_rows(rows, unique=unique)
+            if len(rows):
+                self.append(rows)
+            return len(rows)
+
+    def import_chunks(self, chunks):
+        """
+        Add products from an iterable of DataFrames (e.g. read_csv chunks)
+        -> (added, skipped). Rows whose stripped SKU is in the catalog or
+        came earlier in the import are skipped. Each chunk is written as it
+        arrives and the in-memory catalog is extended once at the end.
+        """
+        with self.lock:
+            self.refresh()
+            seen = set()
+            added = skipped = 0
+            accepted = []
+            for chunk in chunks:
+                fresh = []
+                for sku in chunk['SKU'].astype(str).str.strip().tolist():
+                    fresh.append(sku not in self.skus and sku not in seen)
+                    seen.add(sku)
+                rows = chunk[fresh]
+                skipped += len(chunk) - len(rows)
+                if not len(rows):
+                    continue
+                if self.store is not None:
+                    # The store checks again in its transaction (another worker may have added them)
+                    inserted = self.store.add(rows, unique=True)
+                    skipped += len(rows) - inserted
+                    added += inserted
+                else:
+                    written = self.write_rows(rows, unique=True, pending=accepted)
+                    skipped += len(rows) - len(written)
+                    added += len(written)
+                    if len(written):
+                        accepted.append(written)
+            if self.store is not None:
+                self.refresh()
+            elif accepted:
+                self.append(pd.concat(accepted, ignore_index=True))
+            return added, skipped
+
+    def write_rows(self, rows, unique=False, pending=None):
+        """
+        Append rows to product.csv in the file's column order (columns the
+        file lacks are dropped) -> the rows as written. A new file gets the
+        product columns and a header. unique=True drops SKUs already in the
+        catalog.
+
+        The file stays locked from the version check to the write. If another
+        worker appended since our last read, the catalog is reloaded first;
+        the reload also reads rows we wrote but have not merged yet, so the
+        pending list of them is emptied.
+        """
+        with file_lock(self.path):
+            if product_version(self.path) != self.version:
+                self.refresh()
+                if pending:
+                    pending.clear()
+            if unique:
+                rows = rows[[str(sku).strip() not in self.skus for sku in rows['SKU']]]
+            if not len(rows):
+                return rows
+            new_file = self.version is None
+            rows = rows.reindex(columns=PRODUCT_COLUMNS if new_file else self.df.columns)
+            with open(self.path, 'a+b') as f:
+                if f.tell() > 0:
+                    f.seek(-1, 2)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+                f.write(rows.to_csv(header=new_file, index=False).encode('utf-8'))
+            # Only our rows went in since the version check
+            self.version = product_version(self.path)
+        return rows
+
+    def append(self, rows):
+        """Merge added rows into the frame, facets, SKU index and search index"""
+        self.df = pd.concat([self.df, rows], ignore_index=True)
+        self.search_index.add(self.df.iloc[self.search_index.rows:])
+        if 'SKU' in rows.columns:
+            self.skus.update(rows['SKU'].astype(str).str.strip())
+        for name, column in FACETS.items():
+            if column not in rows.columns:
+                continue
+            added = sorted(set(rows[column].dropna().unique().tolist()) - self.facet_sets[name])
+            if added:
+                self.facets[name] = list(heapq.merge(self.facets[name], added))
+                self.facet_sets[name].update(added)
+
+    def has_sku(self, sku):
+        """True when a product with this SKU exists (an indexed lookup on a store)"""
+        with self.lock:
+            if self.store is not None:
+                return self.store.exists('SKU', sku)
+            return str(sku).strip() in self.skus
+
+    def search(self, query):
+        """{row position: score} for products matching every term of the query"""
+        with self.lock:
+            return self.search_index.search(query)
+
+    def filter(self, patterns):
+        """
+        Products whose value contains the pattern (case-insensitive, as
+        str.contains) in each column of patterns ({column: pattern}, empty
+        patterns are ignored). On a store the patterns are matched against
+        the column's facet values and the rows found with an indexed lookup
+        instead of a scan of every product.
+        """
+        with self.lock:
+            patterns = {column: pattern for column, pattern in patterns.items() if pattern}
+            df = self.df
+            if self.store is None or not patterns or self.version is None:
+                for column, pattern in patterns.items():
+                    df = df[df[column].astype(str).str.contains(pattern, case=False, na=False)]
+                return df
+            values = {}
+            for column, pattern in patterns.items():
+                facet = pd.Series(self.facets[FACET_NAMES[column]], dtype=object).astype(str)
+                values[column] = facet[facet.str.contains(pattern, case=False, na=False)].tolist()
+            # Only ids we loaded: up to our last id, and rows are never deleted
+            # short of a replacing import (after which no such id is left)
+            ids = self.store.find_ids(values, last_id=self.version[2])
+            return df.iloc[np.searchsorted(self.ids, ids)]
+
+    def filters(self):
+        """Facet lists as the product API returns them"""
+        with self.lock:
+            return dict(self.facets)
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_product_catalog(path='product.csv'):
+    """Shared catalog for the path (product.csv or a SQLite store), reloaded if it changed"""
+    with _catalogs_lock:
+        if path not in _catalogs:
+            _catalogs[path] = ProductCatalog(path)
+        catalog = _catalogs[path]
+    return catalog.refresh()
@@ -0,0 +1,263 @@
+"""
+Product master data in a local SQLite database, as an alternative to
+product.csv.
+
+The database runs in WAL mode, so readers keep working while another worker
+writes, and every write is a short transaction that inserts just the new
+rows instead of rewriting the whole file. SKU, Partner SKU, Brand,
+Category and Sub-Category are indexed. Readers stay current by reading only
+the rows past the last id they have seen (see version()). SKUs are stored and
+looked up stripped, so ' ABC ' and 'ABC' are one SKU here as in the CSV
+catalog.
+
+    python product_store.py import product.csv product.db
+    python product_store.py export product.db product.csv
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+PRODUCT_COLUMNS = ['Brand', 'Category', 'Sub-Category', 'Product Titles', 'SKU', 'Partner SKU']
+
+INDEXED_COLUMNS = ['SKU', 'Partner SKU', 'Brand', 'Category', 'Sub-Category']
+
+STORE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# Surrounding whitespace is not part of a SKU (as for ProductCatalog's duplicate checks)
+STRIPPED_COLUMNS = ['SKU']
+
+# store_info flag of a store whose SKUs are all stripped
+SKUS_STRIPPED = 'skus_stripped'
+
+def is_product_store(path):
+    """True when the product source is a SQLite store rather than a CSV"""
+    return str(path).lower().endswith(STORE_EXTENSIONS)
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+def to_text(value):
+    """Cell as stored: text, or None for a missing value"""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA:
+        return None
+    return str(value)
+
+def to_stored(column, value):
+    """Cell of a column as stored, stripped for STRIPPED_COLUMNS"""
+    text = to_text(value)
+    if text is not None and column in STRIPPED_COLUMNS:
+        return text.strip()
+    return text
+
+class ProductStore:
+    """
+    path      SQLite database file (created when missing)
+    seed_csv  product CSV imported when the database is first created
+    """
+    def __init__(self, path, seed_csv=None):
+        self.path = path
+        self.local = threading.local()
+        created = not os.path.exists(path)
+        conn = self.connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        columns = ', '.join(f'{quote(col)} TEXT' for col in PRODUCT_COLUMNS)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns})')
+        for col in INDEXED_COLUMNS:
+            name = 'products_' + col.lower().replace(' ', '_').replace('-', '_')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON products ({quote(col)})')
+        conn.execute('CREATE TABLE IF NOT EXISTS store_info (name TEXT PRIMARY KEY, value TEXT)')
+        if created:
+            # Every insert strips SKUs, so a new store never needs strip_stored
+            conn.execute('INSERT OR REPLACE INTO store_info VALUES (?, ?)', (SKUS_STRIPPED, '1'))
+            if seed_csv and os.path.exists(seed_csv):
+                self.import_csv(seed_csv)
+        elif not conn.execute('SELECT 1 FROM store_info WHERE name = ?', (SKUS_STRIPPED,)).fetchone():
+            self.strip_stored()
+
+    def strip_stored(self):
+        """
+        Strip the SKUs of a store written before they were stripped on insert.
+        Runs once per store: it then sets the SKUS_STRIPPED flag that later
+        opens check instead.
+        """
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            changed = 0
+            for col in STRIPPED_COLUMNS:
+                changed += conn.execute(f"UPDATE products SET {quote(col)} = trim({quote(col)}, ' \t\r\n') "
+                                        f"WHERE {quote(col)} != trim({quote(col)}, ' \t\r\n')").rowcount
+            if changed:
+                # Values changed in place: readers must reload everything
+                generation = conn.execute('PRAGMA user_version').fetchone()[0]
+                conn.execute(f'PRAGMA user_version = {generation + 1}')
+            conn.execute('INSERT OR REPLACE INTO store_info VALUES (?, ?)', (SKUS_STRIPPED, '1'))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def connect(self):
+        """Connection of the calling thread (reopened after a fork)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def version(self):
+        """
+        ('sqlite', generation, last id). Adds raise the last id, and a
+        replacing import raises the generation, after which readers must
+        reload everything. Both are read in one transaction, so a replacing
+        import between them cannot pair the old generation with new ids.
+        """
+        conn = self.connect()
+        conn.execute('BEGIN')
+        try:
+            generation = conn.execute('PRAGMA user_version').fetchone()[0]
+            last_id = conn.execute('SELECT max(id) FROM products').fetchone()[0] or 0
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return ('sqlite', generation, last_id)
+
+    def count(self):
+        return self.connect().execute('SELECT count(*) FROM products').fetchone()[0]
+
+    def read_frame(self, after_id=0, last_id=None, with_ids=False):
+        """
+        Products with an id past after_id (and up to last_id, the last id of
+        the version the caller read), in insertion order (NaN where missing).
+        with_ids=True indexes the frame by product id.
+        """
+        columns = ', '.join(quote(col) for col in ['id'] + PRODUCT_COLUMNS)
+        sql = f'SELECT {columns} FROM products WHERE id > ?'
+        params = [after_id]
+        if last_id is not None:
+            sql += ' AND id <= ?'
+            params.append(last_id)
+        df = pd.read_sql_query(sql + ' ORDER BY id', self.connect(), params=params, index_col='id')
+        if not with_ids:
+            df = df.reset_index(drop=True)
+        return df.fillna(np.nan)
+
+    def exists(self, column, value):
+        """Indexed check for a value in one of the INDEXED_COLUMNS"""
+        if column not in INDEXED_COLUMNS:
+            raise ValueError(f"'{column}' is not indexed, use one of {INDEXED_COLUMNS}")
+        row = self.connect().execute(f'SELECT 1 FROM products WHERE {quote(column)} = ? LIMIT 1',
+                                     (to_stored(column, value),)).fetchone()
+        return row is not None
+
+    def find_ids(self, values, last_id=None):
+        """
+        Ids (ascending, up to last_id) of the products whose value in each
+        column of values ({column: list of values}) is one of the listed
+        ones - an indexed lookup, no scan of the table.
+        """
+        conditions, params = [], []
+        for column, column_values in values.items():
+            if column not in INDEXED_COLUMNS:
+                raise ValueError(f"'{column}' is not indexed, use one of {INDEXED_COLUMNS}")
+            # One JSON parameter, however many values
+            conditions.append(f'{quote(column)} IN (SELECT value FROM json_each(?))')
+            params.append(json.dumps([to_stored(column, value) for value in column_values]))
+        if last_id is not None:
+            conditions.append('id <= ?')
+            params.append(last_id)
+        where = ' AND '.join(conditions) or '1'
+        rows = self.connect().execute(f'SELECT id FROM products WHERE {where} ORDER BY id', params).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def add(self, rows, unique=False):
+        """
+        Insert the rows of a DataFrame in one transaction -> rows inserted.
+        unique=True skips rows whose SKU is already stored, checked inside
+        the write transaction so concurrent workers cannot both add a SKU.
+        """
+        values = [[to_stored(col, row.get(col)) for col in PRODUCT_COLUMNS] for row in rows.to_dict('records')]
+        columns = ', '.join(quote(col) for col in PRODUCT_COLUMNS)
+        placeholders = ', '.join('?' for _ in PRODUCT_COLUMNS)
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            inserted = 0
+            sku = PRODUCT_COLUMNS.index('SKU')
+            for row in values:
+                if unique and conn.execute('SELECT 1 FROM products WHERE SKU = ? LIMIT 1', (row[sku],)).fetchone():
+                    continue
+                conn.execute(f'INSERT INTO products ({columns}) VALUES ({placeholders})', row)
+                inserted += 1
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return inserted
+
+    def import_csv(self, csv_path, replace=True):
+        """Load a product CSV (replacing the stored products by default) -> rows imported"""
+        df = pd.read_csv(csv_path, dtype=str)
+        missing = [col for col in PRODUCT_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f'Missing columns: {", ".join(missing)}')
+        if not replace:
+            return self.add(df)
+        columns = ', '.join(quote(col) for col in PRODUCT_COLUMNS)
+        placeholders = ', '.join('?' for _ in PRODUCT_COLUMNS)
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            generation = conn.execute('PRAGMA user_version').fetchone()[0]
+            conn.execute('DELETE FROM products')
+            conn.executemany(f'INSERT INTO products ({columns}) VALUES ({placeholders})',
+                             ([to_stored(col, value) for col, value in zip(PRODUCT_COLUMNS, row)]
+                              for row in df[PRODUCT_COLUMNS].itertuples(index=False)))
+            conn.execute(f'PRAGMA user_version = {generation + 1}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(df)
+
+    def export_csv(self, csv_path):
+        """Write the products in product.csv format -> rows exported"""
+        df = self.read_frame()
+        df.to_csv(csv_path, index=False)
+        return len(df)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_product_store(path, seed_csv=None):
+    """Shared ProductStore for the path"""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ProductStore(path, seed_csv=seed_csv)
+        return _stores[path]
+
+def main():
+    parser = argparse.ArgumentParser(description='Move product master data between product.csv and a SQLite store')
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('source')
+    parser.add_argument('target')
+    parser.add_argument('--append', action='store_true', help='import: add to the stored products instead of replacing them')
+    args = parser.parse_args()
+
+    if args.action == 'import':
+        count = get_product_store(args.target).import_csv(args.source, replace=not args.append)
+        print(f"Imported {count} products from {args.source} into {args.target}")
+    else:
+        count = get_product_store(args.source).export_csv(args.target)
+        print(f"Exported {count} products from {args.source} to {args.target}")
+
+if __name__ == '__main__':
+    main()
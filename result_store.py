@@ -0,0 +1,363 @@
+"""
+Cleaned results shared by every app worker.
+
+Each session is written once to a local directory as a compressed Arrow
+(feather) file, which all worker processes can read. Each process also keeps
+its recently used frames in a bounded LRU so repeat reads skip the disk. An
+entry is dropped once it has been idle for longer than the TTL, and the
+least recently used files are deleted once the directory is over its byte
+limit. Frames are only ever read back from Arrow files, never unpickled,
+so nothing in the spill directory can run code in the app.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+META_KEY = b'result_store'
+
+def frame_to_table(data, meta):
+    """
+    Arrow table for a cleaned frame. Object columns that mix Python types
+    (the '' left by fillna(''), QTY as '2' and 2) are stored as a type code
+    column plus one typed column per type, listed in the metadata, as is the
+    storage of string dtype columns (Arrow reads them all back as
+    string[python]). Raises ValueError when a column has no lossless Arrow form.
+    """
+    data = data.reset_index(drop=True)
+    split_columns = []
+    string_columns = [[col, data[col].dtype.storage] for col in data.columns
+                      if isinstance(data[col].dtype, pd.StringDtype)]
+    try:
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        data = data.copy(deep=False)
+        for col in list(data.columns):
+            values = data[col]
+            if values.dtype != object:
+                continue
+            try:
+                pa.array(values, from_pandas=True)
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+            codes, kinds = pd.factorize(values.map(type))
+            parts = []
+            for code in range(len(kinds)):
+                part = f'__{len(split_columns)}_{code}__'
+                data[part] = values.where(codes == code, None)
+                parts.append(part)
+            data[col] = codes.astype(np.int8)
+            split_columns.append([col, parts])
+        try:
+            table = pa.Table.from_pandas(data, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(str(e))
+    stored = dict(meta, split_columns=split_columns, string_columns=string_columns)
+    metadata = dict(table.schema.metadata or {})
+    metadata[META_KEY] = json.dumps(stored).encode('utf-8')
+    return table.replace_schema_metadata(metadata)
+
+def table_to_frame(table):
+    """Inverse of frame_to_table -> (frame, meta)"""
+    meta = json.loads(table.schema.metadata[META_KEY])
+    split_columns = meta.pop('split_columns')
+    string_columns = meta.pop('string_columns', [])
+    data = table.to_pandas()
+    for col, storage in string_columns:
+        if storage == 'pyarrow':
+            # Straight from the Arrow column - no copy through Python strings
+            data[col] = pd.arrays.ArrowStringArray(table.column(col))
+    for col, parts in split_columns:
+        codes = data[col].to_numpy()
+        values = np.empty(len(data), dtype=object)
+        for code, part in enumerate(parts):
+            mask = codes == code
+            values[mask] = table.column(part).to_pandas(integer_object_nulls=True).astype(object).to_numpy()[mask]
+            del data[part]
+        data[col] = values
+    return data, meta
+
+class ResultStore:
+    """
+    directory     shared spill directory (every worker must see the same one)
+    max_sessions  frames kept in memory per process
+    max_bytes     memory budget for those frames per process
+    disk_bytes    size limit of the spill directory
+    ttl           seconds a session may sit unused before it expires
+    """
+    def __init__(self, directory, max_sessions=20, max_bytes=512 * 2**20, disk_bytes=2 * 2**30, ttl=2 * 3600):
+        self.directory = directory
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        # session_id -> (frame, meta, bytes, last access)
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0,
+                         'disk_evictions': 0, 'expired': 0, 'spill_errors': 0}
+        # Private to this user when the store creates it
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def put(self, data, meta):
+        """Store a cleaned frame -> new session id"""
+        session_id = str(uuid.uuid4())
+        self.write(session_id, data, meta)
+        self.remember(session_id, data, meta)
+        self.sweep_disk()
+        return session_id
+
+    def get(self, session_id):
+        """(frame, meta) for a session, or None when unknown or expired"""
+        if not self.valid_id(session_id):
+            self.count('misses')
+            return None
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(session_id)
+            if entry is not None and now - entry[3] > self.ttl:
+                self.forget(session_id)
+                self.counters['expired'] += 1
+                entry = None
+            if entry is not None:
+                self.memory[session_id] = entry[:3] + (now,)
+                self.memory.move_to_end(session_id)
+                self.counters['hits'] += 1
+        if entry is not None:
+            self.touch(session_id)
+            return entry[0], entry[1]
+
+        loaded = self.read(session_id)
+        if loaded is None:
+            self.count('misses')
+            return None
+        self.count('disk_hits')
+        self.remember(session_id, *loaded)
+        return loaded
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['memory_sessions'] = len(self.memory)
+            stats['memory_bytes'] = self.memory_bytes
+        files = self.disk_files()
+        stats['disk_sessions'] = len(files)
+        stats['disk_bytes'] = sum(size for _, _, size in files)
+        stats['format'] = 'arrow' if pa is not None else 'memory'
+        return stats
+
+    # ---- memory tier ----
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def remember(self, session_id, data, meta):
+        size = int(data.memory_usage(deep=True).sum())
+        now = time.time()
+        with self.lock:
+            if session_id in self.memory:
+                self.forget(session_id)
+            self.memory[session_id] = (data, meta, size, now)
+            self.memory_bytes += size
+            for old_id, entry in list(self.memory.items()):
+                if now - entry[3] > self.ttl:
+                    self.forget(old_id)
+                    self.counters['expired'] += 1
+            # Always keep the newest frame, even when it alone is over budget
+            while len(self.memory) > 1 and (len(self.memory) > self.max_sessions or self.memory_bytes > self.max_bytes):
+                self.forget(next(iter(self.memory)))
+                self.counters['evictions'] += 1
+
+    def forget(self, session_id):
+        """Drop a frame from memory (caller holds the lock)"""
+        entry = self.memory.pop(session_id)
+        self.memory_bytes -= entry[2]
+
+    # ---- disk tier ----
+
+    @staticmethod
+    def valid_id(session_id):
+        try:
+            return str(uuid.UUID(session_id)) == session_id
+        except ValueError:
+            return False
+
+    def path(self, session_id, ext):
+        return os.path.join(self.directory, f'{session_id}.{ext}')
+
+    def write(self, session_id, data, meta):
+        """Write the spill file atomically so other workers never see half of it"""
+        if pa is None:
+            # Without pyarrow sessions stay in this worker's memory only
+            return
+        temp_path = self.path(session_id, 'tmp')
+        try:
+            feather.write_feather(frame_to_table(data, meta), temp_path)
+            os.replace(temp_path, self.path(session_id, 'arrow'))
+        except Exception as e:
+            # No lossless Arrow form, or the disk is full - still served from memory by this worker
+            logger.warning("Result store: could not spill %s: %s", session_id, e)
+            self.count('spill_errors')
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def read(self, session_id):
+        if pa is None:
+            return None
+        path = self.path(session_id, 'arrow')
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.unlink(path)
+                self.count('expired')
+                return None
+            loaded = table_to_frame(feather.read_table(path))
+        except FileNotFoundError:
+            return None
+        self.touch(session_id)
+        return loaded
+
+    def touch(self, session_id):
+        """Mark a spill file as used so other workers keep it"""
+        try:
+            os.utime(self.path(session_id, 'arrow'))
+        except FileNotFoundError:
+            pass
+
+    def disk_files(self):
+        """[(mtime, path, size)] of the spill files, oldest first"""
+        files = []
+        for name in os.listdir(self.directory):
+            # .pkl files were spilled by older versions - never read, only swept
+            if not name.endswith(('.arrow', '.pkl')):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((info.st_mtime, path, info.st_size))
+        return sorted(files)
+
+    def sweep_disk(self):
+        """Delete expired spill files, then the least recently used past disk_bytes"""
+        files = self.disk_files()
+        total = sum(size for _, _, size in files)
+        now = time.time()
+        for mtime, path, size in files:
+            expired = now - mtime > self.ttl
+            if not expired and total <= self.disk_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.count('expired' if expired else 'disk_evictions')
+
+class ResultCache:
+    """
+    Cleaning results by content key (upload hash, marketplace, cleaner and
+    product.csv versions). Entries are small JSON files beside the store's
+    spill files, so every worker shares them. The frames stay in the
+    ResultStore, and an entry whose session is gone counts as a miss.
+
+    max_entries   entries kept, least recently hit dropped first
+    ttl           seconds an entry is reused after it was written
+    """
+    def __init__(self, store, max_entries=500, ttl=24 * 3600):
+        self.store = store
+        self.directory = os.path.join(store.directory, 'cache')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256('\x1f'.join(map(str, parts)).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        """(entry, (frame, meta)) for a key, or None"""
+        path = self.path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.count('misses')
+            return None
+        stored = None
+        if time.time() - entry['created'] <= self.ttl:
+            stored = self.store.get(entry['session_id'])
+        if stored is None:
+            self.drop(path)
+            self.count('misses')
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.count('hits')
+        return entry, stored
+
+    def put(self, key, session_id, **info):
+        """Remember the session cleaned for a key (info is returned with hits)"""
+        entry = dict(info, session_id=session_id, created=time.time())
+        temp_path = self.path(key) + f'.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self.drop(path)
+            self.count('evictions')
+
+    @staticmethod
+    def drop(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['entries'] = sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+        return stats
@@ -0,0 +1,236 @@
+"""
+Approximate SKU matching for enrichment, for marketplace SKUs that are not
+in the product master exactly as written.
+
+A SKU is first normalized (case, spaces and separators folded) and looked up
+in a hash of the master's normalized SKUs and Partner SKUs. Failing that, a
+'-1' suffix on either side is dropped ('ZE7642-1' for 'ZE7642' and back),
+at a lower confidence. What is still missing is looked up in a trigram index
+over the same keys: candidates sharing the most trigrams are scored by edit
+similarity, so a typo costs a few dictionary lookups, not a scan of the
+master. Each distinct SKU is resolved once however many rows carry it.
+
+Other numeric suffixes are size / colour variants ('TSHIRT-BLK-42' is not
+'TSHIRT-BLK-44'), so they are never dropped and a fuzzy match must keep the
+SKU's numeric suffix as it is.
+"""
+import re
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+# How sure each kind of match is, by master column; a fuzzy match scores its similarity times FUZZY
+CONFIDENCE = {
+    'normalized': {'SKU': 0.95, 'Partner SKU': 0.9},
+    'suffix': {'SKU': 0.85, 'Partner SKU': 0.8}
+}
+FUZZY = 0.9
+
+# Keys shorter than this are only matched after normalizing (one typo in 'AB12' is another product)
+MIN_FUZZY_LENGTH = 5
+# Trigrams shared by more keys than this say little and are not used to find candidates
+MAX_POSTINGS = 5000
+# Candidates (most shared trigrams first) scored per SKU
+CANDIDATES = 10
+# Lookups remembered per matcher (the same unknown SKUs come back file after file)
+MEMO_SIZE = 100000
+
+# Values that stand for a missing SKU
+MISSING = {'', 'nan', 'none', 'null', '<na>'}
+
+# The one suffix dropped to match ('ZE7642-1' is 'ZE7642' listed again)
+SUFFIX = re.compile(r'-1$')
+SEPARATORS = re.compile(r'[\W_]+')
+# A numeric last segment - a variant ('-42', '_2') that a fuzzy match may not change
+VARIANT = re.compile(r'[\W_]+(\d+)$')
+
+def normalize_sku(value):
+    """'  ze-7642_a ' -> 'ZE7642A' ('' for a missing SKU)"""
+    text = str(value).strip()
+    if text.lower() in MISSING:
+        return ''
+    return SEPARATORS.sub('', text.upper())
+
+def normalize_skus(values):
+    """normalize_sku over a Series, vectorized"""
+    text = values.astype(str).str.strip()
+    missing = text.str.lower().isin(MISSING)
+    keys = text.str.upper().str.replace(SEPARATORS, '', regex=True)
+    return keys.mask(missing, '')
+
+def without_suffix(value):
+    """Normalized key of a SKU written with a '-1' suffix, without it ('' for any other SKU)"""
+    text = str(value).strip()
+    if not SUFFIX.search(text):
+        return ''
+    return normalize_sku(text[:-2])
+
+def variant(value):
+    """'TSHIRT-BLK-42' -> '42', None without a numeric suffix (or with just '-1')"""
+    text = str(value).strip()
+    found = VARIANT.search(text)
+    return found.group(1) if found and not SUFFIX.search(text) else None
+
+def trigram_codes(keys, length):
+    """
+    Trigrams of keys of one length as int codes, one row per key. Keys are
+    padded with '^' / '$' and read as ASCII ('?' for anything else, so a
+    character stays one byte).
+    """
+    padded = np.array([f'^{key}$'.encode('ascii', 'replace') for key in keys], dtype=f'S{length + 2}')
+    chars = padded.view(np.uint8).reshape(len(keys), length + 2).astype(np.int64)
+    return chars[:, :-2] << 16 | chars[:, 1:-1] << 8 | chars[:, 2:]
+
+class SkuMatcher:
+    """
+    Index over the normalized keys of a product master.
+
+    df       the master frame (lookups return its row positions)
+    columns  key columns, the first wins when a key is in several
+    """
+    AMBIGUOUS = -2
+
+    def __init__(self, df, columns=('SKU', 'Partner SKU')):
+        # normalized key -> (master row or AMBIGUOUS, column, key as written in the master)
+        self.keys = {}
+        # the same for master keys written with a '-1' suffix, by their key without it
+        self.suffixed = {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+            originals = df[column].tolist()
+            normalized = normalize_skus(df[column]).tolist()
+            for row, (key, original) in enumerate(zip(normalized, originals)):
+                self.add(self.keys, key, row, column, original)
+                self.add(self.suffixed, without_suffix(original), row, column, original)
+        self.key_list = list(self.keys)
+        self.key_lengths = np.fromiter(map(len, self.key_list), dtype=np.int64, count=len(self.key_list))
+        # (SKU, min_confidence) -> lookup result
+        self.memo = {}
+        self.build_postings()
+
+    def add(self, keys, key, row, column, original):
+        if not key:
+            return
+        known = keys.get(key)
+        if known is None:
+            keys[key] = (row, column, original)
+        elif known[1] == column and known[0] != row:
+            # Two products normalize alike - match neither (an earlier column's key wins)
+            keys[key] = (self.AMBIGUOUS, column, None)
+
+    def build_postings(self):
+        """
+        Trigram index as sorted arrays: the ids in key_list having gram
+        gram_codes[i] are gram_ids[gram_starts[i]:gram_starts[i + 1]]
+        """
+        pairs = [np.empty(0, dtype=np.int64)]
+        for length in np.unique(self.key_lengths[self.key_lengths >= MIN_FUZZY_LENGTH]).tolist():
+            ids = np.flatnonzero(self.key_lengths == length)
+            codes = trigram_codes([self.key_list[i] for i in ids], length)
+            pairs.append((codes << 32 | ids[:, None]).ravel())
+        # One entry per (trigram, key), sorted by trigram then key
+        pairs = np.unique(np.concatenate(pairs))
+        grams = pairs >> 32
+        self.gram_ids = (pairs & 0xFFFFFFFF).astype(np.int32)
+        self.gram_codes, self.gram_starts = np.unique(grams, return_index=True)
+        self.gram_starts = np.append(self.gram_starts, len(grams))
+
+    def lookup(self, value, min_confidence):
+        """(master row, kind, confidence, column, matched key) for one SKU, or None"""
+        memo_key = (value, min_confidence)
+        if memo_key not in self.memo:
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            self.memo[memo_key] = self.find(value, min_confidence)
+        return self.memo[memo_key]
+
+    def find(self, value, min_confidence):
+        key = normalize_sku(value)
+        if not key:
+            return None
+        if key in self.keys:
+            return self.sure_match(self.keys[key], 'normalized', min_confidence)
+        # 'ZE7642-1' for 'ZE7642', or 'ZE7642' for 'ZE7642-1'
+        stripped = without_suffix(value)
+        if stripped in self.keys:
+            return self.sure_match(self.keys[stripped], 'suffix', min_confidence)
+        if key in self.suffixed:
+            return self.sure_match(self.suffixed[key], 'suffix', min_confidence)
+        if len(key) < MIN_FUZZY_LENGTH or not len(self.gram_codes):
+            return None
+
+        grams = np.unique(trigram_codes([key], len(key)))
+        at = np.minimum(np.searchsorted(self.gram_codes, grams), len(self.gram_codes) - 1)
+        at = at[self.gram_codes[at] == grams]
+        starts, ends = self.gram_starts[at], self.gram_starts[at + 1]
+        common = ends - starts <= MAX_POSTINGS
+        if not common.any():
+            return None
+        candidates, shared = np.unique(
+            np.concatenate([self.gram_ids[start:end] for start, end in zip(starts[common], ends[common])]),
+            return_counts=True)
+        # A similarity ratio of at least t leaves at most len(key) * (2 - 2t) / (2 - t)
+        # characters unmatched, and each of them breaks at most three trigrams;
+        # it also needs the shorter key to be at least t / (2 - t) of the longer
+        ratio = min_confidence / FUZZY
+        least_shared = len(grams) - 3 * len(key) * (2 - 2 * ratio) / (2 - ratio)
+        lengths = self.key_lengths[candidates]
+        close = (shared >= least_shared) & \
+            (2 * np.minimum(lengths, len(key)) >= ratio * (lengths + len(key)))
+        candidates, shared = candidates[close], shared[close]
+        best, best_score, tied = None, 0.0, False
+        wanted = variant(value)
+        for key_id in candidates[np.argsort(-shared, kind='stable')[:CANDIDATES]].tolist():
+            candidate = self.key_list[key_id]
+            original = self.keys[candidate][2]
+            if original is not None and variant(original) != wanted:
+                continue
+            score = SequenceMatcher(None, key, candidate, autojunk=False).ratio() * FUZZY
+            if score > best_score:
+                best, best_score, tied = candidate, score, False
+            elif score == best_score and best is not None and self.keys[candidate][0] != self.keys[best][0]:
+                tied = True
+        if best is None or tied or best_score < min_confidence:
+            return None
+        row, column, original = self.keys[best]
+        if row == self.AMBIGUOUS:
+            return None
+        return row, 'fuzzy', round(best_score, 3), column, original
+
+    def sure_match(self, found, kind, min_confidence):
+        row, column, original = found
+        confidence = CONFIDENCE[kind][column]
+        if row == self.AMBIGUOUS or confidence < min_confidence:
+            return None
+        return row, kind, confidence, column, original
+
+    def resolve(self, values, positions, min_confidence):
+        """
+        Fill the misses (-1) of exact master positions for values ->
+        (positions, report). The report counts rows per kind of match and
+        lists each SKU matched approximately with its rows.
+        """
+        positions = np.asarray(positions).copy()
+        missing = np.flatnonzero(positions == -1)
+        report = {'exact': int(len(positions) - len(missing)), 'normalized': 0, 'suffix': 0, 'fuzzy': 0,
+                  'unmatched': int(len(missing)), 'matches': []}
+        if not len(missing):
+            return positions, report
+
+        codes, uniques = pd.factorize(pd.Series(values[missing], dtype=object))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for code, value in enumerate(uniques):
+            found = self.lookup(value, min_confidence)
+            if found is None:
+                continue
+            row, kind, confidence, column, original = found
+            rows = missing[order[bounds[code]:bounds[code + 1]]]
+            positions[rows] = row
+            report[kind] += len(rows)
+            report['unmatched'] -= len(rows)
+            report['matches'].append({'sku': value, 'matched': original, 'column': column, 'kind': kind,
+                                      'confidence': confidence, 'rows': rows.tolist()})
+        return positions, report
@@ -14,6 +14,15 @@ document.addEventListener('DOMContentLoaded', function() {
     // Current session ID for download
     let currentSessionId = null;
     
+    // Preview table is virtual: only the rows in view are in the DOM, the rest
+    // is fetched in pages from /api/sessions/<id>/rows while scrolling
+    const previewScroller = document.querySelector('.preview-content');
+    const ROW_BUFFER = 20;
+    const MAX_CACHED_PAGES = 50;
+    const JOB_POLL_INTERVAL = 1000;
+    let preview = null;
+    let renderPending = false;
+    
     // Initialize
     if (marketplaceCards.length > 0) {
         marketplaceCards[0].classList.add('active');
@@ -229,7 +238,12 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: formData
             });
             
-            const result = await response.json();
+            let result = await response.json();
+            
+            if (response.status === 202 && result.success) {
+                // Queued on the server (ASYNC_CLEAN) - wait for the job, then load its session
+                result = await waitForJob(result.status_url);
+            }
             
             loader.style.display = 'none';
             cleanBtn.disabled = false;
@@ -257,6 +271,24 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    async function waitForJob(statusUrl) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+            
+            if (!response.ok || !job.success) {
+                return { success: false, error: job.error || 'Cleaning job not found' };
+            }
+            if (job.status === 'done') {
+                return { success: true, ...job.result };
+            }
+            if (job.status === 'failed') {
+                return { success: false, error: job.error || 'Failed to clean data' };
+            }
+        }
+    }
+    
     function validateFile(file) {
         const maxSize = 16 * 1024 * 1024;
         if (file.size > maxSize) {
@@ -336,80 +368,246 @@ document.addEventListener('DOMContentLoaded', function() {
     function showPreview(data) {
         const previewPlaceholder = document.getElementById('previewPlaceholder');
         const previewContent = document.getElementById('previewContent');
-        const tableHeader = document.getElementById('tableHeader');
-        const tableBody = document.getElementById('tableBody');
         const rowCountBadge = document.getElementById('rowCount');
         
         previewPlaceholder.style.display = 'none';
         previewContent.style.display = 'block';
         
-        const totalRows = data.rows_count || data.all_data.length;
+        const totalRows = data.rows_count || 0;
         rowCountBadge.textContent = `${formatNumber(totalRows)} rows`;
         
+        preview = {
+            sessionId: data.session_id,
+            columns: data.columns,
+            rowsCount: totalRows,
+            pageSize: data.page_size || 100,
+            rowHeight: 41,
+            rowHeightMeasured: false,
+            sort: null,
+            order: 'asc',
+            pages: new Map(),
+            pending: new Set(),
+            generation: 0
+        };
+        
+        // First page comes with the clean response
+        if (data.preview && data.preview.length > 0) {
+            preview.pages.set(0, data.preview);
+        }
+        
+        renderHeader();
+        previewScroller.scrollTop = 0;
+        renderWindow();
+        
+        // Scroll to preview
+        setTimeout(() => {
+            document.querySelector('.preview-section').scrollIntoView({
+                behavior: 'smooth',
+                block: 'start'
+            });
+        }, 300);
+    }
+    
+    function renderHeader() {
+        const tableHeader = document.getElementById('tableHeader');
         tableHeader.innerHTML = '';
-        tableBody.innerHTML = '';
         
-        // Create header
         const headerRow = document.createElement('tr');
-        data.columns.forEach((column, index) => {
+        preview.columns.forEach(column => {
             const th = document.createElement('th');
             th.textContent = column;
-            th.title = column;
+            th.title = `${column} (click to sort)`;
             th.style.minWidth = '120px';
+            th.classList.add('sortable');
+            
+            if (preview.sort === column) {
+                const icon = document.createElement('i');
+                icon.className = `fas ${preview.order === 'asc' ? 'fa-sort-up' : 'fa-sort-down'} ms-2`;
+                th.appendChild(icon);
+            }
+            
+            th.addEventListener('click', () => sortPreview(column));
             headerRow.appendChild(th);
         });
         tableHeader.appendChild(headerRow);
+    }
+    
+    // Click a header: ascending, then descending
+    function sortPreview(column) {
+        if (preview.sort === column) {
+            preview.order = preview.order === 'asc' ? 'desc' : 'asc';
+        } else {
+            preview.sort = column;
+            preview.order = 'asc';
+        }
+        
+        // Cached pages belong to the old order
+        preview.pages.clear();
+        preview.pending.clear();
+        preview.generation++;
+        
+        renderHeader();
+        previewScroller.scrollTop = 0;
+        renderWindow();
+    }
+    
+    function scheduleRender() {
+        if (!preview || renderPending) return;
+        renderPending = true;
+        requestAnimationFrame(() => {
+            renderPending = false;
+            renderWindow();
+        });
+    }
+    
+    previewScroller.addEventListener('scroll', scheduleRender);
+    window.addEventListener('resize', scheduleRender);
+    
+    // Render the rows in view plus a buffer, with spacer rows standing in for the rest
+    function renderWindow() {
+        if (!preview) return;
+        
+        const tableHeader = document.getElementById('tableHeader');
+        const tableBody = document.getElementById('tableBody');
+        const rowHeight = preview.rowHeight;
+        const scrollTop = Math.max(0, previewScroller.scrollTop - tableHeader.offsetHeight);
+        const visibleRows = Math.ceil(previewScroller.clientHeight / rowHeight);
+        const first = Math.max(0, Math.floor(scrollTop / rowHeight) - ROW_BUFFER);
+        const last = Math.min(preview.rowsCount, first + visibleRows + 2 * ROW_BUFFER);
+        
+        const fragment = document.createDocumentFragment();
+        fragment.appendChild(createSpacerRow(first * rowHeight));
+        for (let index = first; index < last; index++) {
+            const row = getPreviewRow(index);
+            fragment.appendChild(row ? createRow(row) : createLoadingRow());
+        }
+        fragment.appendChild(createSpacerRow((preview.rowsCount - last) * rowHeight));
         
-        // Create body with ALL data
-        if (data.all_data && data.all_data.length > 0) {
-            data.all_data.forEach((row, rowIndex) => {
-                const tr = document.createElement('tr');
+        tableBody.innerHTML = '';
+        tableBody.appendChild(fragment);
+        
+        // Spacer heights assume every row is as tall as the first real one
+        if (!preview.rowHeightMeasured) {
+            const dataRow = tableBody.querySelector('tr.data-row');
+            if (dataRow) {
+                preview.rowHeightMeasured = true;
+                if (dataRow.offsetHeight > 0 && dataRow.offsetHeight !== rowHeight) {
+                    preview.rowHeight = dataRow.offsetHeight;
+                    renderWindow();
+                }
+            }
+        }
+    }
+    
+    function getPreviewRow(index) {
+        const page = Math.floor(index / preview.pageSize);
+        const rows = preview.pages.get(page);
+        if (!rows) {
+            loadPreviewPage(page);
+            return null;
+        }
+        return rows[index - page * preview.pageSize];
+    }
+    
+    async function loadPreviewPage(page) {
+        if (preview.pending.has(page)) return;
+        preview.pending.add(page);
+        
+        const current = preview;
+        const generation = current.generation;
+        const params = new URLSearchParams({
+            offset: page * current.pageSize,
+            limit: current.pageSize
+        });
+        if (current.sort) {
+            params.set('sort', current.sort);
+            params.set('order', current.order);
+        }
+        
+        try {
+            const response = await fetch(`/api/sessions/${current.sessionId}/rows?${params}`);
+            const result = await response.json();
+            
+            // A new upload or sort arrived meanwhile
+            if (current !== preview || generation !== current.generation) return;
+            
+            if (!response.ok || !result.success) {
+                throw new Error(result.error || 'Failed to load rows');
+            }
+            
+            current.pages.set(page, result.rows);
+            current.pending.delete(page);
+            if (current.pages.size > MAX_CACHED_PAGES) {
+                current.pages.delete(current.pages.keys().next().value);
+            }
+            scheduleRender();
+            
+        } catch (error) {
+            // The page stays pending so scrolling does not retry it in a loop
+            console.error('Rows error:', error);
+            showError('Failed to load rows: ' + error.message);
+        }
+    }
+    
+    function createSpacerRow(height) {
+        const tr = document.createElement('tr');
+        const td = document.createElement('td');
+        td.colSpan = preview.columns.length;
+        td.style.cssText = `height: ${height}px; padding: 0; border: 0;`;
+        tr.appendChild(td);
+        return tr;
+    }
+    
+    function createLoadingRow() {
+        const tr = document.createElement('tr');
+        const td = document.createElement('td');
+        td.colSpan = preview.columns.length;
+        td.classList.add('text-muted');
+        td.style.height = `${preview.rowHeight}px`;
+        td.innerHTML = '<em>Loading…</em>';
+        tr.appendChild(td);
+        return tr;
+    }
+    
+    function createRow(row) {
+        const tr = document.createElement('tr');
+        tr.classList.add('data-row');
+        
+        preview.columns.forEach(column => {
+            const td = document.createElement('td');
+            let value = row[column];
+            
+            if (value === null || value === undefined || value === '') {
+                value = '';
+                td.classList.add('text-muted');
+                td.innerHTML = '<em>—</em>';
+            } else {
+                if (typeof value === 'number') {
+                    value = value.toLocaleString('en-IN', {
+                        minimumFractionDigits: 2,
+                        maximumFractionDigits: 2
+                    });
+                }
                 
-                data.columns.forEach(column => {
-                    const td = document.createElement('td');
-                    let value = row[column];
-                    
-                    if (value === null || value === undefined || value === '') {
-                        value = '';
-                        td.classList.add('text-muted');
-                        td.innerHTML = '<em>—</em>';
-                    } else {
-                        if (typeof value === 'number') {
-                            value = value.toLocaleString('en-IN', {
-                                minimumFractionDigits: 2,
-                                maximumFractionDigits: 2
-                            });
-                        }
-                        
-                        if (column.toLowerCase().includes('date')) {
-                            const date = new Date(value);
-                            if (!isNaN(date.getTime())) {
-                                value = date.toLocaleDateString('en-IN', {
-                                    day: '2-digit',
-                                    month: 'short',
-                                    year: 'numeric'
-                                });
-                            }
-                        }
-                        
-                        td.textContent = value;
+                if (column.toLowerCase().includes('date')) {
+                    const date = new Date(value);
+                    if (!isNaN(date.getTime())) {
+                        value = date.toLocaleDateString('en-IN', {
+                            day: '2-digit',
+                            month: 'short',
+                            year: 'numeric'
+                        });
                     }
-                    
-                    td.title = `${column}: ${value}`;
-                    tr.appendChild(td);
-                });
+                }
                 
-                tableBody.appendChild(tr);
-            });
-        }
+                td.textContent = value;
+            }
+            
+            td.title = `${column}: ${value}`;
+            tr.appendChild(td);
+        });
         
-        // Scroll to preview
-        setTimeout(() => {
-            document.querySelector('.preview-section').scrollIntoView({
-                behavior: 'smooth',
-                block: 'start'
-            });
-        }, 300);
+        return tr;
     }
     
     // Utility functions
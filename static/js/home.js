@@ -16,8 +16,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const noCommentsTemplate = document.getElementById('noCommentsTemplate');
     
     // State variables
-    let allComments = [];
-    let displayedComments = 5;
+    let allComments = [];       // Top-level comments loaded so far (pages of /api/comments)
+    let nextCursor = null;      // Cursor of the next page, null when all are loaded
+    let totalComments = 0;      // Comments and replies on the server
     let replyingTo = null;
     
     // Initialize
@@ -28,10 +29,12 @@ document.addEventListener('DOMContentLoaded', function() {
     refreshCommentsBtn.addEventListener('click', loadComments);
     loadMoreBtn.addEventListener('click', loadMoreComments);
     cancelReplyBtn.addEventListener('click', cancelReply);
+    // Delegated, so comments and replies loaded later need no listeners of their own
+    addCommentEventListeners();
     
     // Functions
     
-    // Load comments from server
+    // Load the first page of comments from server
     async function loadComments() {
         try {
             showLoadingState();
@@ -41,6 +44,8 @@ document.addEventListener('DOMContentLoaded', function() {
             
             if (result.success) {
                 allComments = result.comments;
+                nextCursor = result.next_cursor;
+                totalComments = result.total;
                 updateCommentsDisplay();
                 updateCommentsCount();
             } else {
@@ -88,6 +93,9 @@ document.addEventListener('DOMContentLoaded', function() {
             if (result.success) {
                 // Reload comments
                 await loadComments();
+                if (parentId) {
+                    await openReplies(parentId);
+                }
                 
                 // Clear form
                 commentForm.reset();
@@ -129,31 +137,21 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        // Show top-level comments up to displayedComments limit
-        const visibleComments = allComments.slice(0, displayedComments);
-        
         let html = '';
-        visibleComments.forEach(comment => {
+        allComments.forEach(comment => {
             html += renderComment(comment, 0);
         });
         
         commentsContainer.innerHTML = html;
         
-        // Add event listeners to newly rendered elements
-        addCommentEventListeners();
-        
         // Show/hide load more button
-        if (allComments.length > displayedComments) {
-            loadMoreBtn.style.display = 'block';
-        } else {
-            loadMoreBtn.style.display = 'none';
-        }
+        loadMoreBtn.style.display = nextCursor ? 'block' : 'none';
     }
     
-    // Render a single comment (recursive for replies)
+    // Render a single comment (its replies are loaded when the thread is opened)
     function renderComment(comment, level) {
         const isDeleted = comment.deleted || false;
-        const hasReplies = comment.replies && comment.replies.length > 0;
+        const hasReplies = comment.reply_count > 0;
         const replyClass = level > 0 ? `reply reply-level-${Math.min(level, 3)}` : '';
         
         let html = `
@@ -192,21 +190,12 @@ document.addEventListener('DOMContentLoaded', function() {
         if (hasReplies) {
             html += `
                 <div class="replies-section">
-                    <div class="replies-header" data-comment-id="${comment.id}">
+                    <div class="replies-header collapsed" data-comment-id="${comment.id}">
                         <i class="fas fa-chevron-down"></i>
                         <span>Replies</span>
-                        <span class="replies-count">${comment.replies.length}</span>
-                    </div>
-                    <div class="replies-container" id="replies-${comment.id}" style="max-height: 1000px;">
-            `;
-            
-            // Render replies
-            comment.replies.forEach(reply => {
-                html += renderComment(reply, level + 1);
-            });
-            
-            html += `
+                        <span class="replies-count">${comment.reply_count}</span>
                     </div>
+                    <div class="replies-container collapsed" id="replies-${comment.id}" data-level="${level + 1}"></div>
                 </div>
             `;
         }
@@ -244,77 +233,129 @@ document.addEventListener('DOMContentLoaded', function() {
         return html;
     }
     
-    // Add event listeners to comment elements
+    // Add event listeners to the comments container (once - they handle every comment inside it)
     function addCommentEventListeners() {
-        // Reply buttons
-        document.querySelectorAll('.reply-btn').forEach(btn => {
-            btn.addEventListener('click', function() {
-                const commentId = this.dataset.commentId;
-                const authorName = this.dataset.author;
-                startReply(commentId, authorName);
-            });
-        });
-        
-        // Delete buttons
-        document.querySelectorAll('.delete-btn').forEach(btn => {
-            btn.addEventListener('click', function() {
-                const commentId = this.dataset.commentId;
-                deleteComment(commentId);
-            });
-        });
-        
-        // Replies toggle
-        document.querySelectorAll('.replies-header').forEach(header => {
-            header.addEventListener('click', function() {
-                const commentId = this.dataset.commentId;
-                const container = document.getElementById(`replies-${commentId}`);
-                const icon = this.querySelector('i');
-                
-                if (container.classList.contains('collapsed')) {
-                    container.classList.remove('collapsed');
-                    icon.style.transform = 'rotate(0deg)';
-                } else {
-                    container.classList.add('collapsed');
-                    icon.style.transform = 'rotate(-90deg)';
-                }
-            });
-        });
-        
-        // Reply form close buttons
-        document.querySelectorAll('.reply-form .btn-close').forEach(btn => {
-            btn.addEventListener('click', function() {
-                const commentId = this.dataset.commentId;
-                hideReplyForm(commentId);
-            });
+        commentsContainer.addEventListener('click', function(e) {
+            // Reply buttons
+            const replyBtn = e.target.closest('.reply-btn');
+            if (replyBtn) {
+                startReply(replyBtn.dataset.commentId, replyBtn.dataset.author);
+                return;
+            }
+            
+            // Delete buttons
+            const deleteBtn = e.target.closest('.delete-btn');
+            if (deleteBtn) {
+                deleteComment(deleteBtn.dataset.commentId);
+                return;
+            }
+            
+            // Replies toggle
+            const header = e.target.closest('.replies-header');
+            if (header) {
+                toggleReplies(header.dataset.commentId);
+                return;
+            }
+            
+            // Next page of a thread's replies
+            const moreReplies = e.target.closest('.load-more-replies');
+            if (moreReplies) {
+                loadReplies(moreReplies.dataset.commentId, moreReplies.dataset.cursor);
+                return;
+            }
+            
+            // Reply form close and cancel buttons
+            const closeBtn = e.target.closest('.reply-form .btn-close, .cancel-reply-btn');
+            if (closeBtn) {
+                hideReplyForm(closeBtn.dataset.commentId);
+            }
         });
         
-        // Cancel reply buttons
-        document.querySelectorAll('.cancel-reply-btn').forEach(btn => {
-            btn.addEventListener('click', function() {
-                const commentId = this.dataset.commentId;
-                hideReplyForm(commentId);
-            });
+        // Reply form submissions
+        commentsContainer.addEventListener('submit', function(e) {
+            const form = e.target.closest('.reply-form-inner');
+            if (!form) {
+                return;
+            }
+            e.preventDefault();
+            const parentId = form.querySelector('input[name="parent_id"]').value;
+            const nameInput = form.querySelector('input[type="text"]');
+            const commentInput = form.querySelector('textarea');
+            
+            const name = nameInput.value.trim();
+            const comment = commentInput.value.trim();
+            
+            if (!name || !comment) {
+                showAlert('Please fill in both name and reply fields', 'error');
+                return;
+            }
+            
+            submitReply(parentId, name, comment, form);
         });
+    }
+    
+    // Open or close a thread, loading its first page of replies the first time
+    async function toggleReplies(commentId) {
+        const container = document.getElementById(`replies-${commentId}`);
+        if (container.classList.contains('collapsed')) {
+            await openReplies(commentId);
+        } else {
+            container.classList.add('collapsed');
+            container.previousElementSibling.classList.add('collapsed');
+        }
+    }
+    
+    async function openReplies(commentId) {
+        const container = document.getElementById(`replies-${commentId}`);
+        if (!container) {
+            return;
+        }
+        if (!container.dataset.loaded) {
+            await loadReplies(commentId);
+        }
+        container.classList.remove('collapsed');
+        container.previousElementSibling.classList.remove('collapsed');
+    }
+    
+    // Append a page of replies to a thread (the first page when cursor is not given)
+    async function loadReplies(commentId, cursor) {
+        const container = document.getElementById(`replies-${commentId}`);
+        const level = parseInt(container.dataset.level, 10);
+        const params = new URLSearchParams();
+        if (cursor) params.append('cursor', cursor);
         
-        // Reply form submissions
-        document.querySelectorAll('.reply-form-inner').forEach(form => {
-            form.addEventListener('submit', function(e) {
-                e.preventDefault();
-                const parentId = this.querySelector('input[name="parent_id"]').value;
-                const nameInput = this.querySelector('input[type="text"]');
-                const commentInput = this.querySelector('textarea');
-                
-                const name = nameInput.value.trim();
-                const comment = commentInput.value.trim();
-                
-                if (!name || !comment) {
-                    showAlert('Please fill in both name and reply fields', 'error');
-                    return;
-                }
-                
-                submitReply(parentId, name, comment, this);
+        try {
+            const response = await fetch(`/api/comments/${commentId}/replies?${params}`);
+            const result = await response.json();
+            
+            if (!result.success) {
+                showError('Failed to load replies: ' + result.error);
+                return;
+            }
+            
+            const moreBtn = container.querySelector(':scope > .load-more-replies');
+            if (moreBtn) {
+                moreBtn.remove();
+            }
+            
+            let html = '';
+            result.comments.forEach(reply => {
+                html += renderComment(reply, level);
             });
-        });
+            if (result.next_cursor) {
+                html += `
+                    <button type="button" class="btn btn-sm btn-link load-more-replies"
+                            data-comment-id="${commentId}" data-cursor="${result.next_cursor}">
+                        <i class="fas fa-chevron-down me-1"></i>Load more replies
+                    </button>
+                `;
+            }
+            container.insertAdjacentHTML('beforeend', html);
+            container.dataset.loaded = 'true';
+        } catch (error) {
+            console.error('Error loading replies:', error);
+            showError('Network error: ' + error.message);
+        }
     }
     
     // Start replying to a comment
@@ -368,8 +409,9 @@ document.addEventListener('DOMContentLoaded', function() {
             const result = await response.json();
             
             if (result.success) {
-                // Reload comments
+                // Reload comments and show the thread that got the reply
                 await loadComments();
+                await openReplies(parentId);
                 
                 // Show success message
                 showAlert('Reply submitted successfully!', 'success');
@@ -413,10 +455,36 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    // Load more comments
-    function loadMoreComments() {
-        displayedComments += 5;
-        updateCommentsDisplay();
+    // Load the next page of top-level comments
+    async function loadMoreComments() {
+        if (!nextCursor) {
+            return;
+        }
+        
+        try {
+            const response = await fetch(`/api/comments?cursor=${encodeURIComponent(nextCursor)}`);
+            const result = await response.json();
+            
+            if (result.success) {
+                allComments = allComments.concat(result.comments);
+                nextCursor = result.next_cursor;
+                totalComments = result.total;
+                
+                let html = '';
+                result.comments.forEach(comment => {
+                    html += renderComment(comment, 0);
+                });
+                commentsContainer.insertAdjacentHTML('beforeend', html);
+                
+                loadMoreBtn.style.display = nextCursor ? 'block' : 'none';
+                updateCommentsCount();
+            } else {
+                showError('Failed to load comments: ' + result.error);
+            }
+        } catch (error) {
+            console.error('Error loading comments:', error);
+            showError('Network error: ' + error.message);
+        }
     }
     
     // Cancel reply mode
@@ -428,24 +496,11 @@ document.addEventListener('DOMContentLoaded', function() {
         replyingTo = null;
     }
     
-    // Update comments count
+    // Update comments count (comments and replies, counted by the server)
     function updateCommentsCount() {
-        const totalComments = countTotalComments(allComments);
         commentsCount.textContent = `${totalComments} comment${totalComments !== 1 ? 's' : ''}`;
     }
     
-    // Count total comments including replies
-    function countTotalComments(comments) {
-        let count = 0;
-        comments.forEach(comment => {
-            count++; // Count this comment
-            if (comment.replies && comment.replies.length > 0) {
-                count += countTotalComments(comment.replies); // Count replies recursively
-            }
-        });
-        return count;
-    }
-    
     // Show loading state
     function showLoadingState() {
         commentsContainer.innerHTML = `
@@ -0,0 +1,233 @@
+import gzip
+import os
+
+import pandas as pd
+import pytest
+
+import app as app_module
+import your_cleaning_script
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+REPORT = {'exact': 1, 'normalized': 1, 'suffix': 0, 'fuzzy': 0, 'unmatched': 0,
+          'matches': [{'sku': 'abc', 'kind': 'normalized', 'rows': [1]}]}
+
+@pytest.fixture
+def flask_app(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'RESULT_STORE_DIR', str(tmp_path / 'results'))
+    monkeypatch.setattr(app_module, '_result_store', None)
+    monkeypatch.setattr(app_module, '_result_cache', None)
+    return app_module.app
+
+def test_job_result_keeps_sku_matches_for_cache_hits(flask_app):
+    data = pd.DataFrame({'SKU': ['ABC', 'abc']})
+    job = {'marketplace': 'noon', 'context': {'cache_key': 'key'}}
+    result = app_module.store_job_result(job, data, None, REPORT)
+    assert result['sku_matches']['normalized'] == 1
+    assert result['sku_matches']['truncated'] is False
+    entry, _ = app_module.get_result_cache().get('key')
+    assert entry['session_id'] == result['session_id']
+    assert entry['sku_matches'] == result['sku_matches']
+
+@pytest.fixture
+def client(flask_app, monkeypatch):
+    monkeypatch.setattr(app_module, '_sort_orders', app_module.OrderedDict())
+    return flask_app.test_client()
+
+@pytest.mark.parametrize('column, order, expected', [
+    # fillna('') leaves numbers, numeric text and blanks in one column
+    ('QTY', 'asc', [2, 2.5, '9', '10', 'B', 'abc', '', None]),
+    ('QTY', 'desc', ['abc', 'B', '10', '9', 2.5, 2, '', None]),
+    ('Code', 'asc', ['9', '10', 'x', None, None, None, None, None]),
+    ('Price', 'desc', [10.0, 9.0, 2.0, 1.0, 0.5, -1.0, None, None]),
+])
+def test_session_rows_sort_numbers_by_value(client, column, order, expected):
+    data = pd.DataFrame({
+        'QTY': ['10', '9', '', None, 'abc', 2, 'B', 2.5],
+        'Code': pd.Categorical(['10', None, '9', None, 'x', None, None, None]),
+        'Price': [10, 9, 2, None, 1, 0.5, -1, None]
+    })
+    session_id = app_module.store_cleaned_data(data, 'Noon')
+    response = client.get(f'/api/sessions/{session_id}/rows?sort={column}&order={order}&limit=3&offset=0')
+    rows = response.get_json()['rows']
+    response = client.get(f'/api/sessions/{session_id}/rows?sort={column}&order={order}&limit=5&offset=3')
+    rows += response.get_json()['rows']
+    assert [None if pd.isna(row[column]) else row[column] for row in rows] == expected
+
+def test_cache_key_follows_upload_options_cleaner_and_master(flask_app, tmp_path, monkeypatch):
+    master = tmp_path / 'product.csv'
+    master.write_text('SKU\nA\n')
+    monkeypatch.setitem(flask_app.config, 'PRODUCT_CSV', str(master))
+    upload, copy, other = tmp_path / 'orders.csv', tmp_path / 'copy.csv', tmp_path / 'other.csv'
+    upload.write_text('sku\nA\n')
+    copy.write_text('sku\nA\n')
+    other.write_text('sku\nB\n')
+
+    key = app_module.result_cache_key(str(upload), 'Noon', False)
+    assert app_module.result_cache_key(str(copy), 'Noon', False) == key
+    changed = [
+        app_module.result_cache_key(str(other), 'Noon', False),
+        app_module.result_cache_key(str(upload), 'Amazon', False),
+        app_module.result_cache_key(str(upload), 'Noon', True),
+        app_module.result_cache_key(str(upload), 'Noon', False, 0.8)
+    ]
+    master.write_text('SKU\nA\nC\n')
+    changed.append(app_module.result_cache_key(str(upload), 'Noon', False))
+    monkeypatch.setattr(app_module, 'CLEANER_VERSION', 'other cleaner')
+    changed.append(app_module.result_cache_key(str(upload), 'Noon', False))
+    assert len(set(changed + [key])) == len(changed) + 1
+
+def test_cleaner_version_covers_every_module_of_a_clean(tmp_path, monkeypatch):
+    assert {'your_cleaning_script.py', 'sku_matcher.py', 'product_store.py'} <= set(your_cleaning_script.CLEANER_MODULES)
+    module = tmp_path / 'sku_matcher.py'
+    module.write_text('FUZZY = 0.9\n')
+    monkeypatch.setattr(your_cleaning_script, 'CLEANER_MODULES', [str(module)])
+    version = your_cleaning_script.cleaner_version()
+    module.write_text('FUZZY = 0.8\n')
+    assert your_cleaning_script.cleaner_version() != version
+
+def test_same_upload_is_served_from_the_cache(client, flask_app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'PRODUCT_CSV', os.path.join(DATA, 'product.csv'))
+
+    def upload():
+        with open(os.path.join(DATA, 'noon.csv'), 'rb') as f:
+            return client.post('/api/clean', data={'marketplace': 'Noon', 'file': (f, 'noon.csv'),
+                                                   'sku_match': '0.8'}).get_json()
+
+    first, second = upload(), upload()
+    assert not first['cache_hit'] and second['cache_hit']
+    assert second['session_id'] == first['session_id']
+    assert second['sku_matches'] == first['sku_matches']
+    assert second['sku_matches']['unmatched'] == 6
+    assert second['preview'] == first['preview']
+
+@pytest.mark.parametrize('error, status', [(app_module.QueueFull('20 waiting'), 503), (RuntimeError('pool gone'), 500)])
+def test_upload_deleted_when_a_job_is_not_queued(client, tmp_path, monkeypatch, error, status):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    monkeypatch.setattr(app_module.tempfile, 'tempdir', str(uploads))
+
+    class Jobs:
+        def submit(self, *args, **kwargs):
+            raise error
+
+    monkeypatch.setattr(app_module, 'get_job_queue', Jobs)
+    with open(os.path.join(DATA, 'noon.csv'), 'rb') as f:
+        response = client.post('/api/clean', data={'marketplace': 'Noon', 'file': (f, 'noon.csv'),
+                                                   'async': '1', 'cache': '0'})
+    assert response.status_code == status
+    assert os.listdir(uploads) == []
+
+def test_approximate_sku_matching_is_opt_in(client, flask_app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'PRODUCT_CSV', os.path.join(DATA, 'product.csv'))
+
+    def upload(**form):
+        with open(os.path.join(DATA, 'noon.csv'), 'rb') as f:
+            return client.post('/api/clean', data=dict(form, marketplace='Noon', file=(f, 'noon.csv')))
+
+    assert upload().get_json()['sku_matches'] is None
+    assert upload(sku_match='0.8').get_json()['sku_matches']['exact'] == 27
+    monkeypatch.setitem(flask_app.config, 'SKU_MATCH_MIN_CONFIDENCE', 0.8)
+    assert upload(sku_match='off').get_json()['sku_matches'] is None
+    assert upload(sku_match='2').status_code == 400
+    assert upload(sku_match='most').status_code == 400
+
+def clean_or_crash(cleaner_class, file_path, *args, **kwargs):
+    with open(file_path) as f:
+        if f.read(5) == 'crash':
+            # Like a worker killed for memory
+            os._exit(1)
+    return your_cleaning_script.clean_file(cleaner_class, file_path, *args, **kwargs)
+
+@pytest.fixture
+def batch(client, flask_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'PRODUCT_CSV', os.path.join(DATA, 'product.csv'))
+    monkeypatch.setitem(flask_app.config, 'BATCH_WORKERS', 2)
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    monkeypatch.setattr(app_module.tempfile, 'tempdir', str(uploads))
+    monkeypatch.setattr(app_module, 'clean_file', clean_or_crash)
+    monkeypatch.setattr(app_module, '_clean_pool', None)
+
+    def post(*names, **form):
+        files = [open(os.path.join(DATA, name), 'rb') if os.path.exists(os.path.join(DATA, name))
+                 else open(tmp_path / name, 'rb') for name in names]
+        try:
+            response = client.post('/api/clean/batch', data=dict(form, files=[(f, os.path.basename(f.name)) for f in files]))
+        finally:
+            for f in files:
+                f.close()
+        # Uploads are deleted whatever happened to the batch
+        assert os.listdir(uploads) == []
+        return response
+
+    yield post
+    app_module.reset_clean_pool()
+
+def test_batch_cleans_each_file_and_combines_them(batch, client):
+    response = batch('noon.csv', 'amazon.csv', 'revibe.csv', marketplaces=['Noon', 'Amazon', 'Revibe'])
+    result = response.get_json()
+    assert result['success']
+    assert [(item['filename'], item['rows_count']) for item in result['files']] == [
+        ('noon.csv', 33), ('amazon.csv', 30), ('revibe.csv', 50)]
+    assert result['combined']['rows_count'] == 33 + 30 + 50
+    download = client.get(f"/api/download/{result['files'][0]['session_id']}")
+    with open(os.path.join(DATA, 'noon_cleaned.csv'), 'rb') as f:
+        assert download.data == f.read()
+
+def test_batch_rejects_bad_requests(batch):
+    assert batch('noon.csv', 'amazon.csv', marketplaces=['Noon']).status_code == 400
+    assert batch('noon.csv', marketplace='Unknown').status_code == 400
+    assert batch('noon.csv', marketplace='Noon', engine='fast').status_code == 400
+
+@pytest.mark.skipif(os.name == 'nt', reason='workers must fork to see the patched clean_file')
+def test_batch_recovers_after_a_worker_dies(batch, tmp_path):
+    (tmp_path / 'crash.csv').write_text('crash')
+    result = batch('crash.csv', 'noon.csv', marketplace='Noon').get_json()
+    assert result['files'][0]['success'] is False
+    assert app_module._clean_pool is None
+    # The next batch gets a new pool
+    result = batch('noon.csv', marketplace='Noon').get_json()
+    assert result['files'][0]['success'] and result['files'][0]['rows_count'] == 33
+
+def test_csv_chunks_join_to_one_to_csv():
+    # 20 columns: to_csv blocks of 5000 rows, each with its own date format
+    data = pd.DataFrame({f'c{i}': range(12000) for i in range(19)})
+    data['Date'] = pd.Timestamp(2024, 1, 1)
+    data.loc[7000:, 'Date'] = pd.Timestamp(2024, 1, 1, 10, 30)
+    chunks = list(app_module.csv_chunks(data, 1))
+    assert len(chunks) == 3
+    assert ''.join(chunks) == data.to_csv(index=False)
+    assert list(app_module.csv_chunks(data.iloc[:0], 10)) == [data.iloc[:0].to_csv(index=False)]
+
+@pytest.fixture
+def cleaned_session(flask_app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'DOWNLOAD_CHUNK_ROWS', 1)
+    cleaner = your_cleaning_script.NoonCleaner(os.path.join(DATA, 'noon.csv'), master_path=os.path.join(DATA, 'product.csv'))
+    cleaner.clean()
+    with open(os.path.join(DATA, 'noon_cleaned.csv'), 'rb') as f:
+        return app_module.store_cleaned_data(cleaner.data, 'Noon'), f.read()
+
+@pytest.mark.parametrize('gzip_enabled', [True, False])
+def test_download_streams_csv(client, flask_app, monkeypatch, cleaned_session, gzip_enabled):
+    monkeypatch.setitem(flask_app.config, 'DOWNLOAD_GZIP', gzip_enabled)
+    session_id, expected = cleaned_session
+    response = client.get(f'/api/download/{session_id}')
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'].startswith('attachment; filename=Cleaned_Noon_')
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    # Only clients that accept gzip get it
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == expected
+
+def test_download_gzip_when_accepted(client, cleaned_session):
+    session_id, expected = cleaned_session
+    response = client.get(f'/api/download/{session_id}', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(response.data) == expected
+
+def test_download_of_an_unknown_session(client):
+    assert client.get('/api/download/missing').status_code == 404
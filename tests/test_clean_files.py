@@ -0,0 +1,62 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+import clean_files
+from clean_files import expand_inputs, output_paths
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+MASTER = os.path.join(DATA, 'product.csv')
+
+@pytest.fixture
+def exports(tmp_path):
+    directory = tmp_path / 'exports'
+    directory.mkdir()
+    for name in ['noon', 'amazon', 'revibe']:
+        shutil.copy(os.path.join(DATA, f'{name}.csv'), directory / f'{name}.csv')
+    (directory / 'notes.txt').write_text('not an export')
+    return directory
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['clean_files.py', *args])
+    try:
+        clean_files.main()
+    except SystemExit as e:
+        return e.code
+    return 0
+
+def test_expand_inputs(exports):
+    noon, amazon, revibe = (str(exports / f'{name}.csv') for name in ['noon', 'amazon', 'revibe'])
+    files = expand_inputs([f'Noon={noon}', str(exports), str(exports / '*.csv')], 'Amazon')
+    # Each file once, with the marketplace of its first mention; notes.txt is no export
+    assert files == [(noon, 'Noon'), (amazon, 'Amazon'), (revibe, 'Amazon')]
+    assert expand_inputs([str(exports / 'missing*.csv')]) == []
+
+def test_output_paths_number_shared_names():
+    assert output_paths(['a/orders.csv', 'b/orders.xlsx', 'orders_2.csv'], 'out', 'parquet') == [
+        os.path.join('out', 'Cleaned_orders.parquet'),
+        os.path.join('out', 'Cleaned_orders_2.parquet'),
+        os.path.join('out', 'Cleaned_orders_2_2.parquet')
+    ]
+
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_cleans_a_directory_like_the_cleaners(exports, tmp_path, monkeypatch, workers):
+    output_dir = tmp_path / 'cleaned'
+    assert run(monkeypatch, str(exports), '--output-dir', str(output_dir), '--master', MASTER,
+               '--workers', workers, '--combine') == 0
+    for name in ['noon', 'amazon', 'revibe']:
+        with open(os.path.join(DATA, f'{name}_cleaned.csv'), 'rb') as f:
+            assert (output_dir / f'Cleaned_{name}.csv').read_bytes() == f.read()
+    combined = pd.read_csv(output_dir / 'Cleaned_Batch_Data.csv')
+    assert len(combined) == 33 + 30 + 50
+
+def test_unrecognised_files_fail_the_run(exports, tmp_path, monkeypatch, capsys):
+    unknown = exports / 'unknown.csv'
+    unknown.write_text('a,b\n1,2\n')
+    output_dir = tmp_path / 'cleaned'
+    assert run(monkeypatch, str(exports), '--output-dir', str(output_dir), '--master', MASTER, '--workers', '1') == 1
+    assert f'Skipping {unknown}' in capsys.readouterr().out
+    assert sorted(os.listdir(output_dir)) == ['Cleaned_amazon.csv', 'Cleaned_noon.csv', 'Cleaned_revibe.csv']
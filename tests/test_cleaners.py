@@ -0,0 +1,130 @@
+import csv
+import os
+
+import pandas as pd
+import pytest
+
+from product_store import PRODUCT_COLUMNS
+from your_cleaning_script import AmazonCleaner, NoonCleaner, RevibeCleaner, write_frame
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+MASTER = os.path.join(DATA, 'product.csv')
+
+# <name>_cleaned.csv is what the original cleaners saved for <name>.csv
+# with this product.csv (exact SKU matches, a few SKUs not in the master)
+CASES = [(NoonCleaner, 'noon'), (AmazonCleaner, 'amazon'), (RevibeCleaner, 'revibe')]
+
+def expected(name):
+    with open(os.path.join(DATA, f'{name}_cleaned.csv'), 'rb') as f:
+        return f.read()
+
+@pytest.mark.parametrize('cleaner_class, name', CASES)
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_output_matches_baseline(tmp_path, cleaner_class, name, compact, engine):
+    output = tmp_path / 'cleaned.csv'
+    cleaner = cleaner_class(os.path.join(DATA, f'{name}.csv'), compact=compact, engine=engine, master_path=MASTER)
+    cleaner.clean()
+    cleaner.save_data(str(output))
+    assert output.read_bytes() == expected(name)
+
+@pytest.mark.parametrize('cleaner_class, name', CASES)
+@pytest.mark.parametrize('chunksize', [1, 7, 1000])
+def test_streamed_output_matches_baseline(tmp_path, cleaner_class, name, chunksize):
+    output = tmp_path / 'cleaned.csv'
+    cleaner = cleaner_class(os.path.join(DATA, f'{name}.csv'), master_path=MASTER)
+    cleaner.clean_to_file(str(output), chunksize=chunksize)
+    assert output.read_bytes() == expected(name)
+
+def test_streamed_workbook_matches_in_memory(tmp_path):
+    from openpyxl import Workbook
+    book = Workbook()
+    sheet = book.active
+    with open(os.path.join(DATA, 'amazon.csv'), newline='') as f:
+        for row in csv.reader(f):
+            sheet.append(row)
+    path = str(tmp_path / 'amazon.xlsx')
+    book.save(path)
+
+    cleaner = AmazonCleaner(path, master_path=MASTER)
+    cleaner.clean()
+    assert len(cleaner.data) == 30
+    cleaner.save_data(str(tmp_path / 'in_memory.csv'))
+    AmazonCleaner(path, master_path=MASTER).clean_to_file(str(tmp_path / 'streamed.csv'), chunksize=4)
+    assert (tmp_path / 'streamed.csv').read_bytes() == (tmp_path / 'in_memory.csv').read_bytes()
+
+@pytest.fixture
+def near_misses(tmp_path):
+    master = tmp_path / 'product.csv'
+    pd.DataFrame([{'Brand': brand, 'Category': 'C', 'Sub-Category': 'S', 'Product Titles': 'T', 'SKU': sku,
+                   'Partner SKU': f'P-{sku}'} for brand, sku in [('Canon', 'CAMERA42XLPRO'), ('Left', 'TRIPODXYZA'),
+                                                                  ('Right', 'TRIPODXYZB')]],
+                 columns=PRODUCT_COLUMNS).to_csv(master, index=False)
+    orders = tmp_path / 'noon.csv'
+    pd.DataFrame({
+        'order_timestamp': '2024-01-02 10:00:00',
+        'item_nr': ['N1', 'N2', 'N3', 'N4'],
+        # Exact, one typo, as close to two products, unknown
+        'sku': ['CAMERA42XLPRO', 'CAMERA42XLPR0', 'TRIPODXYZC', 'UNLISTED'],
+        'status': 'Delivered',
+        'id_partner': '46272',
+        'country_code': 'AE',
+        'partner_sku': 'P',
+        'fulfillment_model': 'Fulfilled by Partner (FBP)',
+        'offer_price': '10'
+    }).to_csv(orders, index=False)
+    return str(orders), str(master)
+
+@pytest.mark.parametrize('sku_match, brands', [
+    # Off by default: only exact SKUs, like the original cleaners
+    (None, ['Canon', '', '', '']),
+    (0.8, ['Canon', 'Canon', '', '']),
+    # The typo's match is less sure than 0.9
+    (0.9, ['Canon', '', '', '']),
+])
+def test_near_miss_skus(near_misses, sku_match, brands):
+    orders, master = near_misses
+    cleaner = NoonCleaner(orders, master_path=master, sku_match=sku_match)
+    cleaner.clean()
+    assert cleaner.data['Brand Name'].tolist() == brands
+    if sku_match is None:
+        assert cleaner.match_report is None
+    else:
+        assert cleaner.match_report['fuzzy'] == brands.count('Canon') - 1
+        assert cleaner.match_report['unmatched'] == brands.count('')
+
+@pytest.mark.parametrize('cleaner_class, name', CASES)
+@pytest.mark.parametrize('format, read', [('parquet', pd.read_parquet), ('feather', pd.read_feather)])
+def test_typed_exports_keep_numbers_and_dates(tmp_path, cleaner_class, name, format, read):
+    cleaner = cleaner_class(os.path.join(DATA, f'{name}.csv'), master_path=MASTER)
+    cleaner.clean()
+    output = tmp_path / f'cleaned.{format}'
+    write_frame(cleaner.data, str(output), format)
+    data = read(output)
+    price, qty, gmv = data.columns[-3:]
+    # Revibe keeps the export's price text, the typed file has numbers anyway
+    assert str(data[price].dtype) == str(data[gmv].dtype) == 'float64'
+    assert str(data[qty].dtype) in ('int64', 'Int64')
+    assert str(data['Date'].dtype) == 'datetime64[ns]'
+    expected = pd.read_csv(os.path.join(DATA, f'{name}_cleaned.csv'))
+    assert data[gmv].tolist() == pytest.approx(expected[gmv].tolist(), nan_ok=True)
+
+@pytest.mark.parametrize('cleaner_class, name', CASES)
+def test_compact_frame_equals_default_frame(cleaner_class, name):
+    compact = cleaner_class(os.path.join(DATA, f'{name}.csv'), compact=True, master_path=MASTER)
+    compact.clean()
+    default = cleaner_class(os.path.join(DATA, f'{name}.csv'), master_path=MASTER)
+    default.clean()
+    assert default.memory_report is None
+    pd.testing.assert_frame_equal(compact.data.astype(object), default.data.astype(object))
+
+    report = compact.memory_report
+    assert set(report) == {col for col in compact.data.columns if compact.data[col].dtype in ('category', 'string')}
+    for col in compact.SPEC.CATEGORY_COLUMNS:
+        if col in compact.data.columns:
+            assert report[col]['dtype'] == 'category'
+    for col, item in report.items():
+        assert item['dtype'] == str(compact.data[col].dtype)
+        assert item['bytes'] == compact.data[col].memory_usage(deep=True, index=False)
+        assert item['saved'] == item['object_bytes'] - item['bytes']
+    assert report['Status']['saved'] > 0
@@ -0,0 +1,137 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+import comment_store
+from comment_store import CommentNotFound, CommentStore
+
+class Clock:
+    """datetime stand-in a second apart per call, so page order is fixed"""
+    def __init__(self):
+        self.current = datetime(2024, 1, 1)
+
+    def now(self):
+        self.current += timedelta(seconds=1)
+        return self.current
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    monkeypatch.setattr(comment_store, 'datetime', Clock())
+    return str(tmp_path / 'comments.json')
+
+def read_all(store, limit, parent_id=None):
+    pages, cursor = [], None
+    while True:
+        comments, cursor = store.page(limit, cursor, parent_id)
+        pages.append([comment['comment'] for comment in comments])
+        if cursor is None:
+            return pages
+
+def test_pages_newest_first_without_gaps(path):
+    store = CommentStore(path)
+    for i in range(7):
+        store.add('Ann', f'c{i}')
+    assert read_all(store, 3) == [['c6', 'c5', 'c4'], ['c3', 'c2', 'c1'], ['c0']]
+    assert read_all(store, 7) == [['c6', 'c5', 'c4', 'c3', 'c2', 'c1', 'c0']]
+    assert store.count() == 7
+
+def test_cursor_holds_while_comments_come_and_go(path):
+    store = CommentStore(path)
+    ids = [store.add('Ann', f'c{i}')['id'] for i in range(5)]
+    first, cursor = store.page(2)
+    store.add('Bob', 'newer')
+    store.delete(ids[2])
+    rest, cursor = store.page(2, cursor)
+    assert [comment['comment'] for comment in first + rest] == ['c4', 'c3', 'c1', 'c0']
+    assert cursor is None
+
+def test_replies_are_paged_under_their_comment(path):
+    store = CommentStore(path)
+    parent = store.add('Ann', 'question')
+    for i in range(3):
+        store.add('Bob', f'r{i}', parent['id'])
+    comments, _ = store.page(10)
+    assert [(comment['comment'], comment['reply_count']) for comment in comments] == [('question', 3)]
+    assert read_all(store, 2, parent['id']) == [['r2', 'r1'], ['r0']]
+    # Deleting a comment with replies keeps them reachable
+    store.delete(parent['id'])
+    comments, _ = store.page(10)
+    assert comments[0]['name'] == '[Deleted]' and comments[0]['reply_count'] == 3
+
+def test_bad_cursor_and_unknown_parent(path):
+    store = CommentStore(path)
+    with pytest.raises(ValueError):
+        store.page(10, 'not-a-cursor')
+    with pytest.raises(CommentNotFound):
+        store.page(10, parent_id='missing')
+
+def test_other_workers_see_journal_and_snapshot(path):
+    store = CommentStore(path, compact_every=3)
+    other = CommentStore(path, compact_every=3)
+    parent = store.add('Ann', 'c0')
+    store.add('Bob', 'r0', parent['id'])
+    assert read_all(other, 10) == [['c0']]
+    other.add('Cat', 'c1')
+    # Third journal entry: folded into comments.json in the old nested format
+    with open(path, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    assert [comment['comment'] for comment in snapshot['comments']] == ['c1', 'c0']
+    assert snapshot['comments'][1]['replies'][0]['comment'] == 'r0'
+    store.add('Dan', 'c2')
+    assert read_all(store, 10) == [['c2', 'c1', 'c0']]
+    assert read_all(other, 10, parent['id']) == [['r0']]
+
+def test_comments_api_pages(path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'COMMENTS_JSON', path)
+    client = app_module.app.test_client()
+    for i in range(3):
+        client.post('/api/comments/add', json={'name': 'Ann', 'comment': f'c{i}'})
+    page = client.get('/api/comments?limit=2').get_json()
+    assert [comment['comment'] for comment in page['comments']] == ['c2', 'c1']
+    assert page['total'] == 3
+    page = client.get(f"/api/comments?limit=2&cursor={page['next_cursor']}").get_json()
+    assert [comment['comment'] for comment in page['comments']] == ['c0']
+    assert page['next_cursor'] is None
+    assert client.get('/api/comments?limit=0').status_code == 400
+    assert client.get('/api/comments/missing/replies').status_code == 404
+
+def test_journal_replay_and_compaction_across_stores(path):
+    mine = CommentStore(path, compact_every=4)
+    theirs = CommentStore(path, compact_every=4)
+    first = mine.add('Ann', 'c0')
+    reply = mine.add('Bob', 'r0', first['id'])
+    # theirs replays mine's journal lines before writing its own
+    theirs.delete(reply['id'])
+    assert mine.page(10, parent_id=first['id'])[0] == []
+    with open(path + '.journal', encoding='utf-8') as f:
+        assert [json.loads(line)['op'] for line in f] == ['add', 'add', 'delete']
+    # No snapshot is written before the first compaction
+    assert not os.path.exists(path)
+
+    # The fourth entry folds the journal into the snapshot and empties it
+    theirs.add('Cat', 'c1')
+    with open(path + '.journal', 'rb') as f:
+        assert f.read() == b''
+    with open(path, encoding='utf-8') as f:
+        assert [comment['comment'] for comment in json.load(f)['comments']] == ['c1', 'c0']
+    # mine sees the new snapshot and starts the emptied journal from its beginning
+    mine.add('Dan', 'c2')
+    assert read_all(theirs, 10) == read_all(mine, 10) == [['c2', 'c1', 'c0']]
+    assert theirs.count() == mine.count() == 3
+
+def test_half_written_journal_line_waits_for_its_newline(path):
+    store = CommentStore(path)
+    store.add('Ann', 'c0')
+    line = json.dumps({'op': 'add', 'comment': {'id': 'x1', 'parent_id': None, 'name': 'Bob', 'comment': 'c1',
+                                                'timestamp': '2030-01-01T00:00:00'}})
+    with open(path + '.journal', 'a', encoding='utf-8') as f:
+        f.write(line[:20])
+    assert read_all(store, 10) == [['c0']]
+    with open(path + '.journal', 'a', encoding='utf-8') as f:
+        f.write(line[20:] + '\n')
+    assert read_all(store, 10) == [['c1', 'c0']]
+    # A worker starting now reads the same comments from the journal alone
+    assert read_all(CommentStore(path), 10) == [['c1', 'c0']]
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+from dateutil import parser
+
+from your_cleaning_script import DateNormalizer
+
+DATES = [
+    '2024-01-02', '2024-01-02 10:11:12', '2024-01-02T10:11:12', '2024-01-02 10:11:12.250000', '2024-13-01',
+    '01/02/2024', '13/02/2024', '02/13/2024', '01-02-2024 10:11', '05.01.2024', '2024/02/01',
+    'Jan 5, 2024', '5 Jan 2024', 'Ordered on 5 Jan 2024 at 10:00', '2024-01-05T10:00:00+00:00'
+]
+
+def test_parses_like_fuzzy_dayfirst_dateutil():
+    values = pd.Series(DATES + DATES[::-1], dtype=object)
+    parsed, stats = DateNormalizer().parse(values)
+    expected = [parser.parse(text, dayfirst=True, fuzzy=True) for text in values]
+    assert parsed.tolist() == [pd.Timestamp(value) for value in expected]
+    assert stats['unique'] == len(DATES)
+    assert stats['format'] + stats['fuzzy'] == len(values)
+
+def test_blanks_are_nat():
+    parsed, stats = DateNormalizer().parse(pd.Series([None, '', '  ', '2024-01-02'], dtype=object))
+    assert parsed[:3].isna().all()
+    assert parsed[3] == pd.Timestamp(2024, 2, 1)
+    assert stats['blank'] == 3
+
+def test_repeat_values_come_from_the_cache(monkeypatch):
+    normalizer = DateNormalizer()
+    first, _ = normalizer.parse(pd.Series(DATES, dtype=object))
+
+    def parse_again(*args, **kwargs):
+        pytest.fail('a cached date was parsed again')
+
+    monkeypatch.setattr(pd, 'to_datetime', parse_again)
+    monkeypatch.setattr(parser, 'parse', parse_again)
+    again, stats = normalizer.parse(pd.Series(DATES, dtype=object))
+    assert stats['cached'] == len(DATES)
+    pd.testing.assert_series_equal(again, first)
+
+def test_cache_is_bounded():
+    normalizer = DateNormalizer()
+    normalizer.MAX_CACHE_SIZE = 5
+    normalizer.parse(pd.Series(DATES, dtype=object))
+    assert not normalizer.cache
+    normalizer.parse(pd.Series(DATES[:3], dtype=object))
+    assert len(normalizer.cache) == 3
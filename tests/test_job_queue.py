@@ -0,0 +1,68 @@
+import os
+import queue
+import sys
+import time
+
+import pytest
+
+import job_queue
+from job_queue import JobQueue
+
+def test_jobs_read_sheets_in_their_worker(monkeypatch):
+    calls = []
+
+    def clean_file(*args, **kwargs):
+        calls.append(kwargs)
+        return 'data', None, 0.0, None
+
+    monkeypatch.setattr(job_queue, 'clean_file', clean_file)
+    monkeypatch.setattr(job_queue, '_progress_queue', queue.Queue())
+    result = job_queue._run_job('job', object, 'orders.xlsx', False, 'c', 'product.csv', None, False)
+    assert result[0] == 'data'
+    assert calls[0]['sheet_workers'] == 1
+
+def crash_or_clean(cleaner_class, file_path, *args, **kwargs):
+    if file_path.endswith('crash.csv'):
+        # Like a worker killed for memory
+        os._exit(1)
+    return 'data', None, 0.0, None
+
+def wait_for(jobs, job_id):
+    for _ in range(200):
+        status = jobs.status(job_id)
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='workers must fork to see the patched clean_file')
+def test_queue_recovers_after_a_worker_dies(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'clean_file', crash_or_clean)
+    jobs = JobQueue(workers=1, max_pending=1)
+    try:
+        crash = tmp_path / 'crash.csv'
+        crash.write_text('x')
+        assert wait_for(jobs, jobs.submit(object, str(crash), 'Noon', 'crash.csv'))['status'] == 'failed'
+        assert not crash.exists()
+        # More jobs than max_pending: each one ran, none was left queued on the dead pool
+        for i in range(3):
+            upload = tmp_path / f'orders{i}.csv'
+            upload.write_text('x')
+            assert wait_for(jobs, jobs.submit(object, str(upload), 'Noon', upload.name))['status'] == 'done'
+            assert not upload.exists()
+    finally:
+        jobs.executor.shutdown()
+
+def test_failed_submit_lists_no_job(monkeypatch):
+    jobs = JobQueue(workers=1)
+
+    def broken(*args):
+        raise RuntimeError('no pool')
+
+    monkeypatch.setattr(jobs, 'submit_job', broken)
+    try:
+        with pytest.raises(RuntimeError):
+            jobs.submit(object, 'orders.csv', 'Noon', 'orders.csv')
+        assert jobs.list() == []
+    finally:
+        jobs.executor.shutdown()
@@ -0,0 +1,105 @@
+import os
+import re
+
+import pytest
+
+import app as app_module
+import metrics
+from metrics import Counter, Histogram, Registry
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# name{label="value",...} number, as Prometheus parses a sample line
+SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)*\})? (-?[0-9.e+-]+|[+-]Inf)$')
+
+@pytest.fixture
+def registry(monkeypatch):
+    """The app's metrics with nothing observed yet"""
+    for metric in metrics.REGISTRY.metrics.values():
+        monkeypatch.setattr(metric, 'series', {})
+    monkeypatch.setattr(metrics, '_enabled', False)
+    return metrics.REGISTRY
+
+def samples(text):
+    """{sample name with labels: value} of a /metrics page"""
+    values = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            assert SAMPLE.match(line), line
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+def test_text_format():
+    registry = Registry()
+    registry.register(Counter('rows_total', 'Rows seen', ['stage']))
+    registry.register(Histogram('wait_seconds', 'Waiting', ['queue'], buckets=(0.1, 1)))
+    registry.observe('rows_total', ('read',), 5)
+    registry.observe('rows_total', ('read',), 2)
+    registry.observe('rows_total', ('say "hi"\\',), 1)
+    for value in (0.05, 0.1, 0.5, 7):
+        registry.observe('wait_seconds', ('jobs',), value)
+    assert registry.render() == '\n'.join([
+        '# HELP rows_total Rows seen',
+        '# TYPE rows_total counter',
+        'rows_total{stage="read"} 7',
+        'rows_total{stage="say \\"hi\\"\\\\"} 1',
+        '# HELP wait_seconds Waiting',
+        '# TYPE wait_seconds histogram',
+        # Cumulative, a value on a bound counts in that bucket
+        'wait_seconds_bucket{queue="jobs",le="0.1"} 2',
+        'wait_seconds_bucket{queue="jobs",le="1"} 3',
+        'wait_seconds_bucket{queue="jobs",le="+Inf"} 4',
+        'wait_seconds_sum{queue="jobs"} 7.65',
+        'wait_seconds_count{queue="jobs"} 4',
+    ]) + '\n'
+
+def test_worker_observations_are_replayed(registry):
+    def clean(rows):
+        timer = metrics.stage_timer('Noon')
+        timer.mark('read', None, rows)
+        return rows
+
+    result, records = metrics.collected(True, clean, 3)
+    assert result == 3
+    # Kept for the parent, not counted in the worker
+    assert registry.metrics['cleaner_stage_rows_out_total'].series == {}
+    metrics.replay(records)
+    assert registry.metrics['cleaner_stage_rows_out_total'].series == {('Noon', 'read'): 3}
+    assert metrics.collected(False, clean, 3) == (3, [])
+
+def test_metrics_page_counts_requests_and_stages(registry, tmp_path, monkeypatch):
+    flask_app = app_module.app
+    monkeypatch.setitem(flask_app.config, 'METRICS_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'PRODUCT_CSV', os.path.join(DATA, 'product.csv'))
+    monkeypatch.setitem(flask_app.config, 'RESULT_STORE_DIR', str(tmp_path / 'results'))
+    monkeypatch.setattr(app_module, '_result_store', None)
+    monkeypatch.setattr(app_module, '_result_cache', None)
+    client = flask_app.test_client()
+
+    for _ in range(2):
+        client.get('/api/products')
+    client.get('/no/such/page')
+    with open(os.path.join(DATA, 'noon.csv'), 'rb') as f:
+        assert client.post('/api/clean', data={'marketplace': 'Noon', 'file': (f, 'noon.csv'), 'cache': '0'}).status_code == 200
+
+    response = client.get('/metrics')
+    assert response.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    values = samples(response.get_data(as_text=True))
+    assert values['http_request_duration_seconds_count{method="GET",route="/api/products",status="200"}'] == 2
+    assert values['http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}'] == 1
+    assert values['http_request_duration_seconds_count{method="POST",route="/api/clean",status="200"}'] == 1
+    assert values['cleaner_clean_seconds_count{marketplace="Noon"}'] == 1
+    assert values['cleaner_stage_rows_out_total{marketplace="Noon",stage="reorder"}'] == 33
+
+    # The /metrics request itself is counted once it is answered
+    values = samples(client.get('/metrics').get_data(as_text=True))
+    assert values['http_request_duration_seconds_count{method="GET",route="/metrics",status="200"}'] == 1
+
+def test_nothing_is_measured_when_disabled(registry, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'METRICS_ENABLED', False)
+    client = app_module.app.test_client()
+    client.get('/api/products')
+    assert client.get('/metrics').status_code == 404
+    assert metrics.stage_timer('Noon') is metrics.NULL_TIMER
+    assert all(not metric.series for metric in registry.metrics.values())
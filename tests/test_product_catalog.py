@@ -0,0 +1,116 @@
+import multiprocessing
+import sys
+
+import pandas as pd
+import pytest
+
+import app as app_module
+from product_catalog import SEARCH_WEIGHTS, ProductCatalog, ProductSearchIndex
+from product_store import PRODUCT_COLUMNS
+
+def products(skus):
+    return pd.DataFrame([{'Brand': 'B', 'Category': 'C', 'Sub-Category': 'S', 'Product Titles': f'Item {sku}',
+                          'SKU': sku, 'Partner SKU': f'P-{sku}'} for sku in skus], columns=PRODUCT_COLUMNS)
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'product.csv'
+    products(['BASE-1']).to_csv(path, index=False)
+    return str(path)
+
+def test_add_reads_rows_another_worker_appended(csv_path):
+    mine, theirs = ProductCatalog(csv_path).refresh(), ProductCatalog(csv_path).refresh()
+    assert theirs.add(products(['A1', 'A2'])) == 2
+    # mine loaded before those rows went in
+    assert mine.add(products(['A2', 'M1']), unique=True) == 1
+    assert sorted(mine.df['SKU']) == ['A1', 'A2', 'BASE-1', 'M1']
+    assert mine.has_sku('A1')
+    assert mine.version == ProductCatalog(csv_path).refresh().version
+
+def test_import_after_another_worker_appended(csv_path):
+    mine, theirs = ProductCatalog(csv_path).refresh(), ProductCatalog(csv_path).refresh()
+
+    def chunks():
+        yield products(['I1', 'I2'])
+        # Another worker appends between our chunks
+        theirs.add(products(['T1']))
+        yield products(['I3', 'T1', 'I1'])
+
+    assert mine.import_chunks(chunks()) == (3, 2)
+    written = pd.read_csv(csv_path)
+    assert sorted(written['SKU']) == ['BASE-1', 'I1', 'I2', 'I3', 'T1']
+    assert sorted(mine.df['SKU']) == sorted(written['SKU'])
+    assert len(mine.search_index.search('item')) == len(written)
+
+def add_products(path, skus, start, results):
+    catalog = ProductCatalog(path).refresh()
+    start.wait()
+    results.put(sum(catalog.add(products([sku]), unique=True) for sku in skus))
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='needs fork and fcntl')
+def test_concurrent_unique_adds_never_duplicate(csv_path):
+    context = multiprocessing.get_context('fork')
+    start = context.Barrier(4)
+    # Every worker tries the same SKUs, in a different order
+    skus = [f'SKU-{i}' for i in range(40)]
+    orders = [skus, skus[::-1], skus[::2] + skus[1::2], skus[1::2] + skus[::2]]
+    results = context.Queue()
+    workers = [context.Process(target=add_products, args=(csv_path, order, start, results)) for order in orders]
+    for worker in workers:
+        worker.start()
+    added = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    written = pd.read_csv(csv_path)
+    assert sum(added) == len(skus)
+    assert not written['SKU'].duplicated().any()
+    assert len(written) == len(skus) + 1
+
+SEARCH_ROWS = pd.DataFrame([
+    # Brand, Category, Sub-Category, Product Titles, SKU, Partner SKU
+    ['Canon', 'Cameras', 'DSLR', 'Canon EOS 90D', 'CAM', 'P1'],
+    ['Camera Co', 'Video', 'Webcams', 'Desk light', 'W1', 'P2'],
+    ['Logi', 'Video', 'Webcams', 'HD webcam', 'W2', 'P3'],
+    ['Sony', 'Audio', 'Headphones', 'WH-1000XM5 headphones', 'XM5', 'P4'],
+    [None, 'Audio', None, 'Cable', 'C1', 'P5'],
+], columns=PRODUCT_COLUMNS)
+
+def substring_search(df, query):
+    """Rows where every term is inside some search column, as a scan would find them"""
+    text = df[list(SEARCH_WEIGHTS)].astype(str).apply(lambda column: column.str.lower())
+    return {row for row in range(len(df))
+            if all(any(term in cell for cell in text.iloc[row]) for term in query.lower().split())}
+
+def test_search_ranks_exact_then_prefix_then_substring():
+    index = ProductSearchIndex()
+    index.add(SEARCH_ROWS)
+    # SKU 'CAM' exactly (3 x 4), Brand 'Camera' prefix (2 x 3), title 'webcam' substring (1 x 2)
+    assert index.search('cam') == {0: 12, 1: 6, 2: 2}
+    # Every term must match; the scores add up
+    assert index.search('cam canon') == {0: 12 + 9}
+    # Best match per term: 'Webcams' sub-category prefix (2 x 1) < 'webcam' title (3 x 2)
+    assert index.search('webcam video') == {1: 2 + 3, 2: 6 + 3}
+    assert index.search('nothing') == {}
+
+@pytest.mark.parametrize('query', ['c', 'ca', 'am', 'x', '1', 'WH-', 'nan', 'a v', 'audio c', 'eos 90'])
+def test_search_finds_what_a_substring_scan_finds(query):
+    index = ProductSearchIndex()
+    # Indexed in two parts, as a catalog appends rows
+    index.add(SEARCH_ROWS.iloc[:2])
+    index.add(SEARCH_ROWS.iloc[2:])
+    assert set(index.search(query)) == substring_search(SEARCH_ROWS, query)
+
+def test_products_api_ranks_filtered_search(tmp_path, monkeypatch):
+    path = tmp_path / 'product.csv'
+    SEARCH_ROWS.to_csv(path, index=False)
+    monkeypatch.setitem(app_module.app.config, 'PRODUCT_CSV', str(path))
+    client = app_module.app.test_client()
+
+    result = client.get('/api/products?search=cam').get_json()
+    assert [product['SKU'] for product in result['products']] == ['CAM', 'W1', 'W2']
+    assert (result['total'], result['filtered_total']) == (5, 3)
+    result = client.get('/api/products?search=cam&category=video').get_json()
+    assert [product['SKU'] for product in result['products']] == ['W1', 'W2']
+    assert (result['total'], result['filtered_total']) == (5, 2)
+    result = client.get('/api/products?search=ca').get_json()
+    assert result['filtered_total'] == len(substring_search(SEARCH_ROWS, 'ca'))
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from product_catalog import ProductCatalog
+from product_store import PRODUCT_COLUMNS, ProductStore
+
+def products(skus):
+    return pd.DataFrame([{'Brand': 'B', 'Category': 'C', 'Sub-Category': 'S', 'Product Titles': 'T',
+                          'SKU': sku, 'Partner SKU': 'P'} for sku in skus], columns=PRODUCT_COLUMNS)
+
+@pytest.fixture(params=['product.csv', 'product.db'])
+def catalog(request, tmp_path):
+    path = str(tmp_path / request.param)
+    if path.endswith('.csv'):
+        products(['ABC']).to_csv(path, index=False)
+    else:
+        ProductStore(path).add(products(['ABC']))
+    return ProductCatalog(path).refresh()
+
+def test_both_backends_strip_skus_for_uniqueness(catalog):
+    assert catalog.has_sku(' ABC ')
+    assert catalog.add(products([' ABC ', 'ABC\t']), unique=True) == 0
+    assert catalog.add(products([' XYZ ']), unique=True) == 1
+    assert catalog.has_sku('XYZ')
+    assert catalog.import_chunks([products(['XYZ', ' NEW', 'NEW '])]) == (1, 2)
+
+def test_store_keeps_skus_stripped(tmp_path):
+    store = ProductStore(str(tmp_path / 'product.db'))
+    store.add(products(['  ABC  ']))
+    assert store.read_frame()['SKU'].tolist() == ['ABC']
+    assert store.exists('SKU', 'ABC ')
+    assert store.add(products(['ABC']), unique=True) == 0
+
+def test_store_strips_skus_saved_before(tmp_path):
+    path = str(tmp_path / 'product.db')
+    ProductStore(path)
+    with sqlite3.connect(path) as conn:
+        # A store from before SKUs were stripped on insert
+        conn.execute('DELETE FROM store_info')
+        conn.execute('INSERT INTO products (SKU) VALUES (?)', (' OLD ',))
+    reopened = ProductStore(path)
+    assert reopened.read_frame()['SKU'].tolist() == ['OLD']
+    # Values changed in place, so readers reload everything
+    assert reopened.version()[1] == 1
+    # Nothing left to strip the next time
+    assert ProductStore(path).version()[1] == 1
+
+def test_stripped_store_opens_without_the_repair(tmp_path, monkeypatch):
+    path = str(tmp_path / 'product.db')
+    ProductStore(path).add(products(['ABC']))
+
+    def strip_stored(self):
+        pytest.fail('a stripped store was repaired again')
+
+    monkeypatch.setattr(ProductStore, 'strip_stored', strip_stored)
+    assert ProductStore(path).count() == 1
+
+def test_filters_match_on_both_backends(catalog):
+    catalog.add(pd.DataFrame({
+        'Brand': ['Apple', 'Apple Inc', 'Samsung', None],
+        'Category': ['Phones', 'Laptops', 'Phones', 'Phones'],
+        'Sub-Category': ['Smart', 'Pro', 'Smart', None],
+        'Product Titles': 'T',
+        'SKU': ['A1', 'A2', 'S1', 'X1']
+    }, columns=PRODUCT_COLUMNS))
+
+    def skus(**patterns):
+        return catalog.filter(patterns)['SKU'].tolist()
+
+    assert skus(Brand='apple') == ['A1', 'A2']
+    assert skus(Brand='^Apple$') == ['A1']
+    assert skus(Brand='a', Category='phones') == ['A1', 'S1']
+    assert skus(**{'Sub-Category': 'smart', 'SKU': 's'}) == ['S1']
+    assert skus(Brand='Nokia') == []
+    assert skus(Brand='') == ['ABC', 'A1', 'A2', 'S1', 'X1']
+    # Positions of the catalog frame, as the search index uses
+    assert catalog.filter({'SKU': 'S1'}).index.tolist() == [3]
+
+def test_store_catalog_filters_through_the_index(tmp_path, monkeypatch):
+    path = str(tmp_path / 'product.db')
+    ProductStore(path).add(products(['ABC', 'XYZ']))
+    catalog = ProductCatalog(path).refresh()
+    calls = []
+    find_ids = catalog.store.find_ids
+    monkeypatch.setattr(catalog.store, 'find_ids', lambda values, last_id=None: calls.append(values) or find_ids(values, last_id))
+    assert catalog.filter({'SKU': 'xy', 'Brand': ''})['SKU'].tolist() == ['XYZ']
+    assert calls == [{'SKU': ['XYZ']}]
+    # A row another worker added after our read is not returned before a refresh
+    ProductStore(path).add(products(['XY2']))
+    assert catalog.filter({'SKU': 'xy'})['SKU'].tolist() == ['XYZ']
+    assert catalog.refresh().filter({'SKU': 'xy'})['SKU'].tolist() == ['XYZ', 'XY2']
@@ -0,0 +1,85 @@
+import datetime
+import io
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from your_cleaning_script import NA_VALUES, AmazonCleaner, BaseCleaner, XlsxReader, first_dated
+
+@pytest.fixture
+def cleaner(tmp_path):
+    return BaseCleaner(str(tmp_path / 'orders.csv'), master_path=str(tmp_path / 'product.csv'))
+
+def test_first_dated():
+    values = np.array([None, np.nan, pd.NaT, '', 'NaT', 'today', '03/04/2024', '2024-01-01'], dtype=object)
+    assert first_dated(values) == '03/04/2024'
+    assert first_dated(np.array([None, '', 'nan'], dtype=object)) is None
+
+def test_streamed_chunks_parse_dates_like_the_whole_column(cleaner):
+    # The whole column's format comes from '2024-03-04', so '05/06/2024' is no date
+    dates = pd.Series([None, None, '2024-03-04', '2024-12-01', '05/06/2024', '06/07/2024', 'x'], dtype=object)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        whole = cleaner.parse_date(dates)
+        cleaner._stream_state = {'streaming': True}
+        chunks = [cleaner.parse_date(dates[start:start + 2]) for start in range(0, len(dates), 2)]
+    pd.testing.assert_series_equal(pd.concat(chunks), whole)
+    assert whole.notna().sum() == 2
+
+def test_na_values_are_what_read_csv_reads_as_missing():
+    values = sorted(NA_VALUES) + ['x', 'NONE', 'n/A']
+    text = 'a\n' + '\n'.join(f'"{value}"' for value in values) + '\n'
+    read = pd.read_csv(io.StringIO(text), dtype=str)['a']
+    assert read.isna().tolist() == [value in NA_VALUES for value in values]
+
+WORKBOOK = {
+    # 1 after True reads as True, as in pandas' parser
+    'bools': [['a', 'b'], [True, 0], [1, False], [1, 0], [False, True]],
+    'cells': [['a', 'b', 'c'], [1, 2.5, 'x'], [3.0, None, 'NA'], [True, datetime.datetime(2024, 1, 2, 3, 4), 'null'],
+              [None, None, None], ['', 'q', None], ['#N/A', 1e-7, 10**16], [None, None, None]],
+    'names': [['a', 'a', None, 'a.1', 2024, 1.5, datetime.date(2024, 1, 1), 'a'], [1, 2, 3, 4, 5, 6, 7, 8]],
+    'header_only': [['a', 'b']],
+    'empty': []
+}
+
+@pytest.fixture
+def workbook(tmp_path):
+    from openpyxl import Workbook
+    book = Workbook()
+    book.remove(book.active)
+    for name, rows in WORKBOOK.items():
+        sheet = book.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    path = str(tmp_path / 'orders.xlsx')
+    book.save(path)
+    return path
+
+@pytest.mark.parametrize('sheet', list(WORKBOOK))
+def test_xlsx_reader_reads_like_read_excel(workbook, sheet):
+    expected = pd.read_excel(workbook, sheet_name=sheet, engine='openpyxl', dtype=str)
+    reader = XlsxReader(workbook)
+    try:
+        pd.testing.assert_frame_equal(reader.read_sheet(sheet), expected)
+        batches = list(reader.iter_batches(sheet, batch_size=2))
+        if batches:
+            pd.testing.assert_frame_equal(pd.concat(batches), expected)
+    finally:
+        reader.close()
+
+def test_workbook_closed_when_reading_sheets_fails(workbook, tmp_path, monkeypatch):
+    closed = []
+    close = XlsxReader.close
+    monkeypatch.setattr(XlsxReader, 'close', lambda reader: closed.append(reader) or close(reader))
+
+    def broken(self, xls, sheets):
+        raise RuntimeError('bad sheet')
+
+    monkeypatch.setattr(AmazonCleaner, 'read_sheets', broken)
+    cleaner = AmazonCleaner(workbook, master_path=str(tmp_path / 'product.csv'))
+    with pytest.raises(Exception):
+        # Falls back to reading the workbook as CSV, which fails too
+        cleaner.read_data()
+    assert len(closed) == 1
@@ -0,0 +1,94 @@
+import os
+import time
+import uuid
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from result_store import ResultCache, ResultStore
+
+def cleaned():
+    return pd.DataFrame({
+        'SKU': pd.array(['A', None, 'C'], dtype='string[pyarrow]'),
+        'Brand': pd.Categorical(['B', 'B', None]),
+        'Order Date': pd.to_datetime(['2024-01-02', None, '2024-03-04']),
+        'QTY': pd.array([1, None, 3], dtype='Int64'),
+        # fillna('') leaves strings and numbers in one column
+        'Price': ['', 2.5, 'x'],
+        'Status': ['Shipped', 'Delivered', 'CIR']
+    })
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'results')
+
+def test_other_worker_reads_spilled_frame_with_its_dtypes(directory):
+    data = cleaned()
+    session_id = ResultStore(directory).put(data, {'marketplace': 'Noon'})
+    other = ResultStore(directory)
+    loaded, meta = other.get(session_id)
+    pd.testing.assert_frame_equal(loaded, data)
+    assert meta == {'marketplace': 'Noon'}
+    assert other.stats()['disk_hits'] == 1
+    # Next read comes from its memory
+    other.get(session_id)
+    assert other.stats()['hits'] == 1
+
+def test_frames_arrow_cannot_hold_stay_in_memory(directory):
+    data = pd.DataFrame({'Share': [Fraction(1, 3), 'b', 1]})
+    store = ResultStore(directory)
+    session_id = store.put(data, {})
+    assert [name for name in os.listdir(directory) if name != 'cache'] == []
+    assert store.stats()['spill_errors'] == 1
+    pd.testing.assert_frame_equal(store.get(session_id)[0], data)
+    assert ResultStore(directory).get(session_id) is None
+
+def test_pickles_in_the_spill_directory_are_never_loaded(directory):
+    session_id = str(uuid.uuid4())
+    ResultStore(directory)
+    pd.to_pickle({'data': cleaned(), 'meta': {}}, os.path.join(directory, f'{session_id}.pkl'), compression='gzip')
+    assert ResultStore(directory).get(session_id) is None
+    assert oct(os.stat(directory).st_mode & 0o777) == oct(0o700)
+
+def test_unknown_and_expired_sessions_are_misses(directory):
+    store = ResultStore(directory, ttl=60)
+    session_id = store.put(cleaned(), {})
+    assert store.get('../etc/passwd') is None
+    assert store.get(str(uuid.uuid4())) is None
+    path = os.path.join(directory, f'{session_id}.arrow')
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert ResultStore(directory, ttl=60).get(session_id) is None
+    assert not os.path.exists(path)
+
+def test_memory_and_disk_limits(directory):
+    store = ResultStore(directory, max_sessions=2)
+    first, *rest = [store.put(cleaned(), {}) for _ in range(3)]
+    assert store.stats()['memory_sessions'] == 2
+    assert store.stats()['evictions'] == 1
+    # Evicted from memory, still on disk
+    assert store.get(first) is not None
+    size = max(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    small = ResultStore(directory, max_sessions=0, disk_bytes=size)
+    small.put(cleaned(), {})
+    assert small.stats()['disk_sessions'] == 1
+
+def test_cache_hits_return_their_info_until_the_session_is_gone(directory):
+    store = ResultStore(directory, max_sessions=1)
+    cache = ResultCache(store)
+    key = ResultCache.make_key('hash', 'Noon', False, 'v1', (1, 2))
+    assert key != ResultCache.make_key('hash', 'Noon', True, 'v1', (1, 2))
+    assert cache.get(key) is None
+    session_id = store.put(cleaned(), {})
+    cache.put(key, session_id, sku_matches={'exact': 3})
+    entry, (data, _) = cache.get(key)
+    assert entry['session_id'] == session_id
+    assert entry['sku_matches'] == {'exact': 3}
+    # Once the frame is evicted everywhere the entry is a miss and dropped
+    store.put(cleaned(), {})
+    os.unlink(os.path.join(directory, f'{session_id}.arrow'))
+    assert cache.get(key) is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'evictions': 0, 'entries': 0}
+    assert np.array_equal(data['Status'], cleaned()['Status'])
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sku_matcher import SkuMatcher, normalize_sku, normalize_skus, variant
+
+MASTER = pd.DataFrame({
+    'SKU': ['TSHIRT-BLK-42', 'PHONE-2', 'ZE76429E45999B752B788Z-1', 'CAMERA', 'AB12', 'DUP-A', 'DUPA'],
+    'Partner SKU': ['P-TS-42', 'P-PH-2', 'P-ZE', 'WHGS30', 'P-AB', 'P-DA', 'P-DB']
+})
+
+@pytest.fixture
+def matcher():
+    return SkuMatcher(MASTER)
+
+def test_normalize_folds_case_whitespace_and_separators_only():
+    assert normalize_sku('  ze-7642_a ') == 'ZE7642A'
+    assert normalize_sku('TSHIRT-BLK-42') == 'TSHIRTBLK42'
+    assert normalize_sku('PHONE-1') == 'PHONE1'
+    assert normalize_sku('nan') == ''
+    assert normalize_skus(pd.Series([' ab-1 ', None, 'X_y'])).tolist() == ['AB1', '', 'XY']
+
+def test_variant():
+    assert variant('TSHIRT-BLK-42') == '42'
+    assert variant('PHONE-1') is None
+    assert variant('CAMERA') is None
+
+@pytest.mark.parametrize('sku, row, kind', [
+    ('tshirt blk 42', 0, 'normalized'),
+    ('phone_2', 1, 'normalized'),
+    ('ze76429e45999b752b788z-1', 2, 'normalized'),
+    ('ZE76429E45999B752B788Z', 2, 'suffix'),
+    ('CAMERA-1', 3, 'suffix'),
+    ('whgs30', 3, 'normalized'),
+    ('ZE764Q9E45999B752B788Z-1', 2, 'fuzzy'),
+    ('CAMERRA', 3, 'fuzzy'),
+])
+def test_matches(matcher, sku, row, kind):
+    found = matcher.find(sku, 0.8)
+    assert found is not None
+    assert found[:2] == (row, kind)
+
+@pytest.mark.parametrize('sku', [
+    # Size / colour variants are other products
+    'TSHIRT-BLK-44', 'PHONE-3', 'PHONE', 'CAMERA-2',
+    # A typo in a short SKU is another SKU
+    'AB13',
+    # Two products normalize to 'DUPA'
+    'dup_a',
+    'TOTALLY-UNKNOWN', 'nan', ''
+])
+def test_no_match(matcher, sku):
+    assert matcher.find(sku, 0.8) is None
+
+def test_confidence_by_kind(matcher):
+    assert matcher.find('tshirt blk 42', 0.8)[2] == 0.95
+    assert matcher.find('p-ts-42', 0.8)[2] == 0.9
+    assert matcher.find('CAMERA-1', 0.8)[2] == 0.85
+    assert matcher.find('CAMERA-1', 0.9) is None
+    assert 0.8 <= matcher.find('CAMERRA', 0.8)[2] < 0.9
+
+def test_resolve_fills_misses_and_reports_rows(matcher):
+    values = np.array(['CAMERA', 'camera', 'TSHIRT-BLK-44', 'camera', 'CAMERA-1'], dtype=object)
+    positions = np.array([3, -1, -1, -1, -1])
+    resolved, report = matcher.resolve(values, positions, 0.8)
+    assert resolved.tolist() == [3, 3, -1, 3, 3]
+    assert {kind: report[kind] for kind in ['exact', 'normalized', 'suffix', 'fuzzy', 'unmatched']} == \
+        {'exact': 1, 'normalized': 2, 'suffix': 1, 'fuzzy': 0, 'unmatched': 1}
+    matches = {match['sku']: match for match in report['matches']}
+    assert matches['camera']['rows'] == [1, 3]
+    assert matches['CAMERA-1']['kind'] == 'suffix'
+    assert 'TSHIRT-BLK-44' not in matches
+    # The exact positions passed in are left alone
+    assert positions.tolist() == [3, -1, -1, -1, -1]
@@ -1,266 +1,1078 @@
 import pandas as pd
 import numpy as np
 from dateutil import parser
+from datetime import datetime
 import os
+import csv
+import io
+import hashlib
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import defaultdict
+from string import Formatter
+from product_store import is_product_store, get_product_store
+import metrics
+from sku_matcher import SkuMatcher
+
+try:
+    import pyarrow
+    from pyarrow import csv as pa_csv
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    # Without pyarrow the high-cardinality columns stay object in compact mode
+    # and the pyarrow read engine falls back to the C parser
+    pa_csv = None
+    STRING_DTYPE = None
+
+# CSV read engines - pyarrow is multithreaded, 'c' is the pandas C parser
+READ_ENGINES = ['c', 'pyarrow']
+
+# Strings read_csv / read_excel read as missing by default
+NA_VALUES = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                       '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+
+# Strings pd.to_datetime passes over when it guesses a column's date format from its first value
+UNDATED_STRINGS = frozenset(['', 'NaT', 'nat', 'NAT', 'nan', 'NaN', 'NAN', 'now', 'today'])
+
+def first_dated(values):
+    """The value pd.to_datetime guesses the date format of values from, None if there is none"""
+    for value in values:
+        if isinstance(value, str):
+            if value not in UNDATED_STRINGS:
+                return value
+        elif not pd.isna(value):
+            return value
+    return None
+
+# Modules whose code decides the cleaned output
+CLEANER_MODULES = ['your_cleaning_script.py', 'sku_matcher.py', 'product_store.py']
+
+def cleaner_version():
+    """Changes whenever a CLEANER_MODULES file does, so cached results from older cleaning code are not reused"""
+    digest = hashlib.sha256()
+    for name in CLEANER_MODULES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+CLEANER_VERSION = cleaner_version()
+
+def file_version(path):
+    """(mtime_ns, size) of a file, None when it does not exist"""
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+def product_version(path):
+    """Version of the product master: file_version for a CSV, ProductStore.version() for a SQLite store"""
+    if is_product_store(path):
+        return get_product_store(path).version()
+    return file_version(path)
+
+# Export formats (Parquet and Feather need pyarrow) and their compression choices
+EXPORT_FORMATS = {
+    'csv': {'extensions': ['.csv'], 'compressions': [None]},
+    'parquet': {'extensions': ['.parquet', '.pq'], 'compressions': ['snappy', 'zstd', 'gzip', 'brotli', 'lz4', 'none']},
+    # Uncompressed by default so readers can memory-map it without copying
+    'feather': {'extensions': ['.feather', '.arrow', '.ipc'], 'compressions': ['uncompressed', 'lz4', 'zstd']}
+}
+
+# Price, quantity and GMV columns of the cleaners' output. Typed exports write
+# them as numbers even where the cleaner kept the export's text (Revibe)
+NUMERIC_EXPORT_COLUMNS = ['Sales_Price', 'Sales price', 'Sales Price', 'QTY', 'GMV']
+
+class DateNormalizer:
+    """
+    Parse date strings exactly like parser.parse(x, dayfirst=True, fuzzy=True),
+    but each distinct string only once. Known formats are tried with vectorized
+    pd.to_datetime first and only the leftovers go through fuzzy dateutil.
+    Results are cached across calls, so repeat uploads skip parsing entirely.
+    """
+    # Ordered like dateutil's dayfirst guess: day/month first, then the swap
+    # it falls back to when the day is > 12 (so 2024-01-02 -> 1 Feb 2024)
+    DATE_FORMATS = ['%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y', '%d.%m.%Y',
+                    '%Y-%d-%m', '%Y-%m-%d', '%Y/%d/%m', '%Y/%m/%d']
+    TIME_FORMATS = ['', ' %H:%M', ' %H:%M:%S', 'T%H:%M:%S', ' %H:%M:%S.%f']
+    MAX_CACHE_SIZE = 500000
+
+    def __init__(self):
+        self.cache = {}
+
+    def parse(self, values):
+        """Return (parsed Series, stats) where stats counts values per path"""
+        stats = {'values': len(values), 'unique': 0, 'blank': 0, 'cached': 0, 'format': 0, 'fuzzy': 0}
+        keys = values.astype(str)
+        counts = keys[values.notna()].value_counts()
+        stats['unique'] = len(counts)
+        stats['blank'] = int(len(values) - counts.sum())
+
+        lookup = {}
+        pending = []
+        for text in counts.index:
+            if not text.strip():
+                lookup[text] = pd.NaT
+                stats['blank'] += int(counts[text])
+            elif text in self.cache:
+                lookup[text] = self.cache[text]
+                stats['cached'] += int(counts[text])
+            else:
+                pending.append(text)
+
+        # Vectorized pass over the distinct strings for each known format
+        pending = pd.Series(pending, dtype=object)
+        for date_format in self.DATE_FORMATS:
+            for time_format in self.TIME_FORMATS:
+                if pending.empty:
+                    break
+                parsed = pd.to_datetime(pending, format=date_format + time_format, errors='coerce')
+                hits = parsed.notna()
+                for text, value in zip(pending[hits], parsed[hits]):
+                    lookup[text] = self.cache[text] = value
+                stats['format'] += int(counts[pending[hits]].sum())
+                pending = pending[~hits]
+
+        # Fuzzy dateutil for whatever is left
+        for text in pending:
+            lookup[text] = self.cache[text] = parser.parse(text, dayfirst=True, fuzzy=True)
+            stats['fuzzy'] += int(counts[text])
+
+        if len(self.cache) > self.MAX_CACHE_SIZE:
+            self.cache.clear()
+
+        parsed = keys.map(lookup)
+        parsed[values.isna()] = pd.NaT
+        return parsed, stats
+
+# Shared by every cleaner in this process so the cache survives between requests
+date_normalizer = DateNormalizer()
+
+class MasterIndex:
+    """
+    product.csv loaded once per process, with hashed lookups on SKU / Partner SKU.
+    The file is re-read only when its mtime or size changes, and the key indexes
+    are built once per load, so enrichment is an index lookup instead of a merge.
+    With a SQLite product store (see product_store) only the rows added since
+    the last load are read.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.df = pd.DataFrame()
+        self.indexes = {}
+        self.categoricals = {}
+        self.sku_matcher = None
+
+    def refresh(self):
+        """Reload product.csv if it changed since the last load"""
+        version = product_version(self.path)
+        if version == self.version:
+            return self
+
+        df = pd.DataFrame()
+        if version is not None:
+            try:
+                if not is_product_store(self.path):
+                    df = pd.read_csv(self.path)
+                elif self.version is not None and self.version[:2] == version[:2]:
+                    # Same generation: append what was added since
+                    added = get_product_store(self.path).read_frame(after_id=self.version[2], last_id=version[2])
+                    df = pd.concat([self.df, added], ignore_index=True)
+                else:
+                    df = get_product_store(self.path).read_frame(last_id=version[2])
+                # Clean SKU columns
+                if 'SKU' in df.columns:
+                    df['SKU'] = df['SKU'].astype(str).str.strip()
+                if 'Partner SKU' in df.columns:
+                    df['Partner SKU'] = df['Partner SKU'].astype(str).str.strip()
+                print(f"Master data loaded: {len(df)} products")
+            except Exception as e:
+                print(f"Warning: Could not load master data: {e}")
+        self.df = df
+        self.indexes = {}
+        self.categoricals = {}
+        self.sku_matcher = None
+        self.version = version
+        return self
+
+    def positions(self, key, values):
+        """
+        Row of each value in the master key column (-1 when not found),
+        or None when the key has duplicate SKUs and needs a merge instead
+        """
+        if key not in self.indexes:
+            self.indexes[key] = pd.Index(self.df[key])
+        index = self.indexes[key]
+        if not index.is_unique:
+            return None
+        return index.get_indexer(values)
+
+    def matcher(self):
+        """SkuMatcher over the normalized SKUs / Partner SKUs, built once per load"""
+        if self.sku_matcher is None:
+            self.sku_matcher = SkuMatcher(self.df)
+        return self.sku_matcher
+
+    def take(self, column, positions, compact=False):
+        """Values of a master column at the given rows (NaN where not found)"""
+        if compact:
+            # Categorical take only moves the codes
+            if column not in self.categoricals:
+                self.categoricals[column] = pd.Categorical(self.df[column])
+            return self.categoricals[column].take(positions, allow_fill=True)
+        return pd.api.extensions.take(self.df[column].to_numpy(), positions, allow_fill=True)
+
+_master_indexes = {}
+_master_lock = threading.Lock()
+
+def get_master_index(path='product.csv'):
+    """Shared MasterIndex for the path (product CSV or SQLite store), reloaded if it changed"""
+    with _master_lock:
+        if path not in _master_indexes:
+            _master_indexes[path] = MasterIndex(path)
+        return _master_indexes[path].refresh()
+
+class XlsxReader:
+    """
+    Streaming .xlsx reader on openpyxl's read-only iter_rows. The workbook is
+    opened once and each sheet comes out in row batches that concatenate to
+    exactly pd.read_excel(path, sheet_name=sheet, dtype=str) - cells convert
+    like pandas' openpyxl reader and batches are typed like its parser -
+    without holding the whole sheet as Python lists first.
+    """
+    BATCH_SIZE = 50000
+
+    def __init__(self, path):
+        from openpyxl import load_workbook
+        self.path = path
+        self.book = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+        self.sheet_names = self.book.sheetnames
+
+    def close(self):
+        self.book.close()
+
+    def read_sheet(self, sheet):
+        """The whole sheet as one frame"""
+        try:
+            batches = list(self.iter_batches(sheet, strict=True))
+        except XlsxWidthError:
+            # Only the full reader knows the final width - let pandas do it
+            return pd.read_excel(self.path, sheet_name=sheet, engine='openpyxl', dtype=str)
+        if not batches:
+            return pd.DataFrame()
+        return pd.concat(batches) if len(batches) > 1 else batches[0]
+
+    def iter_batches(self, sheet, batch_size=BATCH_SIZE, strict=False):
+        """
+        Yield the sheet in frames of up to batch_size rows (RangeIndex carried
+        on across batches). pandas pads every row to the widest row of the
+        sheet; a data row wider than the header raises XlsxWidthError when
+        strict, otherwise its extra cells are dropped with a warning.
+        """
+        worksheet = self.book[sheet]
+        worksheet.reset_dimensions()
+        columns, width, offset = None, 0, 0
+        batch, blanks = [], 0
+        first_seen = {}
+        warned = False
+        for row in worksheet.rows:
+            values = [self.convert_cell(cell) for cell in row]
+            # Trim trailing empty cells
+            while values and values[-1] == '':
+                values.pop()
+
+            if columns is None:
+                columns = self.header_names(values) if values else []
+                width = len(values)
+                continue
+            if not values:
+                # Empty rows count only if data follows (trailing ones are trimmed)
+                blanks += 1
+                continue
+            if len(values) > width:
+                if strict or not width:
+                    raise XlsxWidthError(f"Row wider than the header in sheet {sheet}")
+                if not warned:
+                    print(f"Warning: Dropping cells beyond the header in sheet {sheet}")
+                    warned = True
+                values = values[:width]
+            # pandas' parser swaps each value for the first equal one in its column
+            # (1 read after True becomes True) - keep that memo across batches
+            for i, value in enumerate(values):
+                if type(value) in (bool, int) and (value == 0 or value == 1):
+                    values[i] = first_seen.setdefault((i, value), value)
+            batch.extend([''] * width for _ in range(blanks))
+            blanks = 0
+            batch.append(values + [''] * (width - len(values)))
+
+            if len(batch) >= batch_size:
+                yield self.parse_batch(batch, columns, offset)
+                offset += len(batch)
+                batch = []
+
+        # Nothing but empty rows reads as an empty frame
+        if not width:
+            return
+        if batch or offset == 0:
+            yield self.parse_batch(batch, columns, offset)
+
+    @staticmethod
+    def header_names(values):
+        """
+        Column names as read_excel makes them: blanks become 'Unnamed: i' and
+        repeats 'a.1' (read_csv does that part), other cells keep their type
+        """
+        line = io.StringIO()
+        csv.writer(line).writerow([str(value) for value in values])
+        names = pd.read_csv(io.StringIO(line.getvalue()), nrows=0, dtype=str).columns
+        return [value if name == str(value) else name for name, value in zip(names, values)]
+
+    @staticmethod
+    def parse_batch(rows, columns, offset):
+        """Rows as read_excel(dtype=str) types them: str(cell), NaN for the NA_VALUES strings"""
+        if rows:
+            frame = pd.DataFrame(rows, columns=columns, dtype=object)
+            frame = frame.astype(str).mask(frame.isna() | frame.isin(NA_VALUES))
+        else:
+            frame = pd.DataFrame(columns=columns, dtype=object)
+        frame.index = pd.RangeIndex(offset, offset + len(frame))
+        return frame
+
+    @staticmethod
+    def convert_cell(cell):
+        """Same as pandas' openpyxl reader"""
+        if cell.value is None:
+            return ''
+        elif cell.data_type == 'e':
+            return np.nan
+        elif cell.data_type == 'n':
+            value = int(cell.value)
+            if value == cell.value:
+                return value
+            return float(cell.value)
+        return cell.value
+
+class XlsxWidthError(ValueError):
+    pass
+
+class CleanerSpec:
+    """
+    Declarative description of one marketplace's output. The spec is compiled
+    once (when the cleaner class is defined) and build() then makes the cleaned
+    frame in a single pass from a dict of columns, instead of insert / pop /
+    reorder on a growing DataFrame.
+
+    sources       output column -> input aliases (first one present wins)
+    as_str        convert source columns to str first (NaN becomes 'nan')
+    defaults      value for a source column missing from the input
+    date          how Date is parsed and Month / Month Number / Year derived
+    constants     output column -> fixed value
+    lookups       output column -> (source column, mapping, value when not mapped)
+    templates     output column -> '{Model} {Variation}' style concatenation,
+                  '!s' converts the column to str; '' if a column is missing
+    numeric       column -> fill value after pd.to_numeric(errors='coerce')
+    gmv           (price column, qty column) multiplied into GMV, 0 without price
+    status_filter Status values dropped from the output
+    value_maps    column -> {old: new}
+    enrich        fill blank columns from product.csv by SKU
+    cancelled     column -> value set on Cancelled rows
+    output        final column order
+    fill_missing_output  add '' for output columns the input could not provide
+    sort_by       column to sort the final frame by
+
+    In compact mode (cleaner.compact) the low-cardinality columns are kept as
+    categoricals and the high-cardinality ones as arrow strings, from the read
+    through to the cleaned frame. Filters and value maps then work per category.
+    """
+    # Compact mode dtypes by output column
+    CATEGORY_COLUMNS = ['Month', 'Status', 'Partner Id', 'Partner ID', 'Nub Partner', 'Nub-Partner',
+                        'Country', 'Brand Name', 'Category', 'Sub-Category', 'Channel',
+                        'Fullfilment', 'Fulfillment']
+    STRING_COLUMNS = ['Order Number', 'SKU', 'Partner SKU']
+
+    def __init__(self, name, sources, output, as_str=False, defaults=None, date=None,
+                 constants=None, lookups=None, templates=None, numeric=None, gmv=None,
+                 status_filter=None, value_maps=None, enrich=None, cancelled=None,
+                 fill_missing_output=True, sort_by=None):
+        self.name = name
+        self.sources = {col: list(aliases) for col, aliases in sources.items()}
+        self.output = list(output)
+        self.as_str = as_str
+        self.defaults = dict(defaults or {})
+        self.date = dict({'parser': 'pandas', 'date_only': False, 'month_number_dtype': None,
+                          'blank_without_dates': False}, **(date or {}))
+        self.constants = dict(constants or {})
+        self.lookups = dict(lookups or {})
+        self.templates = {col: list(Formatter().parse(template)) for col, template in (templates or {}).items()}
+        self.numeric = dict(numeric or {})
+        self.gmv = gmv
+        self.status_filter = list(status_filter or [])
+        self.value_maps = {col: dict(mapping) for col, mapping in (value_maps or {}).items()}
+        self.enrich = enrich
+        self.cancelled = dict(cancelled or {})
+        self.fill_missing_output = fill_missing_output
+        self.sort_by = sort_by
+
+        if self.enrich:
+            for col in self.enrich['fill']:
+                if self.constants.get(col) != '':
+                    raise ValueError(f"{name} spec: enriched column '{col}' must start as a blank constant")
+
+    def resolve_sources(self, columns):
+        """Map output column -> input column for the sources present in `columns`"""
+        resolved = {}
+        for col, aliases in self.sources.items():
+            alias = next((alias for alias in aliases if alias in columns), None)
+            if alias is not None:
+                resolved[col] = alias
+        return resolved
+
+    def build(self, cleaner):
+        """Return the cleaned frame for cleaner.data (the raw input rows)"""
+        # Take the raw frame off the cleaner so it is freed once its columns are picked
+        data, cleaner.data = cleaner.data, None
+        stages = cleaner.stages
+        stages.restart()
+        resolved = self.resolve_sources(data.columns)
+        missing = [aliases[0] for col, aliases in self.sources.items() if col not in resolved]
+        if missing:
+            print(f"Warning: Missing columns in {self.name} data: {missing}")
+            print(f"Available columns: {list(data.columns)}")
+
+        compact = getattr(cleaner, 'compact', False)
+        columns = {}
+        for col, alias in resolved.items():
+            if compact and col in self.CATEGORY_COLUMNS:
+                columns[col] = self.to_category(data[alias], self.as_str)
+            elif compact and col in self.STRING_COLUMNS and STRING_DTYPE:
+                columns[col] = self.to_string(data[alias], self.as_str)
+            else:
+                columns[col] = data[alias].astype(str) if self.as_str else data[alias]
+        for col, value in self.defaults.items():
+            columns.setdefault(col, value)
+        index = data.index
+        del data
+        stages.mark('rename', len(index), len(index))
+
+        # Dates and numbers are derived before filtering - pandas picks the date
+        # format and int vs float from the whole column, like the old frame did
+        if 'Date' in columns:
+            date = columns['Date'] = self.parse_date(cleaner, columns['Date'])
+            if date.notna().any() or not self.date['blank_without_dates']:
+                columns['Month'] = date.dt.month_name()
+                columns['Month Number'] = date.dt.month
+                columns['Year'] = date.dt.year
+                if self.date['month_number_dtype']:
+                    columns['Month Number'] = columns['Month Number'].astype(self.date['month_number_dtype'])
+                    columns['Year'] = columns['Year'].astype(self.date['month_number_dtype'])
+            if cleaner._stream_state.get('streaming') and not self.date['month_number_dtype'] and date.isna().any():
+                # Missing dates make Month Number / Year floats for the whole file, but
+                # fillna('') hides that in chunks without a valid date - remember it
+                cleaner._stream_state.setdefault('float_columns', set()).update(['Month Number', 'Year'])
+        for col in ['Month', 'Month Number', 'Year']:
+            columns.setdefault(col, '')
+        stages.mark('dates', len(index), len(index))
+
+        for col, fill in self.numeric.items():
+            if isinstance(columns.get(col), pd.Series):
+                columns[col] = pd.to_numeric(columns[col], errors='coerce').fillna(fill)
+        if self.gmv:
+            price, qty = self.gmv
+            if price in columns:
+                qty = columns[qty]
+                if isinstance(qty, pd.Series):
+                    qty = pd.to_numeric(qty, errors='coerce').fillna(1)
+                columns['GMV'] = columns[price] * qty
+            else:
+                columns['GMV'] = 0
+        stages.mark('numeric', len(index), len(index))
+
+        # Status filter (on a categorical Status isin compares the category codes)
+        rows_in = len(index)
+        if self.status_filter and 'Status' in columns:
+            keep = ~columns['Status'].isin(self.status_filter)
+            if not keep.all():
+                columns = {col: values[keep] if isinstance(values, pd.Series) else values
+                           for col, values in columns.items()}
+                index = index[keep.to_numpy()]
+        stages.mark('status_filter', rows_in, len(index))
+
+        for col, value in self.constants.items():
+            columns[col] = value
+        for col, (source, mapping, fallback) in self.lookups.items():
+            if source in columns:
+                columns[col] = self.map_unique(columns[source], lambda x: mapping.get(str(x).strip(), fallback))
+            else:
+                columns[col] = ''
+        for col, parts in self.templates.items():
+            columns[col] = self.render_template(parts, columns)
+
+        # Value maps
+        for col, mapping in self.value_maps.items():
+            if isinstance(columns.get(col), pd.Series) and isinstance(columns[col].dtype, pd.CategoricalDtype):
+                columns[col] = self.recode(columns[col], lambda x: mapping.get(x, x))
+            elif isinstance(columns.get(col), pd.Series):
+                columns[col] = columns[col].replace(mapping)
+            elif col in columns:
+                columns[col] = mapping.get(columns[col], columns[col])
+        stages.mark('map', len(index), len(index))
+
+        # Fill blanks from master data
+        if self.enrich and cleaner.master is not None and not cleaner.master.df.empty and 'SKU' in columns:
+            rows_in = len(index)
+            columns, index, matches = self.enrich_from_master(cleaner.master, columns, index, compact,
+                                                              cleaner.sku_match)
+            if matches is not None:
+                cleaner.record_matches(matches)
+            stages.mark('enrich', rows_in, len(index))
+
+        # Cancelled orders
+        if self.cancelled and 'Status' in columns:
+            is_cancelled = self.map_unique(columns['Status'], lambda x: str(x).strip().upper() == 'CANCELLED').astype(bool)
+            for col, value in self.cancelled.items():
+                if isinstance(columns.get(col), pd.Series):
+                    columns[col] = columns[col].mask(is_cancelled, value)
+
+        if self.fill_missing_output:
+            output = self.output
+            for col in output:
+                columns.setdefault(col, '')
+        else:
+            output = [col for col in self.output if col in columns]
+        if compact:
+            for col in output:
+                columns[col] = self.compact_column(col, columns[col], index)
+
+        result = pd.DataFrame({col: columns.pop(col) for col in output}, index=index, copy=False)
+        if self.sort_by and self.sort_by in result.columns:
+            result = result.sort_values(by=self.sort_by, ascending=True)
+        if compact:
+            result = result.fillna({col: '' for col in result.columns
+                                    if not isinstance(result[col].dtype, pd.CategoricalDtype)})
+        else:
+            result = result.fillna('')
+        stages.mark('reorder', len(index), len(result))
+        return result
+
+    def parse_date(self, cleaner, values):
+        try:
+            if self.date['parser'] == 'dateutil':
+                parsed, stats = date_normalizer.parse(values)
+                print(f"Date Parsing (Date): {stats}")
+            else:
+                parsed = cleaner.parse_date(values)
+            if self.date['date_only']:
+                parsed = self.date_only(parsed)
+            return parsed
+        except Exception:
+            return pd.Series(pd.NaT, index=values.index)
+
+    @staticmethod
+    def date_only(values):
+        """Drop the time part - same result as pd.to_datetime(values.dt.date)"""
+        if pd.api.types.is_datetime64tz_dtype(values):
+            return values.dt.tz_localize(None).dt.normalize()
+        if pd.api.types.is_datetime64_dtype(values):
+            return values.dt.normalize()
+        return pd.to_datetime(pd.to_datetime(values).dt.date)
+
+    @classmethod
+    def map_unique(cls, values, func):
+        """values.map(func), calling func once per distinct value"""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return cls.recode(values, func)
+        uniques = values.unique()
+        return values.map(dict(zip(uniques, map(func, uniques))))
+
+    @staticmethod
+    def recode(values, func):
+        """
+        Categorical values.map(func) on the category codes - func runs once per
+        category (and once for missing), categories mapping together are merged
+        """
+        categories = values.cat.categories
+        codes = values.cat.codes.to_numpy()
+        mapped = [func(category) for category in categories]
+        if (codes == -1).any():
+            codes = np.where(codes == -1, len(mapped), codes)
+            mapped.append(func(np.nan))
+        remap, uniques = pd.factorize(pd.Index(mapped, dtype=object))
+        return pd.Series(pd.Categorical.from_codes(remap[codes], categories=uniques),
+                         index=values.index, name=values.name)
+
+    @staticmethod
+    def to_category(values, as_str=False):
+        """values as a categorical; with as_str missing values become 'nan' like astype(str)"""
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+        if as_str:
+            if not all(isinstance(category, str) for category in values.cat.categories):
+                return values.astype(str).astype('category')
+            if values.isna().any():
+                if 'nan' not in values.cat.categories:
+                    values = values.cat.add_categories('nan')
+                values = values.fillna('nan')
+        return values
+
+    @staticmethod
+    def to_string(values, as_str=False):
+        """values as arrow strings; with as_str missing values become 'nan' like astype(str)"""
+        if values.dtype != STRING_DTYPE:
+            return (values.astype(str) if as_str else values).astype(STRING_DTYPE)
+        return values.fillna('nan') if as_str else values
+
+    def compact_column(self, col, values, index):
+        """
+        Final compact dtype of an output column (scalars are broadcast).
+        Categoricals from the master are filled with '' like the category
+        columns, as the default mode fills every column.
+        """
+        if col in self.CATEGORY_COLUMNS or isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+            if not isinstance(values, pd.Series):
+                return pd.Series(pd.Categorical.from_codes(np.zeros(len(index), dtype='int8'), [values]), index=index)
+            values = self.to_category(values)
+            # Fill here - fillna('') on the frame only takes '' if it is a category
+            if values.isna().any():
+                if '' not in values.cat.categories:
+                    values = values.cat.add_categories('')
+                values = values.fillna('')
+            return values
+        if col in self.STRING_COLUMNS and STRING_DTYPE and isinstance(values, pd.Series):
+            return values if values.dtype == STRING_DTYPE else values.astype(STRING_DTYPE)
+        return values
+
+    @staticmethod
+    def render_template(parts, columns):
+        result = None
+        for literal, field, _, conversion in parts:
+            if field is not None and field not in columns:
+                return ''
+            pieces = [literal] if literal else []
+            if field is not None:
+                pieces.append(columns[field].astype(str) if conversion == 's' else columns[field])
+            for piece in pieces:
+                result = piece if result is None else result + piece
+        return result
+
+    def enrich_from_master(self, master, columns, index, compact=False, min_confidence=None):
+        """
+        Look up the master columns by SKU and fill the blank enrich columns
+        -> (columns, index, SKU match report or None). With min_confidence
+        SKUs missing from the master are matched approximately (see
+        sku_matcher) when that is at least as sure.
+        """
+        columns['SKU'] = self.map_unique(columns['SKU'], lambda x: str(x).strip())
+        master_key = next((key for key in self.enrich['master_keys'] if key in master.df.columns), None)
+        if master_key is None:
+            return columns, index, None
+
+        values = columns['SKU'].to_numpy()
+        positions = master.positions(master_key, values)
+        if positions is None:
+            # Duplicate master SKUs: exact matches only
+            return self.merge_master(master.df, master_key, columns, index) + (None,)
+        matches = None
+        if min_confidence is not None:
+            positions, matches = master.matcher().resolve(values, positions, min_confidence)
+
+        index = pd.RangeIndex(len(positions))
+        for col, values in columns.items():
+            if isinstance(values, pd.Series):
+                columns[col] = values.set_axis(index, copy=False)
+        for col, master_col in self.enrich['fill'].items():
+            columns[col] = pd.Series(master.take(master_col, positions, compact), index=index)
+        return columns, index, matches
+
+    def merge_master(self, master_df, master_key, columns, index):
+        """Left-join on SKU when the master has duplicate SKUs (rows repeat per match)"""
+        # Merge only the key column; row positions carry the join to every other column
+        keys = pd.DataFrame({'_key': columns['SKU'].to_numpy(), '_row': np.arange(len(index))})
+        master = master_df[[master_key] + list(self.enrich['fill'].values())]
+        master.columns = ['_key'] + [f'_{col}' for col in self.enrich['fill']]
+        matched = keys.merge(master, on='_key', how='left')
+
+        rows = matched['_row'].to_numpy()
+        index = pd.RangeIndex(len(matched))
+        repeated = len(rows) != len(keys)
+        for col, values in columns.items():
+            if isinstance(values, pd.Series):
+                values = values.iloc[rows] if repeated else values
+                columns[col] = values.set_axis(index, copy=False)
+        for col in self.enrich['fill']:
+            columns[col] = matched[f'_{col}']
+        return columns, index
 
 class BaseCleaner:
-    def __init__(self, file_path):
+    # Rows per chunk in streaming mode
+    DEFAULT_CHUNKSIZE = 50000
+    # Output schema of the marketplace (CleanerSpec)
+    SPEC = None
+    # Input columns read besides the SPEC sources
+    EXTRA_COLUMNS = []
+
+    def __init__(self, file_path, compact=False, engine='c', master_path='product.csv', sku_match=None):
         """
-        Initialize with file path
+        Initialize with file path. compact=True keeps low-cardinality columns
+        as categoricals and IDs as arrow strings (see CleanerSpec), engine is
+        the CSV reader ('c' or 'pyarrow'), master_path the product master
+        (product.csv or a SQLite product store). sku_match is the least
+        confidence of an approximate SKU match during enrichment (see
+        sku_matcher); None, the default, fills only exact SKUs
         """
+        if engine not in READ_ENGINES:
+            raise ValueError(f"Unknown read engine '{engine}', use one of {READ_ENGINES}")
+        if sku_match is not None and not 0 < sku_match <= 1:
+            raise ValueError(f"sku_match must be between 0 and 1, got {sku_match}")
         self.file_path = file_path
+        self.compact = compact
+        self.engine = engine
+        self.master_path = master_path
+        self.sku_match = sku_match
+        self.memory_report = None
+        # How enrichment matched SKUs (sku_matcher.SkuMatcher.resolve), rows as index labels of the cleaned data
+        self.match_report = None
+        # progress(stage, fraction) callback, set for background jobs
+        self.progress = None
+        # Stage timings of the current clean (metrics.stage_timer)
+        self.stages = metrics.NULL_TIMER
         self.data = None
+        self.master = None
         self.master_df = None
+        # State shared between chunks while streaming (empty for in-memory clean)
+        self._stream_state = {}
         self.load_master_data()
 
     def load_master_data(self):
-        """Load master product data"""
-        try:
-            if os.path.exists('product.csv'):
-                self.master_df = pd.read_csv('product.csv')
-                # Clean SKU columns
-                if 'SKU' in self.master_df.columns:
-                    self.master_df['SKU'] = self.master_df['SKU'].astype(str).str.strip()
-                if 'Partner SKU' in self.master_df.columns:
-                    self.master_df['Partner SKU'] = self.master_df['Partner SKU'].astype(str).str.strip()
-        except Exception as e:
-            print(f"Warning: Could not load master data: {e}")
-            self.master_df = pd.DataFrame()
+        """Load master product data (shared per process, re-read only when the master changes)"""
+        self.master = get_master_index(self.master_path)
+        self.master_df = self.master.df
 
     def read_data(self):
         try:
             if self.file_path.endswith('.csv'):
-                self.data = pd.read_csv(self.file_path, dtype=str)
-            elif self.file_path.endswith(('.xlsx', '.xls')):
+                self.data = self.read_csv()
+            elif self.file_path.endswith('.xlsx'):
+                xls = XlsxReader(self.file_path)
+                try:
+                    self.data = xls.read_sheet(xls.sheet_names[0])
+                finally:
+                    xls.close()
+            elif self.file_path.endswith('.xls'):
                 self.data = pd.read_excel(self.file_path, engine='openpyxl', dtype=str)
             print(f"Data Loaded: {self.data.shape}")
         except Exception as e:
             print(f"Error Reading File: {e}")
             raise e
 
-    def save_data(self, output_file):
+    def read_csv(self, chunksize=None):
+        """
+        Read the CSV input with the cleaner's engine, parsing only the columns
+        the cleaner uses. pyarrow falls back to the C parser if it can't read
+        the file (or isn't installed); chunked reads always use the C parser.
+        """
+        dtype = self.read_dtype()
+        wanted = self.read_columns()
+        if self.engine == 'pyarrow' and chunksize is None:
+            try:
+                return self.read_csv_pyarrow(dtype, wanted)
+            except Exception as e:
+                print(f"Warning: pyarrow read failed, using the C parser: {e}")
+        usecols = None if wanted is None else (lambda col: col in wanted)
+        return pd.read_csv(self.file_path, dtype=dtype, usecols=usecols, chunksize=chunksize)
+
+    def read_csv_pyarrow(self, dtype, wanted):
+        """Multithreaded pyarrow read giving the same frame as pd.read_csv(dtype=dtype)"""
+        if pa_csv is None:
+            raise ImportError("pyarrow is not installed")
+        names = pa_csv.open_csv(self.file_path).schema.names
+        if len(set(names)) != len(names) or '' in names:
+            # pandas renames these ('a.1', 'Unnamed: 0') - leave it to the C parser
+            raise ValueError("duplicate or blank column names")
+        names = [name for name in names if wanted is None or name in wanted]
+        table = pa_csv.read_csv(
+            self.file_path,
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pyarrow.string() for name in names},
+                include_columns=names,
+                null_values=sorted(NA_VALUES),
+                strings_can_be_null=True
+            )
+        )
+        columns = {}
+        for name in names:
+            values = table.column(name)
+            kind = dtype[name] if isinstance(dtype, dict) else dtype
+            if kind == 'category':
+                columns[name] = values.dictionary_encode().to_pandas()
+            elif kind == STRING_DTYPE:
+                columns[name] = pd.Series(pd.arrays.ArrowStringArray(values))
+            else:
+                # pyarrow gives None for nulls, read_csv gives NaN
+                columns[name] = values.to_pandas().fillna(np.nan)
+        return pd.DataFrame(columns, copy=False)
+
+    def read_columns(self):
+        """Input columns the cleaner uses (None reads them all)"""
+        if self.SPEC is None:
+            return None
+        wanted = set(self.EXTRA_COLUMNS)
+        for aliases in self.SPEC.sources.values():
+            wanted.update(aliases)
+        return wanted
+
+    def read_dtype(self):
+        """
+        dtype for read_csv - str, or in compact mode categories / arrow strings
+        for the spec's compact columns so they never exist as object strings
+        """
+        if not self.compact or self.SPEC is None:
+            return str
+        dtype = defaultdict(lambda: str)
+        for col, aliases in self.SPEC.sources.items():
+            for alias in aliases:
+                if col in self.SPEC.CATEGORY_COLUMNS:
+                    dtype[alias] = 'category'
+                elif col in self.SPEC.STRING_COLUMNS and STRING_DTYPE:
+                    dtype[alias] = STRING_DTYPE
+        return dtype
+
+    def iter_data(self, chunksize):
+        """Yield the input in row chunks with the same dtypes as read_data"""
+        if self.file_path.endswith('.csv'):
+            for chunk in self.read_csv(chunksize=chunksize):
+                yield chunk
+        elif self.file_path.endswith('.xlsx'):
+            xls = XlsxReader(self.file_path)
+            try:
+                for chunk in xls.iter_batches(xls.sheet_names[0], chunksize):
+                    if len(chunk):
+                        yield chunk
+            finally:
+                xls.close()
+        else:
+            # .xls has no streaming reader - load once and hand out slices
+            self.read_data()
+            data, self.data = self.data, None
+            for start in range(0, len(data), chunksize):
+                yield data.iloc[start:start + chunksize]
+
+    def read_and_transform(self):
+        """read_data() then transform(), each stage recorded when metrics are on"""
+        self.stages = metrics.stage_timer(self.SPEC.name if self.SPEC else type(self).__name__)
+        self.read_data()
+        self.stages.mark('read', None, len(self.data))
+        self.transform()
+        self.stages.finish()
+
+    def report_progress(self, stage, fraction):
+        if self.progress is not None:
+            self.progress(stage, fraction)
+
+    def transform(self):
+        """Clean self.data in place from the cleaner's SPEC (or an override)"""
+        if self.SPEC is None:
+            raise NotImplementedError
+        self.report_progress('cleaning', 0.5)
+        self.data = self.SPEC.build(self)
+        if self.compact and not self._stream_state.get('streaming'):
+            self.memory_report = self.compact_memory_report(self.data)
+
+    @staticmethod
+    def compact_memory_report(data):
+        """Print and return the memory saved per compact column against object strings"""
+        report = {}
+        for col in data.columns:
+            values = data[col]
+            if not isinstance(values.dtype, pd.CategoricalDtype) and values.dtype != STRING_DTYPE:
+                continue
+            before = int(values.astype(object).memory_usage(deep=True, index=False))
+            after = int(values.memory_usage(deep=True, index=False))
+            report[col] = {'dtype': str(values.dtype), 'object_bytes': before, 'bytes': after, 'saved': before - after}
+        total = sum(item['saved'] for item in report.values())
+        print(f"Compact dtypes saved {total / 2**20:.1f} MB")
+        for col, item in report.items():
+            print(f"  {col}: {item['object_bytes'] / 2**20:.1f} MB -> {item['bytes'] / 2**20:.1f} MB ({item['dtype']})")
+        return report
+
+    def record_matches(self, report):
+        """Keep the SKU match report, adding up the chunks when streaming"""
+        if not self._stream_state.get('streaming'):
+            self.match_report = report
+            print(f"SKU matching: {report['exact']} exact, {report['normalized']} normalized, "
+                  f"{report['suffix']} by '-1' suffix, {report['fuzzy']} fuzzy, {report['unmatched']} unmatched")
+            return
+        offset = self._stream_state.get('match_rows', 0)
+        kinds = ['exact', 'normalized', 'suffix', 'fuzzy', 'unmatched']
+        self._stream_state['match_rows'] = offset + sum(report[kind] for kind in kinds)
+        if self.match_report is None:
+            self.match_report = dict({kind: 0 for kind in kinds}, matches=[])
+        for kind in kinds:
+            self.match_report[kind] += report[kind]
+        for match in report['matches']:
+            self.match_report['matches'].append(dict(match, rows=[row + offset for row in match['rows']]))
+
+    def iter_clean(self, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Streaming mode - run transform() on fixed-size row chunks and yield
+        each cleaned chunk, so peak memory depends on chunksize, not file size
+        """
+        self._stream_state = {'streaming': True}
+        self.match_report = None
+        self.stages = metrics.stage_timer(self.SPEC.name if self.SPEC else type(self).__name__)
+        try:
+            for chunk in self.iter_data(chunksize):
+                self.data = chunk
+                self.transform()
+                yield self.data
+            self.stages.finish()
+        finally:
+            self.data = None
+            self._stream_state = {}
+
+    def clean_to_file(self, output_file, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Clean in streaming mode and write output_file as CSV.
+
+        to_csv decides some formats from the whole column (date-only Date,
+        1 vs 1.0), so cleaned chunks are spilled to disk first and written out
+        once those choices are known - the result matches clean() + save_data().
+        """
+        rows = 0
+        float_columns, time_columns = set(), set()
+        try:
+            with tempfile.TemporaryDirectory() as spill_dir:
+                spills = []
+                for chunk in self.iter_clean(chunksize):
+                    float_columns.update(self._stream_state.get('float_columns', ()))
+                    for col in chunk.columns:
+                        values = chunk[col]
+                        if values.dtype.kind == 'f' or (
+                                values.dtype == object and
+                                pd.api.types.infer_dtype(values[values != ''], skipna=True) == 'floating'):
+                            float_columns.add(col)
+                        elif values.dtype.kind == 'M' and self.has_time(values):
+                            time_columns.add(col)
+                    spills.append(os.path.join(spill_dir, f'chunk_{len(spills)}.pkl'))
+                    chunk.to_pickle(spills[-1])
+
+                with open(output_file, 'w', newline='', encoding='utf-8') as f:
+                    for i, path in enumerate(spills):
+                        chunk = pd.read_pickle(path)
+                        for col in chunk.columns:
+                            if col in float_columns and chunk[col].dtype.kind in 'iu':
+                                chunk[col] = chunk[col].astype(float)
+                            elif col in time_columns and chunk[col].dtype.kind == 'M' and not self.has_time(chunk[col]):
+                                chunk[col] = chunk[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+                        chunk.to_csv(f, index=False, header=(i == 0))
+                        rows += len(chunk)
+            print(f"Streamed {rows} rows to {output_file}")
+            return rows
+        except Exception as e:
+            print(f"Error Streaming File: {e}")
+            raise e
+
+    @staticmethod
+    def has_time(values):
+        """True if any timestamp is not at midnight (to_csv then prints the time for the whole column)"""
+        values = values.dropna()
+        return bool((values != values.dt.normalize()).any())
+
+    def save_data(self, output_file, format=None, compression=None):
+        """Save as CSV, or Parquet / Feather (typed, see typed_frame) by format or extension"""
         try:
-            self.data.to_csv(output_file, index=False)
+            write_frame(self.data, output_file, format or export_format(output_file), compression)
             print(f"Data Saved to {output_file}")
         except Exception as e:
             print(f"Error Saving File: {e}")
 
     def convert_date(self, column_name):
         try:
-            self.data[column_name] = pd.to_datetime(self.data[column_name], errors='coerce')
+            self.data[column_name] = self.parse_date(self.data[column_name])
         except Exception as e:
             print(f"Error Converting Date: {e}")
 
+    def parse_date(self, values):
+        """
+        pandas guesses the date format from the first non-null value of the
+        whole column. While streaming, every chunk is parsed led by the first
+        chunk's first date (dropped again after), so it gets the same guess.
+        """
+        if not self._stream_state.get('streaming'):
+            return pd.to_datetime(values, errors='coerce')
+        arr = np.asarray(values, dtype=object)
+        first = self._stream_state.get('date_first')
+        if first is None:
+            first = self._stream_state['date_first'] = first_dated(arr)
+        if first is None:
+            parsed = pd.to_datetime(arr, errors='coerce')
+        else:
+            parsed = pd.to_datetime(np.concatenate([[first], arr]), errors='coerce')[1:]
+        return pd.Series(parsed, index=values.index, name=values.name)
+
     def convert_date1(self, column_name):
         try:
             # Handle mixed date formats
-            self.data[column_name] = self.data[column_name].apply(
-                lambda x: parser.parse(str(x), dayfirst=True, fuzzy=True) if pd.notnull(x) and str(x).strip() else pd.NaT
-            )
+            self.data[column_name], stats = date_normalizer.parse(self.data[column_name])
+            print(f"Date Parsing ({column_name}): {stats}")
         except Exception as e:
             print(f"Error Converting Date: {e}")
 
 # Noon cleaner - FIXED column order
 class NoonCleaner(BaseCleaner):
-    def clean(self):
-        try:
-            self.read_data()
-            
-            # Convert all columns to string first
-            self.data = self.data.astype(str)
-            
-            # Check if required columns exist
-            required_columns = ['order_timestamp', 'item_nr', 'sku', 'status', 'id_partner', 
-                              'country_code', 'partner_sku', 'fulfillment_model', 'offer_price']
-            
-            # Find which columns actually exist
-            existing_columns = [col for col in required_columns if col in self.data.columns]
-            missing_columns = [col for col in required_columns if col not in self.data.columns]
-            
-            if missing_columns:
-                print(f"Warning: Missing columns in Noon data: {missing_columns}")
-                print(f"Available columns: {list(self.data.columns)}")
-            
-            # Keep only existing required columns
-            self.data = self.data[existing_columns]
-
-            # Rename columns
-            rename_map = {
-                'order_timestamp': 'Date',
-                'item_nr': 'Order Number',
-                'sku': 'SKU',
-                'status': 'Status',
-                'id_partner': 'Partner Id',
-                'country_code': 'Country',
-                'partner_sku': 'Partner SKU',
-                'fulfillment_model': 'Fullfilment',
-                'offer_price': 'Sales_Price'
-            }
-            
-            # Apply rename only for existing columns
-            actual_rename = {k: v for k, v in rename_map.items() if k in self.data.columns}
-            self.data = self.data.rename(columns=actual_rename)
-
-            # Column 0 ------> Date
-            if 'Date' in self.data.columns:
-                self.convert_date('Date')
-
-            # Column 1 ------> Month
-            if 'Date' in self.data.columns:
-                self.data.insert(1, 'Month', self.data['Date'].dt.strftime('%B'))
-            else:
-                self.data.insert(1, 'Month', '')
-
-            # Column 2 ------> Month Number
+    NUB_PARTNERS = {
+        '46272': 'Nub-Partner 46272',
+        '181587': 'Nub-Partner 181587',
+        '47461': 'Nub-Partner 47461',
+        '74949': 'Nub-Partner 74949'
+    }
 
-            if 'Date' in self.data.columns:
-                self.data.insert(2, 'Month Number', self.data['Date'].dt.month.astype('Int64'))
-            else:
-                self.data.insert(2, 'Month Number', '')
-
-            # Column 3 ------> Year
-            if 'Date' in self.data.columns:
-                self.data.insert(3, 'Year', self.data['Date'].dt.year.astype('Int64'))
-            else:
-                self.data.insert(3, 'Year', '')
+    SPEC = CleanerSpec(
+        name='Noon',
+        sources={
+            'Date': ['order_timestamp'],
+            'Order Number': ['item_nr'],
+            'SKU': ['sku'],
+            'Status': ['status'],
+            'Partner Id': ['id_partner'],
+            'Country': ['country_code'],
+            'Partner SKU': ['partner_sku'],
+            'Fullfilment': ['fulfillment_model'],
+            'Sales_Price': ['offer_price']
+        },
+        as_str=True,
+        defaults={'QTY': 1},
+        date={'month_number_dtype': 'Int64'},
+        constants={'Brand Name': '', 'Category': '', 'Sub-Category': '', 'Channel': 'Noon', 'Channel Item Name': ''},
+        lookups={'Nub Partner': ('Partner Id', NUB_PARTNERS, 'Null')},
+        numeric={'Sales_Price': 0},
+        gmv=('Sales_Price', 'QTY'),
+        status_filter=['Unshipped', 'Pending','Undelivered','Confirmed','Created','Exported','Fulfilling','Could Not Be Delivered','Processing'],
+        value_maps={
+            'Country': {'SA':'Saudi', 'AE':'UAE'},
+            'Status': {'Shipped':'Delivered','CIR':'Cancelled'},
+            'Fullfilment': {'Fulfilled by Noon (FBN)':'FBN', 'Fulfilled by Partner (FBP)':'FBP'}
+        },
+        enrich={
+            'master_keys': ['SKU'],
+            'fill': {'Brand Name': 'Brand', 'Category': 'Category', 'Sub-Category': 'Sub-Category',
+                     'Channel Item Name': 'Product Titles'}
+        },
+        # Set GMV = 0 for cancelled orders
+        cancelled={'GMV': 0},
+        output=['Date', 'Month', 'Month Number', 'Year', 'Order Number', 'SKU',
+                'Status', 'Partner Id', 'Nub Partner', 'Country', 'Brand Name',
+                'Category', 'Sub-Category', 'Channel', 'Channel Item Name',
+                'Partner SKU', 'Fullfilment', 'Sales_Price', 'QTY', 'GMV']
+    )
 
-            # Column 8 ------> Nub Partner
-            if 'Partner Id' in self.data.columns:
-                self.data.insert(8, 'Nub Partner', self.data['Partner Id'].apply(self.get_nub_partner))
-            else:
-                self.data.insert(8, 'Nub Partner', '')
-
-            # ✅ FIX: Brand, Category, Sub-Category को सही position में insert करें
-            # Current columns after insertions: 
-            # 0: Date, 1: Month, 2: Month Number, 3: Year, 4: Order Number, 
-            # 5: SKU, 6: Status, 7: Partner Id, 8: Nub Partner, 9: Country
-            
-            # Column 10 -----> Brand Name (Partner Id के बाद)
-            self.data.insert(10, 'Brand Name', "")
-            
-            # Column 11 -----> Category
-            self.data.insert(11, 'Category', "")
-            
-            # Column 12 -----> Sub-Category
-            self.data.insert(12, 'Sub-Category', "")
-            
-            # Column 13 -----> Channel
-            self.data.insert(13, 'Channel', 'Noon')
-            
-            # Column 14 -----> Channel Item Name
-            self.data.insert(14, 'Channel Item Name', "")
-            
-            # Add remaining columns if they exist
-            col_index = 15
-            if 'Partner SKU' in self.data.columns:
-                # Move to correct position if needed
-                if 'Partner SKU' not in [self.data.columns[col_index]]:
-                    partner_sku_col = self.data.pop('Partner SKU')
-                    self.data.insert(col_index, 'Partner SKU', partner_sku_col)
-                col_index += 1
-            
-            if 'Fullfilment' in self.data.columns:
-                if 'Fullfilment' not in [self.data.columns[col_index]]:
-                    fulfillment_col = self.data.pop('Fullfilment')
-                    self.data.insert(col_index, 'Fullfilment', fulfillment_col)
-                col_index += 1
-            
-            if 'Sales_Price' in self.data.columns:
-                if 'Sales_Price' not in [self.data.columns[col_index]]:
-                    price_col = self.data.pop('Sales_Price')
-                    self.data.insert(col_index, 'Sales_Price', price_col)
-                col_index += 1
-            
-            # Add QTY and GMV at the end
-            self.data['QTY'] = 1
-            
-            if 'Sales_Price' in self.data.columns:
-                try:
-                    self.data['Sales_Price'] = pd.to_numeric(self.data['Sales_Price'], errors='coerce').fillna(0)
-                    self.data['GMV'] = self.data['Sales_Price'] * self.data['QTY']
-                except:
-                    self.data['GMV'] = 0
-            else:
-                self.data['GMV'] = 0
-
-            # Filter irrelevant statuses if column exists
-            if 'Status' in self.data.columns:
-                irrelevant_statuses = ['Unshipped', 'Pending','Undelivered','Confirmed','Created','Exported','Fulfilling','Could Not Be Delivered','Processing']
-                self.data = self.data[~self.data['Status'].isin(irrelevant_statuses)]
-
-            # Replace values if columns exist
-            if 'Country' in self.data.columns:
-                self.data['Country'] = self.data['Country'].replace({'SA':'Saudi', 'AE':'UAE'})
-            
-            if 'Status' in self.data.columns:
-                self.data['Status'] = self.data['Status'].replace({'Shipped':'Delivered','CIR':'Cancelled'})
-            
-            if 'Fullfilment' in self.data.columns:
-                self.data['Fullfilment'] = self.data['Fullfilment'].replace({
-                    'Fulfilled by Noon (FBN)':'FBN', 'Fulfilled by Partner (FBP)':'FBP'})
-
-            # Fill blanks from master CSV if available
-            if not self.master_df.empty and 'SKU' in self.data.columns:
-                # Clean SKU
-                self.data['SKU'] = self.data['SKU'].astype(str).str.strip()
-                
-                # Convert blanks to NaN
-                cols_to_fill = ['Brand Name', 'Category', 'Sub-Category', 'Channel Item Name']
-                for col in cols_to_fill:
-                    if col in self.data.columns:
-                        self.data[col] = self.data[col].replace(r'^\s*$', np.nan, regex=True)
-                
-                # Merge with master data
-                if 'SKU' in self.master_df.columns:
-                    master_subset = self.master_df[['SKU', 'Brand', 'Category', 'Sub-Category', 'Product Titles']].copy()
-                    master_subset.columns = ['SKU', 'Brand_master', 'Category_master', 'Sub-Category_master', 'Product_Titles_master']
-                    
-                    self.data = self.data.merge(
-                        master_subset,
-                        on='SKU',
-                        how='left'
-                    )
-                    
-                    # Fill empty values from master
-                    if 'Brand Name' in self.data.columns and 'Brand_master' in self.data.columns:
-                        self.data['Brand Name'] = self.data['Brand Name'].fillna(self.data['Brand_master'])
-                    
-                    if 'Category' in self.data.columns and 'Category_master' in self.data.columns:
-                        self.data['Category'] = self.data['Category'].fillna(self.data['Category_master'])
-                    
-                    if 'Sub-Category' in self.data.columns and 'Sub-Category_master' in self.data.columns:
-                        self.data['Sub-Category'] = self.data['Sub-Category'].fillna(self.data['Sub-Category_master'])
-                    
-                    if 'Channel Item Name' in self.data.columns and 'Product_Titles_master' in self.data.columns:
-                        self.data['Channel Item Name'] = self.data['Channel Item Name'].fillna(self.data['Product_Titles_master'])
-                    
-                    # Drop helper columns
-                    columns_to_drop = ['Brand_master', 'Category_master', 'Sub-Category_master', 'Product_Titles_master']
-                    for col in columns_to_drop:
-                        if col in self.data.columns:
-                            self.data = self.data.drop(columns=[col])
-
-            # Set GMV = 0 for cancelled orders
-            if 'Status' in self.data.columns and 'GMV' in self.data.columns:
-                self.data.loc[self.data['Status'].str.strip().str.upper() == 'CANCELLED', 'GMV'] = 0
-
-            # Fill NaN values with empty string
-            self.data = self.data.fillna('')
-            
-            # Ensure correct column order
-            expected_columns = ['Date', 'Month', 'Month Number', 'Year', 'Order Number', 'SKU', 
-                              'Status', 'Partner Id', 'Nub Partner', 'Country', 'Brand Name',
-                              'Category', 'Sub-Category', 'Channel', 'Channel Item Name',
-                              'Partner SKU', 'Fullfilment', 'Sales_Price', 'QTY', 'GMV']
-            
-            # Add any missing columns
-            for col in expected_columns:
-                if col not in self.data.columns:
-                    self.data[col] = ''
-            
-            # Reorder columns
-            self.data = self.data[expected_columns]
-            
+    def clean(self):
+        try:
+            self.read_and_transform()
             print(f"Noon Cleaned Data Shape: {self.data.shape}")
             print(f"Noon Columns: {list(self.data.columns)}")
 
@@ -271,74 +1083,112 @@ class NoonCleaner(BaseCleaner):
             raise e
 
     def get_nub_partner(self, pid):
-        pid_str = str(pid).strip()
-        if pid_str in ['46272', '46272']:
-            return 'Nub-Partner 46272'
-        elif pid_str in ['181587', '181587']:
-            return 'Nub-Partner 181587'
-        elif pid_str in ['47461', '47461']:
-            return 'Nub-Partner 47461'
-        elif pid_str in ['74949', '74949']:
-            return 'Nub-Partner 74949'
-        else:
-            return 'Null'
+        return self.NUB_PARTNERS.get(str(pid).strip(), 'Null')
 
 # Amazon Cleaner - FIXED error handling
 class AmazonCleaner(BaseCleaner):
-    def __init__(self, file_path):
-        super().__init__(file_path)
+    NUB_PARTNERS = {
+        'Wishcare': 'Nub-Partner Wishcare',
+        '100 MPH': 'Nub-Partner 100 MPH',
+        '100_Miles': 'Nub-Partner 100_Miles'
+    }
+    # Renamed to Partner ID by tag_partner_id
+    EXTRA_COLUMNS = ['Partner', 'partner_id']
+    # Processes parsing a multi-sheet workbook (None = one per CPU)
+    SHEET_WORKERS = None
+
+    SPEC = CleanerSpec(
+        name='Amazon',
+        # Amazon columns with their header variations
+        sources={
+            'Date': ['purchase-date', 'purchase_date', 'purchasedate', 'Purchase Date'],
+            'Order Number': ['amazon-order-id', 'amazon_order_id', 'amazonorderid', 'Amazon Order ID'],
+            'SKU': ['sku', 'SKU', 'seller-sku', 'seller_sku'],
+            'Status': ['item-status', 'item_status', 'itemstatus', 'Item Status'],
+            'Partner ID': ['Partner ID'],
+            'Country': ['ship-country', 'ship_country', 'shipcountry', 'Ship Country'],
+            'Channel': ['sales-channel', 'sales_channel', 'saleschannel', 'Sales Channel'],
+            'Channel Item Name': ['product-name', 'product_name', 'productname', 'Product Name'],
+            'Partner SKU': ['asin', 'ASIN'],
+            'Fulfillment': ['fulfillment-channel', 'fulfillment_channel', 'fulfillmentchannel', 'Fulfillment Channel'],
+            'Sales price': ['item-price', 'item_price', 'itemprice', 'Item Price'],
+            'QTY': ['quantity', 'Quantity']
+        },
+        as_str=True,
+        defaults={'Channel': 'Amazon', 'Channel Item Name': '', 'Partner SKU': '', 'Fulfillment': '',
+                  'Sales price': 0, 'QTY': 1},
+        # Extract date only (remove time if present)
+        date={'date_only': True, 'blank_without_dates': True},
+        constants={'Brand Name': '', 'Category': '', 'Sub-Category': ''},
+        lookups={'Nub Partner': ('Partner ID', NUB_PARTNERS, 'Null')},
+        numeric={'Sales price': 0},
+        gmv=('Sales price', 'QTY'),
+        status_filter=['Unshipped', 'Pending', 'Undelivered', 'Confirmed', 'Created', 'Exported', 'Fulfilling'],
+        value_maps={
+            'Country': {
+                'SA': 'Saudi', 'AE': 'UAE', 'BH': 'Bahrain', 'KW': 'Kuwait', 'OM': 'Oman',
+                'sa': 'Saudi', 'ae': 'UAE', 'bh': 'Bahrain', 'kw': 'Kuwait', 'om': 'Oman'
+            },
+            'Channel': {
+                'Amazon.ae': 'Amazon', 'Amazon.sa': 'Amazon', 'Amazon.eg': 'Amazon',
+                'amazon.ae': 'Amazon', 'amazon.sa': 'Amazon'
+            },
+            'Status': {'Shipped': 'Delivered'},
+            'Fulfillment': {'Amazon': 'FBA', 'amazon': 'FBA', 'Amazon.com': 'FBA'}
+        },
+        # Match on SKU, or on Partner SKU when the master has no SKU column
+        enrich={
+            'master_keys': ['SKU', 'Partner SKU'],
+            'fill': {'Brand Name': 'Brand', 'Category': 'Category', 'Sub-Category': 'Sub-Category'}
+        },
+        # Set QTY = 1 for cancelled orders
+        cancelled={'QTY': 1},
+        output=['Date', 'Month', 'Month Number', 'Year', 'Order Number', 'SKU',
+                'Status', 'Partner ID', 'Nub Partner', 'Country', 'Brand Name',
+                'Category', 'Sub-Category', 'Channel', 'Channel Item Name',
+                'Partner SKU', 'Fulfillment', 'Sales price', 'QTY', 'GMV']
+    )
+
+    def __init__(self, file_path, compact=False, engine='c', master_path='product.csv', sku_match=None):
+        super().__init__(file_path, compact, engine, master_path, sku_match)
 
     def read_data(self):
         try:
             if self.file_path.endswith('.csv'):
                 # CSV file - read as string to avoid type issues
-                self.data = pd.read_csv(self.file_path, dtype=str)
-                # Try to detect if Partner ID column exists
-                if 'Partner ID' not in self.data.columns and 'Partner' in self.data.columns:
-                    self.data = self.data.rename(columns={'Partner': 'Partner ID'})
-                elif 'Partner ID' not in self.data.columns and 'partner_id' in self.data.columns:
-                    self.data = self.data.rename(columns={'partner_id': 'Partner ID'})
-                elif 'Partner ID' not in self.data.columns:
-                    self.data['Partner ID'] = 'Amazon'
+                self.data = self.tag_partner_id(self.read_csv())
                     
             elif self.file_path.endswith(('.xlsx', '.xls')):
                 # Excel file - handle multiple sheets
                 try:
-                    xls = pd.ExcelFile(self.file_path, engine='openpyxl')
-                    available_sheets = xls.sheet_names
-                    
-                    if len(available_sheets) > 1:
-                        # Multiple sheet case
-                        all_dfs = []
-                        for sheet in available_sheets:
-                            try:
-                                df = pd.read_excel(self.file_path, sheet_name=sheet, engine='openpyxl', dtype=str)
-                                df['Partner ID'] = sheet
-                                # Remove duplicate header rows if any
-                                if len(df) > 0 and df.iloc[0, 0] == df.columns[0]:
-                                    df = df.iloc[1:].reset_index(drop=True)
+                    # Open the workbook once, every sheet is streamed from it
+                    xls = XlsxReader(self.file_path)
+                    try:
+                        available_sheets = xls.sheet_names
+
+                        if len(available_sheets) > 1:
+                            # Multiple sheet case
+                            all_dfs = []
+                            for sheet, df in self.read_sheets(xls, available_sheets):
+                                if isinstance(df, Exception):
+                                    print(f"Warning: Error reading sheet {sheet}: {df}")
+                                    continue
                                 all_dfs.append(df)
-                            except Exception as sheet_error:
-                                print(f"Warning: Error reading sheet {sheet}: {sheet_error}")
-                                continue
-                        
-                        if all_dfs:
-                            self.data = pd.concat(all_dfs, ignore_index=True)
+
+                            if all_dfs:
+                                self.data = pd.concat(all_dfs, ignore_index=True)
+                            else:
+                                raise Exception("No valid sheets found in Excel file")
                         else:
-                            raise Exception("No valid sheets found in Excel file")
-                    else:
-                        # Single sheet case
-                        sheet = available_sheets[0]
-                        self.data = pd.read_excel(self.file_path, sheet_name=sheet, engine='openpyxl', dtype=str)
-                        self.data['Partner ID'] = sheet
-                        # Remove duplicate header rows
-                        if len(self.data) > 0 and self.data.iloc[0, 0] == self.data.columns[0]:
-                            self.data = self.data.iloc[1:].reset_index(drop=True)
+                            # Single sheet case
+                            self.data = self.read_sheet(xls, available_sheets[0])
+                    finally:
+                        xls.close()
                             
                 except Exception as excel_error:
                     print(f"Excel read error: {excel_error}")
                     # Try as CSV if Excel fails
-                    self.data = pd.read_csv(self.file_path, dtype=str)
+                    self.data = self.read_csv()
                     self.data['Partner ID'] = 'Amazon'
 
             print(f"Amazon Data Loaded: {self.data.shape}")
@@ -350,279 +1200,81 @@ class AmazonCleaner(BaseCleaner):
             traceback.print_exc()
             raise e
 
-    def clean(self):
+    def read_sheets(self, xls, sheets):
+        """
+        [(sheet, frame or the Exception it raised)] in sheet order. Sheets are
+        parsed on a process pool where each worker opens the workbook once;
+        with one worker (or one CPU) they are parsed here from the open xls.
+        """
+        workers = min(len(sheets), self.SHEET_WORKERS or os.cpu_count() or 1)
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_open_sheet_workbook,
+                                         initargs=(self.file_path,)) as executor:
+                    return list(zip(sheets, executor.map(_read_sheet_worker, sheets)))
+            except (BrokenProcessPool, OSError) as e:
+                print(f"Warning: Sheet worker pool failed, reading sheets in process: {e}")
+        results = []
+        for sheet in sheets:
+            try:
+                results.append((sheet, self.read_sheet(xls, sheet)))
+            except Exception as sheet_error:
+                results.append((sheet, sheet_error))
+        return results
+
+    @staticmethod
+    def read_sheet(xls, sheet):
+        """One sheet as strings, tagged with its Partner ID"""
+        df = xls.read_sheet(sheet)
+        df['Partner ID'] = sheet
+        # Remove duplicate header rows if any
+        if len(df) > 0 and df.iloc[0, 0] == df.columns[0]:
+            df = df.iloc[1:].reset_index(drop=True)
+        return df
+
+    def iter_sheet_batches(self, chunksize):
+        """Stream every sheet in row batches, tagged like read_sheet"""
+        xls = XlsxReader(self.file_path)
         try:
-            self.read_data()
-            
-            # Convert all to string first
-            self.data = self.data.astype(str)
-            
-            # Define required Amazon columns (with variations)
-            amazon_columns_variations = {
-                'purchase-date': ['purchase-date', 'purchase_date', 'purchasedate', 'Purchase Date'],
-                'amazon-order-id': ['amazon-order-id', 'amazon_order_id', 'amazonorderid', 'Amazon Order ID'],
-                'sku': ['sku', 'SKU', 'seller-sku', 'seller_sku'],
-                'item-status': ['item-status', 'item_status', 'itemstatus', 'Item Status'],
-                'ship-country': ['ship-country', 'ship_country', 'shipcountry', 'Ship Country'],
-                'sales-channel': ['sales-channel', 'sales_channel', 'saleschannel', 'Sales Channel'],
-                'product-name': ['product-name', 'product_name', 'productname', 'Product Name'],
-                'asin': ['asin', 'ASIN'],
-                'fulfillment-channel': ['fulfillment-channel', 'fulfillment_channel', 'fulfillmentchannel', 'Fulfillment Channel'],
-                'item-price': ['item-price', 'item_price', 'itemprice', 'Item Price'],
-                'quantity': ['quantity', 'Quantity']
-            }
-            
-            # Map variations to standard names
-            column_mapping = {}
-            for standard_name, variations in amazon_columns_variations.items():
-                for var in variations:
-                    if var in self.data.columns:
-                        column_mapping[var] = standard_name
-                        break
-            
-            # Rename columns to standard names
-            self.data = self.data.rename(columns=column_mapping)
-            
-            # Check which standard columns we have
-            standard_columns = list(amazon_columns_variations.keys()) + ['Partner ID']
-            existing_columns = [col for col in standard_columns if col in self.data.columns]
-            
-            print(f"Existing Amazon columns after mapping: {existing_columns}")
-            
-            # Keep only existing columns
-            self.data = self.data[existing_columns]
-            
-            # Rename to final column names
-            rename_map = {
-                'purchase-date': 'Date',
-                'amazon-order-id': 'Order Number',
-                'sku': 'SKU',
-                'item-status': 'Status',
-                'ship-country': 'Country',
-                'sales-channel': 'Channel',
-                'product-name': 'Channel Item Name',
-                'asin': 'Partner SKU',
-                'fulfillment-channel': 'Fulfillment',
-                'item-price': 'Sales price',
-                'quantity': 'QTY'
-            }
-            
-            # Apply rename only for existing columns
-            actual_rename = {k: v for k, v in rename_map.items() if k in self.data.columns}
-            self.data = self.data.rename(columns=actual_rename)
-            
-            print(f"After rename - Columns: {list(self.data.columns)}")
-
-            # Column 0 -------> Date
-            if 'Date' in self.data.columns:
-                try:
-                    self.convert_date('Date')
-                    # Extract date only (remove time if present)
-                    self.data['Date'] = pd.to_datetime(self.data['Date']).dt.date
-                    self.data['Date'] = pd.to_datetime(self.data['Date'])
-                except:
-                    self.data['Date'] = pd.NaT
-
-            # Add Sales price if missing or convert to numeric
-            if 'Sales price' in self.data.columns:
-                self.data['Sales price'] = pd.to_numeric(self.data['Sales price'], errors='coerce').fillna(0)
-            else:
-                self.data['Sales price'] = 0
+            offset = 0
+            for sheet in xls.sheet_names:
+                first = True
+                for df in xls.iter_batches(sheet, chunksize):
+                    df['Partner ID'] = sheet
+                    # Remove duplicate header rows if any (first row of the sheet)
+                    if first and len(df) > 0:
+                        first = False
+                        if df.iloc[0, 0] == df.columns[0]:
+                            df = df.iloc[1:]
+                    if len(df):
+                        df.index = pd.RangeIndex(offset, offset + len(df))
+                        offset += len(df)
+                        yield df
+        finally:
+            xls.close()
 
-            # Add date-related columns
-            if 'Date' in self.data.columns and pd.notna(self.data['Date']).any():
-                self.data.insert(1, 'Month', self.data['Date'].dt.strftime('%B'))
-                self.data.insert(2, 'Month Number', self.data['Date'].dt.month)
-                self.data.insert(3, 'Year', self.data['Date'].dt.year)
-            else:
-                self.data.insert(1, 'Month', '')
-                self.data.insert(2, 'Month Number', '')
-                self.data.insert(3, 'Year', '')
+    def tag_partner_id(self, df):
+        """Try to detect if Partner ID column exists, default to 'Amazon'"""
+        if 'Partner ID' not in df.columns and 'Partner' in df.columns:
+            df = df.rename(columns={'Partner': 'Partner ID'})
+        elif 'Partner ID' not in df.columns and 'partner_id' in df.columns:
+            df = df.rename(columns={'partner_id': 'Partner ID'})
+        elif 'Partner ID' not in df.columns:
+            df['Partner ID'] = 'Amazon'
+        return df
 
-            # Add Nub Partner if Partner ID exists
-            if 'Partner ID' in self.data.columns:
-                self.data.insert(8, 'Nub Partner', self.data['Partner ID'].apply(self.get_nub_partner))
-            else:
-                self.data.insert(8, 'Nub Partner', '')
-
-            # ✅ FIX: Add Brand, Category, Sub-Category in correct positions
-            # Current columns: 0: Date, 1: Month, 2: Month Number, 3: Year, 
-            # 4: Order Number, 5: SKU, 6: Status, 7: Partner ID, 8: Nub Partner, 9: Country
-            
-            # Column 10 -----> Brand Name
-            self.data.insert(10, 'Brand Name', "")
-            
-            # Column 11 -----> Category
-            self.data.insert(11, 'Category', "")
-            
-            # Column 12 -----> Sub-Category
-            self.data.insert(12, 'Sub-Category', "")
-            
-            # Add remaining columns in correct order
-            col_index = 13
-            
-            # Channel
-            if 'Channel' in self.data.columns:
-                if 'Channel' not in [self.data.columns[col_index]]:
-                    channel_col = self.data.pop('Channel')
-                    self.data.insert(col_index, 'Channel', channel_col)
-                col_index += 1
-            else:
-                self.data.insert(col_index, 'Channel', 'Amazon')
-                col_index += 1
-            
-            # Channel Item Name
-            if 'Channel Item Name' in self.data.columns:
-                if 'Channel Item Name' not in [self.data.columns[col_index]]:
-                    item_name_col = self.data.pop('Channel Item Name')
-                    self.data.insert(col_index, 'Channel Item Name', item_name_col)
-                col_index += 1
-            else:
-                self.data.insert(col_index, 'Channel Item Name', "")
-                col_index += 1
-            
-            # Partner SKU
-            if 'Partner SKU' in self.data.columns:
-                if 'Partner SKU' not in [self.data.columns[col_index]]:
-                    partner_sku_col = self.data.pop('Partner SKU')
-                    self.data.insert(col_index, 'Partner SKU', partner_sku_col)
-                col_index += 1
-            else:
-                self.data.insert(col_index, 'Partner SKU', "")
-                col_index += 1
-            
-            # Fulfillment
-            if 'Fulfillment' in self.data.columns:
-                if 'Fulfillment' not in [self.data.columns[col_index]]:
-                    fulfillment_col = self.data.pop('Fulfillment')
-                    self.data.insert(col_index, 'Fulfillment', fulfillment_col)
-                col_index += 1
-            else:
-                self.data.insert(col_index, 'Fulfillment', "")
-                col_index += 1
-            
-            # Sales price
-            if 'Sales price' in self.data.columns:
-                if 'Sales price' not in [self.data.columns[col_index]]:
-                    price_col = self.data.pop('Sales price')
-                    self.data.insert(col_index, 'Sales price', price_col)
-                col_index += 1
-            
-            # QTY - ensure it exists
-            if 'QTY' not in self.data.columns:
-                self.data.insert(col_index, 'QTY', 1)
-            col_index += 1
-            
-            # GMV
-            self.data.insert(col_index, 'GMV', self.data['Sales price'] * pd.to_numeric(self.data['QTY'], errors='coerce').fillna(1))
-
-            # Filter irrelevant statuses
-            if 'Status' in self.data.columns:
-                irrelevant_statuses = ['Unshipped', 'Pending', 'Undelivered', 'Confirmed', 'Created', 'Exported', 'Fulfilling']
-                self.data = self.data[~self.data['Status'].isin(irrelevant_statuses)]
-
-            # Replace values
-            if 'Country' in self.data.columns:
-                self.data['Country'] = self.data['Country'].replace({
-                    'SA': 'Saudi', 'AE': 'UAE', 'BH': 'Bahrain', 'KW': 'Kuwait', 'OM': 'Oman',
-                    'sa': 'Saudi', 'ae': 'UAE', 'bh': 'Bahrain', 'kw': 'Kuwait', 'om': 'Oman'
-                })
-            
-            if 'Channel' in self.data.columns:
-                self.data['Channel'] = self.data['Channel'].replace({
-                    'Amazon.ae': 'Amazon', 'Amazon.sa': 'Amazon', 'Amazon.eg': 'Amazon',
-                    'amazon.ae': 'Amazon', 'amazon.sa': 'Amazon'
-                })
-            
-            if 'Status' in self.data.columns:
-                self.data['Status'] = self.data['Status'].replace({'Shipped': 'Delivered'})
-            
-            if 'Fulfillment' in self.data.columns:
-                self.data['Fulfillment'] = self.data['Fulfillment'].replace({
-                    'Amazon': 'FBA', 'amazon': 'FBA', 'Amazon.com': 'FBA'
-                })
-
-            # Fill from master data if available
-            if not self.master_df.empty and 'SKU' in self.data.columns:
-                # Clean SKU
-                self.data['SKU'] = self.data['SKU'].astype(str).str.strip()
-                
-                # Convert blanks to NaN
-                cols_to_fill = ['Brand Name', 'Category', 'Sub-Category']
-                for col in cols_to_fill:
-                    if col in self.data.columns:
-                        self.data[col] = self.data[col].replace(r'^\s*$', np.nan, regex=True)
-                
-                # Merge with master data (using SKU)
-                if 'SKU' in self.master_df.columns or 'Partner SKU' in self.master_df.columns:
-                    # Try SKU first
-                    if 'SKU' in self.master_df.columns:
-                        master_subset = self.master_df[['SKU', 'Brand', 'Category', 'Sub-Category']].copy()
-                        master_subset.columns = ['SKU', 'Brand_master', 'Category_master', 'Sub-Category_master']
-                        
-                        self.data = self.data.merge(
-                            master_subset,
-                            on='SKU',
-                            how='left'
-                        )
-                    
-                    # If no match, try Partner SKU
-                    elif 'Partner SKU' in self.master_df.columns and 'Partner SKU' in self.data.columns:
-                        master_subset = self.master_df[['Partner SKU', 'Brand', 'Category', 'Sub-Category']].copy()
-                        master_subset.columns = ['Partner SKU', 'Brand_master', 'Category_master', 'Sub-Category_master']
-                        
-                        self.data = self.data.merge(
-                            master_subset,
-                            left_on='SKU',
-                            right_on='Partner SKU',
-                            how='left'
-                        )
-                    
-                    # Fill empty values from master
-                    if 'Brand_master' in self.data.columns:
-                        self.data['Brand Name'] = self.data['Brand Name'].fillna(self.data['Brand_master'])
-                    
-                    if 'Category_master' in self.data.columns:
-                        self.data['Category'] = self.data['Category'].fillna(self.data['Category_master'])
-                    
-                    if 'Sub-Category_master' in self.data.columns:
-                        self.data['Sub-Category'] = self.data['Sub-Category'].fillna(self.data['Sub-Category_master'])
-                    
-                    # Drop helper columns
-                    columns_to_drop = ['Brand_master', 'Category_master', 'Sub-Category_master']
-                    if 'Partner SKU_y' in self.data.columns:
-                        columns_to_drop.append('Partner SKU_y')
-                    
-                    for col in columns_to_drop:
-                        if col in self.data.columns:
-                            self.data = self.data.drop(columns=[col])
-                    
-                    # Rename Partner SKU_x back if needed
-                    if 'Partner SKU_x' in self.data.columns:
-                        self.data = self.data.rename(columns={'Partner SKU_x': 'Partner SKU'})
-
-            # Set QTY = 1 for cancelled orders
-            if 'Status' in self.data.columns and 'QTY' in self.data.columns:
-                self.data.loc[
-                    self.data['Status'].astype(str).str.strip().str.upper() == 'CANCELLED', 'QTY'] = 1
-
-            # Fill NaN values with empty string
-            self.data = self.data.fillna('')
-            
-            # Ensure correct column order
-            expected_columns = ['Date', 'Month', 'Month Number', 'Year', 'Order Number', 'SKU', 
-                              'Status', 'Partner ID', 'Nub Partner', 'Country', 'Brand Name',
-                              'Category', 'Sub-Category', 'Channel', 'Channel Item Name',
-                              'Partner SKU', 'Fulfillment', 'Sales price', 'QTY', 'GMV']
-            
-            # Add any missing columns
-            for col in expected_columns:
-                if col not in self.data.columns:
-                    self.data[col] = ''
-            
-            # Reorder columns
-            self.data = self.data[expected_columns]
-            
+    def iter_data(self, chunksize):
+        if self.file_path.endswith('.csv'):
+            for chunk in self.read_csv(chunksize=chunksize):
+                yield self.tag_partner_id(chunk)
+        elif self.file_path.endswith('.xlsx'):
+            yield from self.iter_sheet_batches(chunksize)
+        else:
+            yield from super().iter_data(chunksize)
+
+    def clean(self):
+        try:
+            self.read_and_transform()
             print(f"Amazon Cleaned Data Shape: {self.data.shape}")
             print(f"Amazon Columns: {list(self.data.columns)}")
 
@@ -633,169 +1285,256 @@ class AmazonCleaner(BaseCleaner):
             raise e
 
     def get_nub_partner(self, pid):
-        pid_str = str(pid).strip()
-        if pid_str == 'Wishcare':
-            return 'Nub-Partner Wishcare'
-        elif pid_str == '100 MPH':
-            return 'Nub-Partner 100 MPH'
-        elif pid_str == '100_Miles':
-            return 'Nub-Partner 100_Miles'
-        else:
-            return 'Null'
+        return self.NUB_PARTNERS.get(str(pid).strip(), 'Null')
+
+# Workbook opened once per sheet worker process (AmazonCleaner.read_sheets)
+_sheet_workbook = None
+
+def _open_sheet_workbook(path):
+    global _sheet_workbook
+    _sheet_workbook = XlsxReader(path)
+
+def _read_sheet_worker(sheet):
+    try:
+        return AmazonCleaner.read_sheet(_sheet_workbook, sheet)
+    except Exception as e:
+        return e
 
 # Rest of the classes remain the same...
 # [RevibeCleaner, TalabatCleaner, CareemCleaner unchanged]
 
 # Revibe Cleaner - FIXED
 class RevibeCleaner(BaseCleaner):
+    SPEC = CleanerSpec(
+        name='Revibe',
+        sources={
+            'Date': ['Last Update Date'],
+            'Order Number': ['id'],
+            'SKU': ['SKU (Old: Order Status)'],
+            'Status': ['Shipment Status'],
+            'Partner Id': ['Supplier'],
+            'Country': ['Country'],
+            'Category': ['Category'],
+            'Sub-Category': ['Condition'],
+            'Model': ['Model'],
+            'Variation': ['Variation: Color, Storage, Condition'],
+            'Sales Price': ['Actual Cost']
+        },
+        defaults={'QTY': 1},
+        # Mixed date formats, day first
+        date={'parser': 'dateutil', 'date_only': True},
+        constants={'Brand Name': 'Apple', 'Channel': 'Revibe', 'Fulfillment': 'FBR'},
+        templates={
+            'Nub-Partner': 'Revibe {Partner Id!s}',
+            'Channel Item Name': '{Model} {Variation}',
+            'Partner SKU': '{SKU}'
+        },
+        gmv=('Sales Price', 'QTY'),
+        value_maps={
+            'Status': {
+                'Shipped': 'Delivered',
+                'At quality check': 'Delivered',
+                'Refused delivery': 'Delivered'
+            },
+            'Country': {'United Arab Emirates': 'UAE'}
+        },
+        output=['Date', 'Month', 'Month Number', 'Year', 'Order Number', 'SKU',
+                'Status', 'Partner Id', 'Nub-Partner', 'Country', 'Brand Name',
+                'Category', 'Sub-Category', 'Channel', 'Channel Item Name',
+                'Partner SKU', 'Fulfillment', 'Sales Price', 'QTY', 'GMV'],
+        fill_missing_output=False,
+        sort_by='Date'
+    )
+
     def clean(self):
         try:
-            self.read_data()
-            
-            # Check required columns
-            required_columns = ['Last Update Date', 'id', 'SKU (Old: Order Status)', 'Shipment Status',
-                               'Supplier', 'Country', 'Category', 'Condition', 'Model',
-                               'Variation: Color, Storage, Condition', 'Actual Cost']
-            
-            existing_columns = [col for col in required_columns if col in self.data.columns]
-            self.data = self.data[existing_columns]
-
-            # Rename columns
-            rename_map = {
-                'Last Update Date': 'Date',
-                'id': 'Order Number',
-                'SKU (Old: Order Status)': 'SKU',
-                'Shipment Status': 'Status',
-                'Supplier': 'Partner Id',
-                'Condition': 'Sub-Category',
-                'Actual Cost': 'Sales Price'
-            }
-            
-            actual_rename = {k: v for k, v in rename_map.items() if k in self.data.columns}
-            self.data = self.data.rename(columns=actual_rename)
-
-            # Convert date
-            if 'Date' in self.data.columns:
-                try:
-                    self.convert_date1('Date')
-                    self.data['Date'] = pd.to_datetime(self.data['Date'])
-                    self.data['Date'] = pd.to_datetime(self.data['Date'].dt.date)
-                except:
-                    self.data['Date'] = pd.NaT
-
-            # Add date columns
-            if 'Date' in self.data.columns:
-                self.data.insert(1, 'Month', self.data['Date'].dt.strftime('%B'))
-                self.data.insert(2, 'Month Number', self.data['Date'].dt.month)
-                self.data.insert(3, 'Year', self.data['Date'].dt.year)
-            else:
-                self.data.insert(1, 'Month', '')
-                self.data.insert(2, 'Month Number', '')
-                self.data.insert(3, 'Year', '')
-
-            # Add Nub Partner
-            if 'Partner Id' in self.data.columns:
-                self.data.insert(8, 'Nub-Partner', 'Revibe ' + self.data['Partner Id'].astype(str))
-            else:
-                self.data.insert(8, 'Nub-Partner', '')
-            
-            # Add Brand Name
-            self.data.insert(10, 'Brand Name', 'Apple')
-            
-            # Add Channel
-            self.data.insert(13, 'Channel', 'Revibe')
-            
-            # Add Channel Item Name
-            if 'Model' in self.data.columns and 'Variation: Color, Storage, Condition' in self.data.columns:
-                self.data.insert(14, 'Channel Item Name', 
-                               self.data['Model'] + ' ' + self.data['Variation: Color, Storage, Condition'])
-            else:
-                self.data.insert(14, 'Channel Item Name', '')
-            
-            # Add Partner SKU
-            if 'SKU' in self.data.columns:
-                self.data.insert(15, 'Partner SKU', self.data['SKU'])
-            else:
-                self.data.insert(15, 'Partner SKU', '')
-            
-            # Add Fulfillment
-            self.data.insert(16, 'Fulfillment', 'FBR')
-            
-            # Add QTY and GMV
-            self.data.insert(20, 'QTY', 1)
-            
-            if 'Sales Price' in self.data.columns:
-                self.data.insert(21, 'GMV', self.data['Sales Price'] * self.data['QTY'])
-            else:
-                self.data.insert(21, 'GMV', 0)
-
-            # Drop unnecessary columns
-            columns_to_drop = ['Model', 'Variation: Color, Storage, Condition']
-            for col in columns_to_drop:
-                if col in self.data.columns:
-                    self.data = self.data.drop(columns=[col])
-
-            # Standardize values
-            if 'Status' in self.data.columns:
-                self.data['Status'] = self.data['Status'].replace({
-                    'Shipped': 'Delivered',
-                    'At quality check': 'Delivered',
-                    'Refused delivery': 'Delivered'
-                })
-            
-            if 'Country' in self.data.columns:
-                self.data['Country'] = self.data['Country'].replace({'United Arab Emirates': 'UAE'})
-
-            # Sort by Date if available
-            if 'Date' in self.data.columns:
-                self.data = self.data.sort_values(by='Date', ascending=True)
-
-            # Fill NaN values
-            self.data = self.data.fillna('')
-            
+            self.read_and_transform()
             print(f"Revibe Cleaned Data Shape: {self.data.shape}")
-            
+
         except Exception as e:
             print(f"Error Cleaning Revibe Data: {e}")
             raise e
 
+    def iter_clean(self, chunksize=BaseCleaner.DEFAULT_CHUNKSIZE):
+        """
+        Revibe output is sorted by Date across the whole file, so it cannot be
+        cleaned chunk by chunk - clean in memory and yield chunk-sized slices
+        """
+        self.clean()
+        data, self.data = self.data, None
+        for start in range(0, max(len(data), 1), chunksize):
+            yield data.iloc[start:start + chunksize]
+
 class TalabatCleaner(BaseCleaner):
     def clean(self):
         try:
             self.read_data()
             print("Talabat cleaning not implemented yet.")
-            # Create basic structure
-            self.data['Channel'] = 'Talabat'
-            self.data['QTY'] = 1
-            self.data['GMV'] = 0
+            self.transform()
         except Exception as e:
             print(f"Error Cleaning Talabat Data: {e}")
 
+    def transform(self):
+        # Create basic structure
+        self.data['Channel'] = 'Talabat'
+        self.data['QTY'] = 1
+        self.data['GMV'] = 0
+
 class CareemCleaner(BaseCleaner):
     def clean(self):
         try:
             self.read_data()
             print("Careem cleaning not implemented yet.")
-            # Create basic structure
-            self.data['Channel'] = 'Careem'
-            self.data['QTY'] = 1
-            self.data['GMV'] = 0
+            self.transform()
         except Exception as e:
             print(f"Error Cleaning Careem Data: {e}")
 
-# Example Usage
+    def transform(self):
+        # Create basic structure
+        self.data['Channel'] = 'Careem'
+        self.data['QTY'] = 1
+        self.data['GMV'] = 0
+
+# Marketplace name -> cleaner
+CLEANERS = {
+    'Noon': NoonCleaner,
+    'Amazon': AmazonCleaner,
+    'Revibe': RevibeCleaner,
+    'Talabat': TalabatCleaner,
+    'Careem': CareemCleaner
+}
+
+def read_header(file_path):
+    """Column names of a CSV or of the first sheet of a workbook"""
+    if file_path.lower().endswith('.csv'):
+        return list(pd.read_csv(file_path, nrows=0).columns)
+    if file_path.lower().endswith('.xlsx'):
+        xls = XlsxReader(file_path)
+        try:
+            worksheet = xls.book[xls.sheet_names[0]]
+            row = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            xls.close()
+        return [str(value) for value in row if value is not None]
+    return list(pd.read_excel(file_path, nrows=0).columns)
+
+def detect_marketplace(file_path):
+    """
+    Marketplace of an export from its columns - the cleaner whose SPEC finds
+    most of its source columns, at least half of them - else from a
+    marketplace name in the file name. None when neither tells.
+    """
+    try:
+        columns = set(read_header(file_path))
+    except Exception as e:
+        print(f"Warning: Could not read the header of {file_path}: {e}")
+        columns = set()
+    scores = {}
+    for marketplace, cleaner_class in CLEANERS.items():
+        if cleaner_class.SPEC is not None:
+            sources = cleaner_class.SPEC.sources
+            scores[marketplace] = len(cleaner_class.SPEC.resolve_sources(columns)) / len(sources)
+    best = max(scores, key=scores.get)
+    if scores[best] >= 0.5 and list(scores.values()).count(scores[best]) == 1:
+        return best
+    name = os.path.basename(file_path).lower()
+    named = [marketplace for marketplace in CLEANERS if marketplace.lower() in name]
+    return named[0] if len(named) == 1 else None
+
+def clean_file(cleaner_class, file_path, compact=False, engine='c', sheet_workers=None, progress=None,
+               master_path='product.csv', sku_match=None):
+    """
+    Clean one file start to finish -> (cleaned frame, memory report, seconds,
+    SKU match report). Module level so a process pool can run it (see
+    /api/clean/batch and job_queue).
+    """
+    start = time.perf_counter()
+    cleaner = cleaner_class(file_path, compact=compact, engine=engine, master_path=master_path, sku_match=sku_match)
+    cleaner.progress = progress
+    if sheet_workers is not None:
+        cleaner.SHEET_WORKERS = sheet_workers
+    cleaner.clean()
+    if cleaner.data is None:
+        raise ValueError(f"{cleaner_class.__name__} returned no data")
+    return cleaner.data, cleaner.memory_report, time.perf_counter() - start, cleaner.match_report
+
+def combine_cleaned(frames):
+    """One frame from several cleaned ones, '' where a marketplace lacks a column"""
+    combined = pd.concat(frames, ignore_index=True)
+    for col in combined.columns:
+        values = combined[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) and values.isna().any() and '' not in values.cat.categories:
+            combined[col] = values.cat.add_categories('')
+    return combined.fillna('')
+
+def export_format(path):
+    """Export format for a file name, CSV when the extension is not known"""
+    ext = os.path.splitext(str(path))[1].lower()
+    for name, spec in EXPORT_FORMATS.items():
+        if ext in spec['extensions']:
+            return name
+    return 'csv'
+
+def typed_frame(data):
+    """
+    A cleaned frame with the types that fillna('') hid, for typed exports:
+    '' is null again, object columns of numbers become Int64 (whole numbers
+    only) or float64, and columns of timestamps become datetime64. Text and
+    mixed text stays as strings, except that NUMERIC_EXPORT_COLUMNS whose
+    text is all numbers become numbers too.
+    """
+    typed = data.reset_index(drop=True)
+    for col in typed.columns:
+        values = typed[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            if '' in values.cat.categories:
+                typed[col] = values.cat.remove_categories([''])
+            continue
+        if values.dtype != object:
+            continue
+
+        values = values.where(values.ne(''))
+        kinds = set(map(type, values.dropna()))
+        if not kinds or (kinds == {str} and col not in NUMERIC_EXPORT_COLUMNS):
+            typed[col] = values
+        elif all(issubclass(kind, datetime) for kind in kinds):
+            typed[col] = pd.to_datetime(values)
+        else:
+            try:
+                # 'nan' is what astype(str) made of a missing number
+                numeric = pd.to_numeric(values.mask(values.eq('nan')))
+            except (ValueError, TypeError):
+                typed[col] = values.map(str, na_action='ignore')
+                continue
+            whole = float not in kinds and (numeric.dropna() % 1 == 0).all()
+            typed[col] = numeric.astype('Int64') if whole else numeric.astype('float64')
+    return typed
+
+def write_frame(data, target, format='csv', compression=None):
+    """
+    Write a cleaned frame to a path or binary buffer. CSV is written as is,
+    Parquet and Feather get typed_frame(data) so Date, Int64 and float
+    columns survive the round trip.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}', use one of {list(EXPORT_FORMATS)}")
+    compressions = EXPORT_FORMATS[format]['compressions']
+    compression = compression or compressions[0]
+    if compression not in compressions:
+        raise ValueError(f"Unknown {format} compression '{compression}', use one of {compressions}")
+
+    if format == 'csv':
+        data.to_csv(target, index=False)
+        return
+    if pa_csv is None:
+        raise ValueError(f"{format} export needs pyarrow")
+    if format == 'parquet':
+        typed_frame(data).to_parquet(target, engine='pyarrow', index=False,
+                                     compression=None if compression == 'none' else compression)
+    else:
+        typed_frame(data).to_feather(target, compression=compression)
+
+# Command line batch cleaning lives in clean_files.py
 if __name__ == "__main__":
-    # Test Noon
-    noon = NoonCleaner("Noon_Sales_Data.csv")
-    noon.clean()
-    noon.save_data("Clean_Noon_Data.csv")
-    
-    # Test Amazon
-    amazon = AmazonCleaner("Amazon_Sales_Data.xlsx")
-    amazon.clean()
-    amazon.save_data("Clean_Amazon_Data.csv")
-    
-    # Test Revibe
-    revibe = RevibeCleaner("Revibe_Sales_Data.csv")
-    revibe.clean()
-    revibe.save_data("Clean_Revibe_Data.csv")
\ No newline at end of file
+    from clean_files import main
+    main()